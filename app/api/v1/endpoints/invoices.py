@@ -1,16 +1,32 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
 import shutil
+import hashlib
+import asyncio
+import json
+import math
+import tempfile
+import time
+import zipfile
+from datetime import date
 from pathlib import Path
 import logging
-from typing import List
+from typing import IO, Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 import uuid
 
+import aiofiles
+
 from app.core.config import settings
-from app.schemas.invoice import InvoiceResponse, ProcessingStatus
-from app.services.pdf_processor import PDFProcessor
-from app.services.ai_extractor import AIExtractor
+from app.core.metrics import stage, ERRORS, COALESCED_REQUESTS, TIME_TO_FIRST_FIELD_SECONDS
+from app.database.repository import invoice_repository, InvalidCursorError
+from app.schemas.invoice import InvoiceResponse, ProcessingStatus, JobStatus, InvoiceListResponse
+from app.services.ai_extractor import completion_stats
+from app.services.backend_router import backend_router
+from app.services.invoice_pipeline import process_document, stream_document, DocumentError
+from app.services.job_queue import job_queue, job_watcher, JobState
+from app.services.llm_scheduler import LLMRateLimitError, Priority
+from app.services.result_cache import result_cache
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +37,78 @@ router = APIRouter()
 # Crear directorio de uploads si no existe
 Path(settings.UPLOAD_DIR).mkdir(exist_ok=True)
 
+# Tamaño de bloque para leer uploads grandes sin cargarlos completos en memoria
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def _read_upload(file: UploadFile) -> Tuple[str, Union[bytes, str]]:
+    """
+    Lee el upload y devuelve (clave de caché, fuente para el pool).
+    
+    Los PDFs hasta UPLOAD_SPILL_THRESHOLD se pasan como bytes en memoria; los
+    mayores se copian por bloques a UPLOAD_DIR y se pasa su ruta.
+    """
+    if (file.size or 0) <= settings.UPLOAD_SPILL_THRESHOLD:
+        content = await file.read()
+        return result_cache.make_key(content), content
+    
+    file_path = Path(settings.UPLOAD_DIR) / f"{uuid.uuid4()}.pdf"
+    digest = hashlib.sha256()
+    logger.info(f"Volcando archivo grande a disco: {file.filename}")
+    async with aiofiles.open(file_path, 'wb') as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            await f.write(chunk)
+    return result_cache.key_for_digest(digest.hexdigest()), str(file_path)
+
+def _release_source(source: Union[bytes, str]):
+    """
+    Elimina el archivo volcado a disco, si lo hay
+    """
+    if isinstance(source, bytes):
+        return
+    try:
+        Path(source).unlink(missing_ok=True)
+        logger.info(f"Archivo temporal eliminado: {source}")
+    except Exception as e:
+        logger.warning(f"No se pudo eliminar archivo temporal: {str(e)}")
+
+@router.get("", response_model=InvoiceListResponse)
+async def list_invoices(
+    supplier_tax_id: Optional[str] = Query(None, description="NIT del proveedor"),
+    issue_date_from: Optional[date] = Query(None, description="Fecha de emisión desde (YYYY-MM-DD)"),
+    issue_date_to: Optional[date] = Query(None, description="Fecha de emisión hasta (YYYY-MM-DD)"),
+    number: Optional[str] = Query(None),
+    series: Optional[str] = Query(None),
+    currency: Optional[str] = Query(None),
+    total_min: Optional[float] = Query(None, ge=0),
+    total_max: Optional[float] = Query(None, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="Valor next_cursor de la página anterior")
+):
+    """
+    Busca facturas guardadas, de la más reciente a la más antigua, con
+    paginación por cursor
+    """
+    try:
+        items, next_cursor = await invoice_repository.search(
+            supplier_tax_id=supplier_tax_id,
+            issue_date_from=issue_date_from,
+            issue_date_to=issue_date_to,
+            number=number,
+            series=series,
+            currency=currency,
+            total_min=total_min,
+            total_max=total_max,
+            limit=limit,
+            cursor=cursor
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    return InvoiceListResponse(items=items, next_cursor=next_cursor)
+
 @router.post("/process", response_model=InvoiceResponse)
 async def process_invoice(file: UploadFile = File(...)):
     """
@@ -39,80 +127,123 @@ async def process_invoice(file: UploadFile = File(...)):
             detail=f"El archivo es demasiado grande. Máximo permitido: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
         )
     
-    # Generar nombre único para el archivo
-    file_id = str(uuid.uuid4())
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"{file_id}{file_extension}"
-    file_path = Path(settings.UPLOAD_DIR) / unique_filename
+    source: Union[bytes, str] = b""
     
     try:
-        # Guardar archivo temporalmente
-        logger.info(f"Guardando archivo: {file.filename}")
-        with open(file_path, 'wb') as f:
-            content = await file.read()
-            f.write(content)
-        
-        # Validar que es un PDF válido
-        logger.info("Validando PDF...")
-        if not PDFProcessor.validate_pdf(str(file_path)):
-            raise HTTPException(
-                status_code=400,
-                detail="El archivo PDF está corrupto o no es válido"
-            )
-        
-        # Extraer texto del PDF
-        logger.info("Extrayendo texto del PDF...")
-        pdf_processor = PDFProcessor()
-        extracted_text = pdf_processor.extract_text(str(file_path))
-        
-        if not extracted_text or len(extracted_text.strip()) < 50:
-            raise HTTPException(
-                status_code=400,
-                detail="No se pudo extraer texto suficiente del PDF"
-            )
-        
-        logger.info(f"Texto extraído: {len(extracted_text)} caracteres")
-        
-        # Procesar con IA
-        logger.info("Procesando con IA...")
-        ai_extractor = AIExtractor()
-        invoice_data = await ai_extractor.extract_invoice_data(extracted_text)
+        with stage("upload"):
+            cache_key, source = await _read_upload(file)
+        with stage("request"):
+            invoice_data = await process_document(source, cache_key)
         
         # Agregar información adicional
         invoice_data.processing_notes = [
             f"Archivo original: {file.filename}",
-            f"Tamaño: {file.size} bytes",
-            f"Texto extraído: {len(extracted_text)} caracteres"
-        ]
+            f"Tamaño: {file.size} bytes"
+        ] + (invoice_data.processing_notes or [])
         
         logger.info(f"Factura procesada exitosamente: {invoice_data.invoice_id}")
         return invoice_data
         
+    except DocumentError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except LLMRateLimitError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Servicio de IA saturado, reintente más tarde: {str(e)}",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     except HTTPException:
         # Re-lanzar HTTPExceptions
         raise
     except Exception as e:
+        ERRORS.inc(kind="internal")
         logger.error(f"Error procesando factura: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Error interno procesando la factura: {str(e)}"
         )
     finally:
-        # Limpiar archivo temporal
+        # Limpiar archivo temporal, si se volcó a disco
+        _release_source(source)
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/process-stream")
+async def process_invoice_stream(file: UploadFile = File(...)):
+    """
+    Procesa una factura y emite por SSE cada campo en cuanto el modelo lo
+    completa (`field`, `item`), luego el resultado completo (`result`) y las
+    métricas de tiempo (`metrics`)
+    """
+    # Validar archivo
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(
+            status_code=400,
+            detail="Solo se permiten archivos PDF"
+        )
+    
+    if file.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El archivo es demasiado grande. Máximo permitido: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
+        )
+    
+    # El upload se lee antes de responder; el stream solo usa la copia
+    start = time.perf_counter()
+    with stage("upload"):
+        cache_key, source = await _read_upload(file)
+    filename, size = file.filename, file.size
+    
+    async def event_stream():
+        first_field_ms = None
         try:
-            if file_path.exists():
-                file_path.unlink()
-                logger.info(f"Archivo temporal eliminado: {file_path}")
+            async for event, name, value in stream_document(source, cache_key):
+                if event == "result":
+                    value.processing_notes = [
+                        f"Archivo original: {filename}",
+                        f"Tamaño: {size} bytes"
+                    ] + (value.processing_notes or [])
+                    yield f"event: result\ndata: {value.model_dump_json()}\n\n"
+                    continue
+                if first_field_ms is None:
+                    first_field_ms = (time.perf_counter() - start) * 1000
+                    TIME_TO_FIRST_FIELD_SECONDS.observe(first_field_ms / 1000)
+                yield _sse(event, {"field": name, "value": value} if event == "field" else value)
+            total_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Streaming de {filename}: primer campo en {first_field_ms or total_ms:.0f} ms, total {total_ms:.0f} ms")
+            yield _sse("metrics", {
+                "time_to_first_field_ms": round(first_field_ms if first_field_ms is not None else total_ms, 1),
+                "total_ms": round(total_ms, 1)
+            })
+        except DocumentError as e:
+            yield _sse("error", {"status_code": 400, "detail": str(e)})
+        except LLMRateLimitError as e:
+            yield _sse("error", {
+                "status_code": 503,
+                "detail": f"Servicio de IA saturado, reintente más tarde: {str(e)}",
+                "retry_after": math.ceil(e.retry_after)
+            })
         except Exception as e:
-            logger.warning(f"No se pudo eliminar archivo temporal: {str(e)}")
+            ERRORS.inc(kind="internal")
+            logger.error(f"Error procesando factura en streaming: {str(e)}")
+            yield _sse("error", {"status_code": 500, "detail": f"Error interno procesando la factura: {str(e)}"})
+        finally:
+            _release_source(source)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/process-async", response_model=ProcessingStatus)
-async def process_invoice_async(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
-):
+async def process_invoice_async(file: UploadFile = File(...)):
     """
-    Procesa una factura de forma asíncrona (para archivos grandes)
+    Encola una factura para procesarla en los workers (para archivos grandes)
     """
     # Validar archivo
     if not file.filename.lower().endswith('.pdf'):
@@ -127,33 +258,25 @@ async def process_invoice_async(
             detail=f"El archivo es demasiado grande. Máximo permitido: {settings.MAX_FILE_SIZE / 1024 / 1024}MB"
         )
     
-    # Generar ID único para el proceso
-    process_id = str(uuid.uuid4())
-    
-    # Guardar archivo y agregar tarea en background
-    file_id = str(uuid.uuid4())
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"{file_id}{file_extension}"
-    file_path = Path(settings.UPLOAD_DIR) / unique_filename
-    
     try:
-        # Guardar archivo
-        with open(file_path, 'wb') as f:
-            content = await file.read()
-            f.write(content)
-        
-        # Agregar tarea de procesamiento en background
-        background_tasks.add_task(
-            process_invoice_background,
-            str(file_path),
-            process_id,
-            file.filename
-        )
+        # El PDF se guarda en la cola para que cualquier worker pueda procesarlo
+        content = await file.read()
+        job_id, created = await job_queue.enqueue_unique(content, file.filename, result_cache.make_key(content))
+        if not created:
+            # La misma factura ya está en cola o en proceso: se devuelve ese trabajo
+            logger.info(f"Factura idéntica ya encolada: {job_id}")
+            COALESCED_REQUESTS.inc(scope="job")
+            return ProcessingStatus(
+                status="processing",
+                message="Ya hay un trabajo en curso para esta factura",
+                invoice_id=job_id
+            )
+        logger.info(f"Trabajo encolado: {job_id}")
         
         return ProcessingStatus(
             status="processing",
             message="La factura se está procesando en segundo plano",
-            invoice_id=process_id
+            invoice_id=job_id
         )
         
     except Exception as e:
@@ -163,37 +286,225 @@ async def process_invoice_async(
             detail=f"Error iniciando procesamiento: {str(e)}"
         )
 
-async def process_invoice_background(file_path: str, process_id: str, original_filename: str):
+def _copy_limited(source: IO[bytes], target: IO[bytes], limit: int) -> int:
     """
-    Función para procesar facturas en background
+    Copia hasta `limit` bytes por bloques y devuelve cuántos copió
     """
-    try:
-        logger.info(f"Iniciando procesamiento en background: {process_id}")
-        
-        # Validar PDF
-        if not PDFProcessor.validate_pdf(file_path):
-            logger.error(f"PDF inválido: {file_path}")
+    copied = 0
+    while copied < limit:
+        chunk = source.read(min(UPLOAD_CHUNK_SIZE, limit - copied))
+        if not chunk:
+            break
+        target.write(chunk)
+        copied += len(chunk)
+    return copied
+
+def _spool_batch(files: List[UploadFile], directory: str) -> List[Tuple[str, Callable[[], Awaitable[bytes]]]]:
+    """
+    Expande los archivos del batch (PDFs sueltos o ZIPs con PDFs) en pares
+    (nombre, lector) y vuelca cada PDF a `directory` antes de responder: los
+    UploadFile se cierran al terminar la petición, antes que el stream. Es
+    síncrona (lectura y descompresión): se ejecuta en un hilo.
+    """
+    entries = []
+    total = 0
+
+    def check_limits(size: int = 0):
+        if len(entries) >= settings.BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Demasiadas facturas en el batch. Máximo permitido: {settings.BATCH_MAX_FILES}"
+            )
+        if total + size > settings.BATCH_MAX_TOTAL_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"El batch es demasiado grande. Máximo descomprimido: {settings.BATCH_MAX_TOTAL_SIZE / 1024 / 1024}MB"
+            )
+
+    def add(name: str, source: IO[bytes]):
+        nonlocal total
+        check_limits()
+        path = os.path.join(directory, f"{len(entries)}.pdf")
+        with open(path, "wb") as target:
+            # Con límite: el tamaño declarado en el ZIP puede no ser el real
+            size = _copy_limited(source, target, settings.MAX_FILE_SIZE + 1)
+        if size > settings.MAX_FILE_SIZE:
+            os.remove(path)
+            entries.append((name, _fail_reader("El archivo es demasiado grande")))
             return
-        
-        # Extraer texto
-        pdf_processor = PDFProcessor()
-        extracted_text = pdf_processor.extract_text(file_path)
-        
-        # Procesar con IA
-        ai_extractor = AIExtractor()
-        invoice_data = await ai_extractor.extract_invoice_data(extracted_text)
-        
-        # Aquí podrías guardar en base de datos, enviar notificación, etc.
-        logger.info(f"Procesamiento completado: {process_id}")
-        
-    except Exception as e:
-        logger.error(f"Error en procesamiento background {process_id}: {str(e)}")
-    finally:
-        # Limpiar archivo
+        check_limits(size)
+        total += size
+        entries.append((name, _file_reader(path)))
+
+    for upload in files:
+        name = upload.filename or ""
+        if name.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                entries.append((name, _fail_reader("El archivo ZIP está corrupto o no es válido")))
+                continue
+            with archive:
+                members = archive.infolist()
+                if len(members) > settings.BATCH_MAX_FILES:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"El ZIP {name} tiene demasiados archivos. Máximo permitido: {settings.BATCH_MAX_FILES}"
+                    )
+                for member in members:
+                    if member.is_dir() or not member.filename.lower().endswith('.pdf'):
+                        continue
+                    member_name = f"{name}/{member.filename}"
+                    # Se descarta por el tamaño declarado, sin descomprimir
+                    if member.file_size > settings.MAX_FILE_SIZE:
+                        check_limits()
+                        entries.append((member_name, _fail_reader("El archivo es demasiado grande")))
+                        continue
+                    check_limits(member.file_size)
+                    try:
+                        with archive.open(member) as source:
+                            add(member_name, source)
+                    except HTTPException:
+                        raise
+                    except Exception as e:
+                        entries.append((member_name, _fail_reader(f"No se pudo leer el PDF del ZIP: {str(e)}")))
+        elif name.lower().endswith('.pdf'):
+            upload.file.seek(0)
+            add(name, upload.file)
+        else:
+            check_limits()
+            entries.append((name, _fail_reader("Solo se permiten archivos PDF o ZIP")))
+    return entries
+
+def _file_reader(path: str) -> Callable[[], Awaitable[bytes]]:
+    async def read() -> bytes:
+        return await asyncio.to_thread(Path(path).read_bytes)
+    return read
+
+def _fail_reader(message: str) -> Callable[[], Awaitable[bytes]]:
+    async def read() -> bytes:
+        raise DocumentError(message)
+    return read
+
+async def _process_batch_entry(name: str, read: Callable[[], Awaitable[bytes]], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """
+    Procesa un elemento del batch; los errores se devuelven en la línea del elemento
+    """
+    async with semaphore:
         try:
-            Path(file_path).unlink()
+            content = await read()
+            if len(content) > settings.MAX_FILE_SIZE:
+                raise DocumentError("El archivo es demasiado grande")
+            invoice_data = await process_document(content, result_cache.make_key(content), Priority.BATCH)
+            return {"filename": name, "status": "completed", "result": invoice_data.model_dump(), "error": None}
+        except DocumentError as e:
+            return {"filename": name, "status": "failed", "result": None, "error": str(e)}
         except Exception as e:
-            logger.warning(f"No se pudo eliminar archivo: {str(e)}")
+            logger.error(f"Error procesando {name} en batch: {str(e)}")
+            return {"filename": name, "status": "failed", "result": None, "error": f"Error interno procesando la factura: {str(e)}"}
+
+@router.post("/batch")
+async def process_invoice_batch(
+    files: List[UploadFile] = File(...),
+    concurrency: Optional[int] = Query(None, ge=1, description="Facturas procesadas en paralelo")
+):
+    """
+    Procesa muchas facturas (PDFs o ZIPs con PDFs) y devuelve un stream NDJSON
+    con una línea por factura en el orden en que van terminando
+    """
+    directory = await asyncio.to_thread(tempfile.mkdtemp, prefix="batch-")
+    try:
+        entries = await asyncio.to_thread(_spool_batch, files, directory)
+        if not entries:
+            raise HTTPException(
+                status_code=400,
+                detail="No se encontraron facturas en la petición"
+            )
+    except BaseException:
+        await asyncio.to_thread(shutil.rmtree, directory, True)
+        raise
+    
+    semaphore = asyncio.Semaphore(min(concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY))
+    logger.info(f"Batch recibido: {len(entries)} facturas")
+    
+    async def result_stream():
+        tasks = [asyncio.create_task(_process_batch_entry(name, read, semaphore)) for name, read in entries]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+        finally:
+            # Si el cliente se desconecta, no seguir gastando en el resto
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.to_thread(shutil.rmtree, directory, True)
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+def _job_status(job: Dict[str, Any]) -> JobStatus:
+    """
+    Convierte el registro de la cola en la respuesta del API
+    """
+    return JobStatus(
+        job_id=job["id"],
+        state=job["state"],
+        filename=job.get("filename"),
+        attempts=job.get("attempts", 0),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        error=job.get("error"),
+        result=InvoiceResponse.model_validate_json(job["result"]) if job.get("result") else None
+    )
+
+async def _get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Trabajo no encontrado"
+        )
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Segundos a esperar (long-poll) a que el estado cambie")
+):
+    """
+    Devuelve el estado de un trabajo de /process-async y, al terminar, su resultado.
+    Con `wait` la respuesta se retiene hasta que el estado cambie o venza el plazo.
+    """
+    job = await _get_job_or_404(job_id)
+    if wait > 0 and job["state"] not in JobState.TERMINAL:
+        job = await job_watcher.wait_for_change(job_id, job["state"], min(wait, settings.JOB_MAX_WAIT)) or job
+    return _job_status(job)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream SSE con las transiciones de estado de un trabajo hasta que termina
+    """
+    job = await _get_job_or_404(job_id)
+    
+    async def event_stream():
+        current = job
+        yield f"event: state\ndata: {_job_status(current).model_dump_json()}\n\n"
+        while current["state"] not in JobState.TERMINAL:
+            updated = await job_watcher.wait_for_change(job_id, current["state"], settings.JOB_SSE_KEEPALIVE)
+            if updated is None:
+                break
+            if updated["state"] == current["state"]:
+                # Sin cambios: comentario para mantener viva la conexión
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: state\ndata: {_job_status(updated).model_dump_json()}\n\n"
+            current = updated
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/health")
 async def health_check():
@@ -203,5 +514,7 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "invoice-processing",
-        "openai_configured": bool(settings.OPENAI_API_KEY)
+        "openai_configured": bool(settings.OPENAI_API_KEY),
+        "llm_responses": completion_stats.snapshot(),
+        "pdf_backends": backend_router.snapshot()
     }
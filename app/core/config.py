@@ -19,16 +19,120 @@ class Settings:
     # OpenAI
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = "gpt-4o"
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+    # Límites de la cuenta (0 = sin límite); con OPENAI_RATE_BACKEND=redis los comparten el API y los workers
+    OPENAI_RPM_LIMIT: float = float(os.getenv("OPENAI_RPM_LIMIT", "0"))
+    OPENAI_TPM_LIMIT: float = float(os.getenv("OPENAI_TPM_LIMIT", "0"))
+    OPENAI_RATE_BURST_SECONDS: float = float(os.getenv("OPENAI_RATE_BURST_SECONDS", "1"))
+    OPENAI_RATE_BACKEND: str = os.getenv("OPENAI_RATE_BACKEND", "memory")  # memory (por proceso) o redis
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+    OPENAI_BACKOFF_BASE: float = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+    OPENAI_BACKOFF_MAX: float = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+    OPENAI_QUEUE_TIMEOUT: float = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "120"))
+    # json_schema (structured outputs desde InvoiceResponse), json_object o none
+    OPENAI_RESPONSE_FORMAT: str = os.getenv("OPENAI_RESPONSE_FORMAT", "json_schema")
+    OPENAI_REPAIR_RETRIES: int = int(os.getenv("OPENAI_REPAIR_RETRIES", "1"))
+    OPENAI_HTTP2: bool = os.getenv("OPENAI_HTTP2", "True").lower() == "true"
+    OPENAI_POOL_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "100"))
+    OPENAI_POOL_MAX_KEEPALIVE: int = int(os.getenv("OPENAI_POOL_MAX_KEEPALIVE", "20"))
+    OPENAI_KEEPALIVE_EXPIRY: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+    PROMPT_COMPACTION: bool = os.getenv("PROMPT_COMPACTION", "True").lower() == "true"
+    PROMPT_MAX_INPUT_TOKENS: int = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "12000"))
+    
+    # Facturas largas: fragmentos de páginas extraídos en paralelo
+    EXTRACTION_CHUNKING: bool = os.getenv("EXTRACTION_CHUNKING", "True").lower() == "true"
+    EXTRACTION_CHUNK_TOKENS: int = int(os.getenv("EXTRACTION_CHUNK_TOKENS", "2500"))
+    EXTRACTION_CHUNK_MAX_OUTPUT_TOKENS: int = int(os.getenv("EXTRACTION_CHUNK_MAX_OUTPUT_TOKENS", "4000"))
+    
+    # Tabla de ítems leída de la geometría del PDF: el modelo solo recibe un resumen
+    TABLE_EXTRACTION: bool = os.getenv("TABLE_EXTRACTION", "True").lower() == "true"
+    TABLE_MIN_ROWS: int = int(os.getenv("TABLE_MIN_ROWS", "2"))
+    
+    # Extractor por reglas: evita llamar al modelo si su confianza alcanza el umbral
+    RULES_FAST_PATH: bool = os.getenv("RULES_FAST_PATH", "True").lower() == "true"
+    RULES_CONFIDENCE_THRESHOLD: float = float(os.getenv("RULES_CONFIDENCE_THRESHOLD", "0.9"))
+    
+    # Métricas de Prometheus en /metrics
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    DATABASE_SQLITE_PATH: str = os.getenv("DATABASE_SQLITE_PATH", "invoices.db")  # si DATABASE_URL está vacío
+    PERSIST_INVOICES: bool = os.getenv("PERSIST_INVOICES", "True").lower() == "true"
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_INSERT_BATCH_SIZE: int = int(os.getenv("DB_INSERT_BATCH_SIZE", "500"))
+    DB_WRITE_BATCH_SIZE: int = int(os.getenv("DB_WRITE_BATCH_SIZE", "100"))
+    DB_WRITE_INTERVAL: float = float(os.getenv("DB_WRITE_INTERVAL", "0.02"))
     
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     
+    # Result Cache
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")  # memory, redis o none
+    CACHE_TTL_SECONDS: int = int(os.getenv("CACHE_TTL_SECONDS", "86400"))
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    
+    # Request Coalescing (subidas idénticas en curso)
+    COALESCE_BACKEND: str = os.getenv("COALESCE_BACKEND", "memory")  # memory (por proceso) o redis
+    COALESCE_LOCK_TTL: float = float(os.getenv("COALESCE_LOCK_TTL", "300"))
+    COALESCE_WAIT_TIMEOUT: float = float(os.getenv("COALESCE_WAIT_TIMEOUT", "300"))
+    
+    # Job Queue (/process-async)
+    JOB_BACKEND: str = os.getenv("JOB_BACKEND", "sqlite")  # sqlite o redis
+    JOB_SQLITE_PATH: str = os.getenv("JOB_SQLITE_PATH", "jobs.db")
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_VISIBILITY_TIMEOUT: float = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+    JOB_RETRY_BACKOFF: float = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+    JOB_RETRY_BACKOFF_MAX: float = float(os.getenv("JOB_RETRY_BACKOFF_MAX", "300"))
+    JOB_RESULT_TTL: int = int(os.getenv("JOB_RESULT_TTL", str(7 * 24 * 3600)))
+    JOB_MAX_WAIT: float = float(os.getenv("JOB_MAX_WAIT", "30"))
+    JOB_WATCH_INTERVAL: float = float(os.getenv("JOB_WATCH_INTERVAL", "0.5"))
+    JOB_SSE_KEEPALIVE: float = float(os.getenv("JOB_SSE_KEEPALIVE", "15"))
+    WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", "4"))
+    WORKER_POLL_INTERVAL: float = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+    
     # File Upload
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: list = [".pdf"]
     UPLOAD_DIR: str = "uploads"
+    # Por encima de este tamaño el PDF se vuelca a disco en lugar de pasar en memoria
+    UPLOAD_SPILL_THRESHOLD: int = int(os.getenv("UPLOAD_SPILL_THRESHOLD", str(4 * 1024 * 1024)))
+    
+    # Batch Upload
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_MAX_FILES: int = int(os.getenv("BATCH_MAX_FILES", "500"))
+    # Suma de los PDFs del batch ya descomprimidos (se vuelcan a disco antes de procesarlos)
+    BATCH_MAX_TOTAL_SIZE: int = int(os.getenv("BATCH_MAX_TOTAL_SIZE", str(500 * 1024 * 1024)))
+    
+    # PDF Extraction Pool
+    PDF_POOL_SIZE: int = int(os.getenv("PDF_POOL_SIZE", str(os.cpu_count() or 2)))
+    PDF_POOL_MAX_TASKS_PER_CHILD: int = int(os.getenv("PDF_POOL_MAX_TASKS_PER_CHILD", "50"))
+    PDF_JOB_TIMEOUT: float = float(os.getenv("PDF_JOB_TIMEOUT", "30"))
+    PDF_PROBE_PAGES: int = int(os.getenv("PDF_PROBE_PAGES", "3"))  # 0 = sin muestreo previo
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "100"))  # 0 = nunca repartir
+    
+    # OCR de PDFs escaneados (requiere pytesseract y el binario tesseract)
+    OCR_ENABLED: bool = os.getenv("OCR_ENABLED", "False").lower() == "true"
+    OCR_LANG: str = os.getenv("OCR_LANG", "spa")
+    OCR_TESSERACT_CMD: str = os.getenv("OCR_TESSERACT_CMD", "tesseract")
+    OCR_POOL_SIZE: int = int(os.getenv("OCR_POOL_SIZE", str(os.cpu_count() or 2)))
+    OCR_PAGE_TIMEOUT: float = float(os.getenv("OCR_PAGE_TIMEOUT", "60"))
+    OCR_MAX_PAGES: int = int(os.getenv("OCR_MAX_PAGES", "50"))
+    OCR_MIN_DPI: int = int(os.getenv("OCR_MIN_DPI", "150"))
+    OCR_MAX_DPI: int = int(os.getenv("OCR_MAX_DPI", "400"))
+    OCR_TARGET_PIXELS: int = int(os.getenv("OCR_TARGET_PIXELS", "3300"))  # lado mayor sin resolución conocida
+    
+    # Backend Routing (pdfplumber / PyPDF2 por familia de generador del PDF)
+    BACKEND_ROUTING: bool = os.getenv("BACKEND_ROUTING", "True").lower() == "true"
+    BACKEND_STATS_PATH: str = os.getenv("BACKEND_STATS_PATH", "backend_stats.json")
+    BACKEND_STATS_SAVE_INTERVAL: float = float(os.getenv("BACKEND_STATS_SAVE_INTERVAL", "30"))
+    BACKEND_MIN_SAMPLES: int = int(os.getenv("BACKEND_MIN_SAMPLES", "5"))
+    BACKEND_EXPLORE_RATE: float = float(os.getenv("BACKEND_EXPLORE_RATE", "0.1"))
+    BACKEND_RELIABILITY: float = float(os.getenv("BACKEND_RELIABILITY", "0.9"))
+    BACKEND_MAX_FAMILIES: int = int(os.getenv("BACKEND_MAX_FAMILIES", "1000"))
 
 settings = Settings()
@@ -0,0 +1,256 @@
+import threading
+from abc import ABC, abstractmethod
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+# Límites por defecto en segundos: cubren desde el parseo de una página hasta una llamada larga al modelo
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class Registry:
+    """Conjunto de métricas del proceso, exportado en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric"):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+registry = Registry()
+
+class _Metric(ABC):
+    """Base de las métricas: nombre, ayuda y valores por combinación de etiquetas"""
+
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = registry
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """
+        Líneas de valores en formato de texto de Prometheus
+        """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Contador monótono"""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Registry = registry
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+class Histogram(_Metric):
+    """Histograma con límites fijos (buckets acumulados al exportar)"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = registry
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [conteo por bucket (+ el de +Inf), suma, total]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        if not settings.METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+# Content-Type del formato de exposición de texto de Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = Histogram(
+    "invoice_stage_duration_seconds",
+    "Duración de cada etapa del procesamiento de facturas",
+    ("stage",)
+)
+TIME_TO_FIRST_FIELD_SECONDS = Histogram(
+    "invoice_time_to_first_field_seconds",
+    "Tiempo hasta el primer campo emitido por /process-stream"
+)
+CACHE_REQUESTS = Counter(
+    "invoice_cache_requests_total",
+    "Consultas a la caché de resultados",
+    ("result",)
+)
+COALESCED_REQUESTS = Counter(
+    "invoice_coalesced_total",
+    "Peticiones que reutilizaron una extracción idéntica en curso (process, redis, job)",
+    ("scope",)
+)
+PDF_TEXT_BACKEND = Counter(
+    "pdf_text_extractions_total",
+    "Textos extraídos por backend (pypdf2 = fallback)",
+    ("backend",)
+)
+EXTRACTION_METHOD = Counter(
+    "invoice_extractions_total",
+    "Facturas extraídas por método (rules, llm, llm_table, llm_chunks)",
+    ("method",)
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens consumidos en llamadas al modelo (in, out; total si el servidor no los separa)",
+    ("direction",)
+)
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "Llamadas al modelo por resultado (ok, parse_error, repaired, error = la llamada falló tras los reintentos)",
+    ("outcome",)
+)
+LLM_PROMPT_TRUNCATED = Counter(
+    "llm_prompt_truncated_total",
+    "Prompts enviados al modelo con líneas omitidas por PROMPT_MAX_INPUT_TOKENS"
+)
+LLM_WASTED_TOKENS = Counter(
+    "llm_wasted_tokens_total",
+    "Tokens de respuestas del modelo que no se pudieron parsear"
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "llm_queue_wait_seconds",
+    "Espera en el planificador antes de llamar al modelo, por carril de prioridad",
+    ("priority",)
+)
+LLM_RATE_LIMITED = Counter(
+    "llm_rate_limited_total",
+    "Respuestas 429 recibidas del proveedor"
+)
+ERRORS = Counter(
+    "invoice_errors_total",
+    "Errores procesando facturas por tipo",
+    ("kind",)
+)
+
+@contextmanager
+def stage(name: str, timings: Optional[Dict[str, float]] = None) -> Iterator[None]:
+    """
+    Mide una etapa. Con `timings` acumula la duración en el dict en lugar de
+    observarla (para etapas que corren en procesos del pool, cuyo registro no
+    es el del servidor); el proceso principal las observa con record_stages.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timings is None:
+            STAGE_SECONDS.observe(elapsed, stage=name)
+        else:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def record_stages(timings: Dict[str, float]):
+    """
+    Observa las duraciones medidas en otro proceso
+    """
+    for name, elapsed in timings.items():
+        STAGE_SECONDS.observe(elapsed, stage=name)
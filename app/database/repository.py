@@ -0,0 +1,349 @@
+import asyncio
+import base64
+import json
+import logging
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from app.core.config import settings
+from app.database.session import async_session
+from app.models.invoice import Invoice, InvoiceItem, Supplier
+from app.schemas.invoice import (
+    InvoiceResponse, SupplierInfo, InvoiceItem as InvoiceItemSchema, TaxInfo, InvoiceTotals, InvoiceSummary
+)
+
+logger = logging.getLogger(__name__)
+
+TAX_FIELDS = ['ica_percentage', 'ica_amount', 'fuente_percentage', 'fuente_amount', 'iva_percentage', 'iva_amount']
+TOTAL_FIELDS = ['subtotal', 'discount_total', 'tax_total', 'retention_total', 'total']
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    """
+    Convierte fechas YYYY-MM-DD; las que el modelo devuelva mal quedan en null
+    """
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+class InvalidCursorError(Exception):
+    """El cursor de paginación no es válido"""
+
+def encode_cursor(issue_date: Optional[date], invoice_id: str) -> str:
+    """
+    Cursor opaco con la clave (issue_date, id) de la última fila devuelta
+    """
+    payload = json.dumps([issue_date.isoformat() if issue_date else None, invoice_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[Optional[date], str]:
+    try:
+        issue_date, invoice_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (date.fromisoformat(issue_date) if issue_date else None), str(invoice_id)
+    except Exception:
+        raise InvalidCursorError("Cursor de paginación inválido")
+
+def _chunks(rows: List[Dict[str, Any]], size: int) -> Iterable[List[Dict[str, Any]]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+class InvoiceRepository:
+    """Persistencia de InvoiceResponse con inserts multi-fila"""
+
+    def __init__(self, session_factory: async_sessionmaker = async_session):
+        self.session_factory = session_factory
+
+    async def save(self, invoice: InvoiceResponse) -> int:
+        return await self.save_many([invoice])
+
+    async def save_many(self, invoices: List[InvoiceResponse]) -> int:
+        """
+        Guarda varias facturas en una transacción. Facturas, proveedores e
+        items se insertan con sentencias multi-fila. Las facturas ya guardadas
+        (mismo invoice_id) se omiten. Devuelve cuántas se insertaron.
+        """
+        async with self.session_factory() as session, session.begin():
+            ids = [invoice.invoice_id for invoice in invoices]
+            existing = set((await session.execute(select(Invoice.id).where(Invoice.id.in_(ids)))).scalars())
+            pending: Dict[str, InvoiceResponse] = {}
+            for invoice in invoices:
+                if invoice.invoice_id not in existing:
+                    pending.setdefault(invoice.invoice_id, invoice)
+            if not pending:
+                return 0
+
+            supplier_ids = await self._resolve_suppliers(session, list(pending.values()))
+
+            invoice_rows = []
+            item_rows = []
+            for invoice in pending.values():
+                taxes = invoice.taxes.model_dump() if invoice.taxes else {}
+                totals = invoice.totals.model_dump() if invoice.totals else {}
+                invoice_rows.append({
+                    "id": invoice.invoice_id,
+                    "document_type": invoice.document_type,
+                    "series": invoice.series,
+                    "number": invoice.number,
+                    "issue_date": _parse_date(invoice.issue_date),
+                    "due_date": _parse_date(invoice.due_date),
+                    "supplier_id": supplier_ids.get(invoice.invoice_id),
+                    "currency": invoice.currency,
+                    "confidence_score": invoice.confidence_score,
+                    "raw_text": invoice.raw_text,
+                    **{field: taxes.get(field) for field in TAX_FIELDS},
+                    **{field: totals.get(field) for field in TOTAL_FIELDS}
+                })
+                for position, item in enumerate(invoice.items):
+                    item_rows.append({"invoice_id": invoice.invoice_id, "position": position, **item.model_dump()})
+
+            for chunk in _chunks(invoice_rows, settings.DB_INSERT_BATCH_SIZE):
+                await session.execute(insert(Invoice).values(chunk))
+            for chunk in _chunks(item_rows, settings.DB_INSERT_BATCH_SIZE):
+                await session.execute(insert(InvoiceItem).values(chunk))
+
+        logger.info(f"Guardadas {len(invoice_rows)} facturas y {len(item_rows)} items")
+        return len(invoice_rows)
+
+    async def _resolve_suppliers(self, session: AsyncSession, invoices: List[InvoiceResponse]) -> Dict[str, int]:
+        """
+        Obtiene o crea los proveedores; devuelve invoice_id -> supplier_id
+        """
+        by_tax_id: Dict[str, SupplierInfo] = {}
+        without_tax_id: List[Tuple[str, SupplierInfo]] = []
+        for invoice in invoices:
+            supplier = invoice.supplier
+            if supplier is None or not any(supplier.model_dump().values()):
+                continue
+            if supplier.tax_id:
+                by_tax_id.setdefault(supplier.tax_id, supplier)
+            else:
+                without_tax_id.append((invoice.invoice_id, supplier))
+
+        result: Dict[str, int] = {}
+        if by_tax_id:
+            # Insertar los NIT nuevos en una sola sentencia, ignorando los que ya existan
+            dialect_insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+            await session.execute(
+                dialect_insert(Supplier)
+                .values([supplier.model_dump() for supplier in by_tax_id.values()])
+                .on_conflict_do_nothing(index_elements=["tax_id"])
+            )
+            rows = await session.execute(select(Supplier.tax_id, Supplier.id).where(Supplier.tax_id.in_(list(by_tax_id))))
+            supplier_by_tax_id = dict(rows.all())
+            for invoice in invoices:
+                if invoice.supplier and invoice.supplier.tax_id in supplier_by_tax_id:
+                    result[invoice.invoice_id] = supplier_by_tax_id[invoice.supplier.tax_id]
+
+        # Sin NIT no hay forma de deduplicar: un proveedor por factura
+        for invoice_id, supplier in without_tax_id:
+            result[invoice_id] = await session.scalar(insert(Supplier).values(supplier.model_dump()).returning(Supplier.id))
+        return result
+
+    async def search(
+        self,
+        supplier_tax_id: Optional[str] = None,
+        issue_date_from: Optional[date] = None,
+        issue_date_to: Optional[date] = None,
+        number: Optional[str] = None,
+        series: Optional[str] = None,
+        currency: Optional[str] = None,
+        total_min: Optional[float] = None,
+        total_max: Optional[float] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[InvoiceSummary], Optional[str]]:
+        """
+        Lista facturas por (issue_date, id) descendente con paginación keyset:
+        cada página continúa desde la clave del cursor en lugar de usar OFFSET,
+        así el costo no crece con la profundidad. Las facturas sin fecha van al
+        final, ordenadas por id. Devuelve (facturas, siguiente cursor).
+        """
+        filters = []
+        if supplier_tax_id:
+            filters.append(Invoice.supplier_id == select(Supplier.id).where(Supplier.tax_id == supplier_tax_id).scalar_subquery())
+        if issue_date_from:
+            filters.append(Invoice.issue_date >= issue_date_from)
+        if issue_date_to:
+            filters.append(Invoice.issue_date <= issue_date_to)
+        if number:
+            filters.append(Invoice.number == number)
+        if series:
+            filters.append(Invoice.series == series)
+        if currency:
+            filters.append(Invoice.currency == currency)
+        if total_min is not None:
+            filters.append(Invoice.total >= total_min)
+        if total_max is not None:
+            filters.append(Invoice.total <= total_max)
+
+        after_date, after_id = decode_cursor(cursor) if cursor else (None, None)
+        in_undated_phase = cursor is not None and after_date is None
+        include_undated = not issue_date_from and not issue_date_to
+
+        query = (
+            select(
+                Invoice.id, Invoice.document_type, Invoice.series, Invoice.number,
+                Invoice.issue_date, Invoice.due_date, Invoice.currency, Invoice.total,
+                Invoice.confidence_score, Supplier.name, Supplier.tax_id
+            )
+            .outerjoin(Supplier, Invoice.supplier_id == Supplier.id)
+            .where(*filters)
+        )
+
+        rows = []
+        async with self.session_factory() as session:
+            if not in_undated_phase:
+                dated = query.where(Invoice.issue_date.is_not(None))
+                if cursor:
+                    dated = dated.where(tuple_(Invoice.issue_date, Invoice.id) < tuple_(after_date, after_id))
+                dated = dated.order_by(Invoice.issue_date.desc(), Invoice.id.desc()).limit(limit + 1)
+                rows = list((await session.execute(dated)).all())
+            if len(rows) <= limit and include_undated:
+                undated = query.where(Invoice.issue_date.is_(None))
+                if in_undated_phase:
+                    undated = undated.where(Invoice.id < after_id)
+                undated = undated.order_by(Invoice.id.desc()).limit(limit + 1 - len(rows))
+                rows += list((await session.execute(undated)).all())
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        summaries = [
+            InvoiceSummary(
+                invoice_id=row.id,
+                document_type=row.document_type,
+                series=row.series,
+                number=row.number,
+                issue_date=row.issue_date.isoformat() if row.issue_date else None,
+                due_date=row.due_date.isoformat() if row.due_date else None,
+                supplier_name=row.name,
+                supplier_tax_id=row.tax_id,
+                currency=row.currency,
+                total=row.total,
+                confidence_score=row.confidence_score
+            )
+            for row in rows
+        ]
+        next_cursor = encode_cursor(rows[-1].issue_date, rows[-1].id) if has_more else None
+        return summaries, next_cursor
+
+    async def get(self, invoice_id: str) -> Optional[InvoiceResponse]:
+        async with self.session_factory() as session:
+            invoice = await session.scalar(
+                select(Invoice)
+                .where(Invoice.id == invoice_id)
+                .options(selectinload(Invoice.supplier), selectinload(Invoice.items))
+            )
+            return to_invoice_response(invoice) if invoice is not None else None
+
+def to_invoice_response(invoice: Invoice) -> InvoiceResponse:
+    """
+    Reconstruye el InvoiceResponse desde las filas guardadas
+    """
+    supplier = invoice.supplier
+    has_taxes = any(getattr(invoice, field) is not None for field in TAX_FIELDS)
+    has_totals = invoice.subtotal is not None and invoice.total is not None
+    return InvoiceResponse(
+        invoice_id=invoice.id,
+        document_type=invoice.document_type,
+        series=invoice.series,
+        number=invoice.number,
+        issue_date=invoice.issue_date.isoformat() if invoice.issue_date else None,
+        due_date=invoice.due_date.isoformat() if invoice.due_date else None,
+        supplier=SupplierInfo(
+            name=supplier.name, tax_id=supplier.tax_id, address=supplier.address,
+            phone=supplier.phone, email=supplier.email
+        ) if supplier else None,
+        currency=invoice.currency,
+        items=[
+            InvoiceItemSchema(
+                description=item.description, quantity=item.quantity, unit_price=item.unit_price,
+                discount_percentage=item.discount_percentage, subtotal=item.subtotal, tax_amount=item.tax_amount
+            )
+            for item in invoice.items
+        ],
+        taxes=TaxInfo(**{field: getattr(invoice, field) for field in TAX_FIELDS}) if has_taxes else None,
+        totals=InvoiceTotals(**{field: getattr(invoice, field) for field in TOTAL_FIELDS}) if has_totals else None,
+        raw_text=invoice.raw_text,
+        confidence_score=invoice.confidence_score
+    )
+
+class BulkInvoiceWriter:
+    """
+    Agrupa los guardados concurrentes (p. ej. de un batch) en una sola
+    transacción con inserts multi-fila, esperando como máximo
+    DB_WRITE_INTERVAL segundos o DB_WRITE_BATCH_SIZE facturas.
+    """
+
+    def __init__(self, repository: InvoiceRepository, batch_size: int, interval: float):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def save(self, invoice: InvoiceResponse):
+        """
+        Encola la factura y espera a que su lote quede confirmado
+        """
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((invoice, future))
+        await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            try:
+                await self.repository.save_many([invoice for invoice, _ in batch])
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def close(self):
+        """
+        Escribe lo pendiente y detiene el escritor
+        """
+        task, self._task = self._task, None
+        if task is not None and not task.done() and self._loop is asyncio.get_running_loop():
+            await self._queue.put(None)
+            await task
+
+invoice_repository = InvoiceRepository()
+invoice_writer = BulkInvoiceWriter(invoice_repository, settings.DB_WRITE_BATCH_SIZE, settings.DB_WRITE_INTERVAL)
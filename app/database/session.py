@@ -0,0 +1,51 @@
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def get_database_url() -> str:
+    """
+    Normaliza DATABASE_URL a un driver asíncrono. Sin configurar, usa un
+    archivo SQLite local.
+    """
+    url = settings.DATABASE_URL or f"sqlite+aiosqlite:///{settings.DATABASE_SQLITE_PATH}"
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        url = "postgresql+asyncpg://" + url[len("postgresql://"):]
+    elif url.startswith("sqlite://"):
+        url = "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+def create_engine() -> AsyncEngine:
+    url = get_database_url()
+    if url.startswith("sqlite"):
+        # Las conexiones SQLite son baratas; sin pool evitamos atarlas a un event loop
+        return create_async_engine(url, poolclass=NullPool)
+    return create_async_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800
+    )
+
+engine = create_engine()
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+async def init_db():
+    """
+    Crea las tablas que no existan
+    """
+    from app.models.invoice import Base
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    logger.info("Base de datos inicializada")
+
+async def close_db():
+    await engine.dispose()
@@ -0,0 +1,80 @@
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import Date, DateTime, Float, ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+
+class Base(DeclarativeBase):
+    pass
+
+class Supplier(Base):
+    """Proveedor/emisor (SupplierInfo), único por NIT"""
+    __tablename__ = "suppliers"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    tax_id: Mapped[Optional[str]] = mapped_column(String(50), unique=True)
+    name: Mapped[Optional[str]] = mapped_column(String(255))
+    address: Mapped[Optional[str]] = mapped_column(String(255))
+    phone: Mapped[Optional[str]] = mapped_column(String(50))
+    email: Mapped[Optional[str]] = mapped_column(String(255))
+
+class Invoice(Base):
+    """
+    Factura (InvoiceResponse). TaxInfo e InvoiceTotals son 1:1 con la factura
+    y se guardan como columnas propias.
+    """
+    __tablename__ = "invoices"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    document_type: Mapped[Optional[str]] = mapped_column(String(100))
+    series: Mapped[Optional[str]] = mapped_column(String(50))
+    number: Mapped[Optional[str]] = mapped_column(String(50))
+    issue_date: Mapped[Optional[date]] = mapped_column(Date)
+    due_date: Mapped[Optional[date]] = mapped_column(Date)
+    supplier_id: Mapped[Optional[int]] = mapped_column(ForeignKey("suppliers.id"))
+    currency: Mapped[Optional[str]] = mapped_column(String(10))
+    confidence_score: Mapped[Optional[float]] = mapped_column(Float)
+    raw_text: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+    # TaxInfo
+    ica_percentage: Mapped[Optional[float]] = mapped_column(Float)
+    ica_amount: Mapped[Optional[float]] = mapped_column(Float)
+    fuente_percentage: Mapped[Optional[float]] = mapped_column(Float)
+    fuente_amount: Mapped[Optional[float]] = mapped_column(Float)
+    iva_percentage: Mapped[Optional[float]] = mapped_column(Float)
+    iva_amount: Mapped[Optional[float]] = mapped_column(Float)
+
+    # InvoiceTotals
+    subtotal: Mapped[Optional[float]] = mapped_column(Float)
+    discount_total: Mapped[Optional[float]] = mapped_column(Float)
+    tax_total: Mapped[Optional[float]] = mapped_column(Float)
+    retention_total: Mapped[Optional[float]] = mapped_column(Float)
+    total: Mapped[Optional[float]] = mapped_column(Float)
+
+    supplier: Mapped[Optional[Supplier]] = relationship(lazy="raise")
+    items: Mapped[List["InvoiceItem"]] = relationship(lazy="raise", order_by="InvoiceItem.position")
+
+    # Índices compuestos para la búsqueda; terminan en (issue_date, id) para
+    # que la paginación keyset lea el índice en orden sin ordenar en memoria
+    __table_args__ = (
+        Index("ix_invoices_issue_date_id", "issue_date", "id"),
+        Index("ix_invoices_supplier_issue_date_id", "supplier_id", "issue_date", "id"),
+        Index("ix_invoices_currency_issue_date_id", "currency", "issue_date", "id"),
+        Index("ix_invoices_number_series", "number", "series"),
+        Index("ix_invoices_total", "total"),
+    )
+
+class InvoiceItem(Base):
+    """Línea de la factura (InvoiceItem)"""
+    __tablename__ = "invoice_items"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    invoice_id: Mapped[str] = mapped_column(ForeignKey("invoices.id", ondelete="CASCADE"), index=True)
+    position: Mapped[int] = mapped_column(Integer)
+    description: Mapped[str] = mapped_column(Text)
+    quantity: Mapped[float] = mapped_column(Float)
+    unit_price: Mapped[float] = mapped_column(Float)
+    discount_percentage: Mapped[float] = mapped_column(Float, default=0.0)
+    subtotal: Mapped[float] = mapped_column(Float)
+    tax_amount: Mapped[Optional[float]] = mapped_column(Float)
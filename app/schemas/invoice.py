@@ -3,6 +3,9 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 from decimal import Decimal
 
+# Incrementar cuando cambie la forma de InvoiceResponse (invalida la caché)
+SCHEMA_VERSION = "1"
+
 class SupplierInfo(BaseModel):
     name: Optional[str] = None
     tax_id: Optional[str] = None
@@ -55,6 +58,33 @@ class ProcessingStatus(BaseModel):
     invoice_id: Optional[str] = None
     error_details: Optional[str] = None
 
+class JobStatus(BaseModel):
+    job_id: str
+    state: str  # "queued", "processing", "completed", "failed"
+    filename: Optional[str] = None
+    attempts: int = 0
+    created_at: float
+    updated_at: float
+    error: Optional[str] = None
+    result: Optional[InvoiceResponse] = None
+
+class InvoiceSummary(BaseModel):
+    invoice_id: str
+    document_type: Optional[str] = None
+    series: Optional[str] = None
+    number: Optional[str] = None
+    issue_date: Optional[str] = None
+    due_date: Optional[str] = None
+    supplier_name: Optional[str] = None
+    supplier_tax_id: Optional[str] = None
+    currency: Optional[str] = None
+    total: Optional[float] = None
+    confidence_score: Optional[float] = None
+
+class InvoiceListResponse(BaseModel):
+    items: List[InvoiceSummary] = []
+    next_cursor: Optional[str] = None
+
 class InvoiceCreate(BaseModel):
     filename: str
     file_size: int
@@ -1,26 +1,189 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+import asyncio
+import importlib.util
 import json
+import httpx
 import logging
-from typing import Dict, Any, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from app.core.config import settings
-from app.schemas.invoice import InvoiceResponse, SupplierInfo, InvoiceItem, TaxInfo, InvoiceTotals
+from app.core.metrics import stage, ERRORS, LLM_REQUESTS, LLM_TOKENS, LLM_WASTED_TOKENS
+from app.schemas.invoice import InvoiceResponse
+from app.services.invoice_mapper import InvoiceDataMapper
+from app.services.json_stream import IncrementalJSONParser
+from app.services.llm_scheduler import LLMScheduler, LLMRateLimitError, Priority, close_llm_scheduler, get_llm_scheduler
+from app.services.prompt_compactor import count_tokens
 import uuid
 import re
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-class AIExtractor:
+# Incrementar cuando cambie el prompt de extracción (invalida la caché)
+PROMPT_VERSION = "4"
+
+# Campos que el modelo debe devolver (el resto de InvoiceResponse lo calcula el servidor)
+EXTRACTED_FIELDS = (
+    "document_type", "series", "number", "issue_date", "due_date",
+    "supplier", "currency", "items", "taxes", "totals"
+)
+CHUNK_FIELDS = ("items", "taxes", "totals")
+# Campos cuando los ítems ya salieron de la tabla del PDF (table_extractor)
+TABLE_FIELDS = tuple(name for name in EXTRACTED_FIELDS if name != "items")
+SCHEMA_NAMES = {EXTRACTED_FIELDS: "invoice", CHUNK_FIELDS: "invoice_chunk", TABLE_FIELDS: "invoice_without_items"}
+
+ITEMS_PROMPT = """    "items": [
+        {
+            "description": "descripción del producto/servicio",
+            "quantity": cantidad_numérica,
+            "unit_price": precio_unitario_numérico,
+            "discount_percentage": porcentaje_descuento_numérico,
+            "subtotal": subtotal_numérico
+        }
+    ],
+"""
+
+REPAIR_PROMPT = (
+    "La respuesta anterior no es un JSON válido ({error}). Devuelve únicamente el JSON "
+    "corregido con la estructura pedida, sin texto adicional."
+)
+
+def _strict_schema(node: Any) -> Any:
+    """
+    Adapta un JSON schema de pydantic al modo estricto de structured outputs:
+    todas las propiedades requeridas, sin propiedades adicionales ni defaults
+    """
+    if isinstance(node, list):
+        return [_strict_schema(value) for value in node]
+    if not isinstance(node, dict):
+        return node
+    strict = {}
+    for key, value in node.items():
+        if key in ("default", "title"):
+            continue
+        if key == "properties":
+            strict[key] = {name: _strict_schema(prop) for name, prop in value.items()}
+        else:
+            strict[key] = _strict_schema(value)
+    if strict.get("type") == "object" and "properties" in strict:
+        strict["required"] = list(strict["properties"])
+        strict["additionalProperties"] = False
+    return strict
+
+def build_extraction_schema(fields=EXTRACTED_FIELDS) -> Dict[str, Any]:
+    """
+    JSON schema de la respuesta del modelo generado desde InvoiceResponse
+    """
+    schema = InvoiceResponse.model_json_schema()
+    schema["properties"] = {name: schema["properties"][name] for name in fields}
+    # Conservar solo las definiciones que siguen referenciadas
+    referenced = json.dumps(schema["properties"])
+    schema["$defs"] = {
+        name: definition for name, definition in schema.get("$defs", {}).items()
+        if f"#/$defs/{name}" in referenced
+    }
+    return _strict_schema(schema)
+
+class CompletionStats:
+    """Contadores de respuestas del modelo que no se pudieron parsear"""
+
+    def __init__(self):
+        self.completions = 0
+        self.parse_failures = 0
+        self.repairs = 0
+        self.repaired = 0
+        self.wasted_tokens = 0
+
+    def record(self, tokens: int, failed: bool, repair: bool):
+        LLM_REQUESTS.inc(outcome="parse_error" if failed else ("repaired" if repair else "ok"))
+        if failed:
+            LLM_WASTED_TOKENS.inc(tokens)
+        self.completions += 1
+        if repair:
+            self.repairs += 1
+            if not failed:
+                self.repaired += 1
+        if failed:
+            self.parse_failures += 1
+            self.wasted_tokens += tokens
+
+    @property
+    def parse_failure_rate(self) -> float:
+        return self.parse_failures / self.completions if self.completions else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "completions": self.completions,
+            "parse_failures": self.parse_failures,
+            "parse_failure_rate": round(self.parse_failure_rate, 4),
+            "repair_retries": self.repairs,
+            "repaired": self.repaired,
+            "wasted_tokens": self.wasted_tokens
+        }
+
+completion_stats = CompletionStats()
+
+def _record_tokens(usage, content: str, prompt_messages: List[Dict[str, str]]) -> int:
+    """
+    Registra los tokens de entrada y salida de una llamada (estimados si el
+    servidor no informa usage) y devuelve el total. Si solo informa el total,
+    se registra con direction="total".
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens is None or completion_tokens is None:
+        total = getattr(usage, "total_tokens", None)
+        if total:
+            LLM_TOKENS.inc(total, direction="total")
+            return total
+        prompt_tokens = sum(len(m["content"]) for m in prompt_messages) // 4
+        completion_tokens = len(content) // 4
+    LLM_TOKENS.inc(prompt_tokens, direction="in")
+    LLM_TOKENS.inc(completion_tokens, direction="out")
+    return prompt_tokens + completion_tokens
+
+def create_http_client(verify: bool = True) -> httpx.AsyncClient:
+    """
+    Pool de conexiones HTTP para OpenAI con keep-alive y HTTP/2 si `h2` está instalado
+    """
+    return httpx.AsyncClient(
+        http2=settings.OPENAI_HTTP2 and importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=settings.OPENAI_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY
+        ),
+        timeout=settings.OPENAI_TIMEOUT,
+        verify=verify
+    )
+
+def create_openai_client(http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL or None,
+        timeout=settings.OPENAI_TIMEOUT,
+        # Los reintentos (429, 5xx) los gestiona LLMScheduler para respetar la cuota global
+        max_retries=0,
+        http_client=http_client or create_http_client()
+    )
+
+class AIExtractor(InvoiceDataMapper):
     """Clase para extraer información de facturas usando GPT-4o"""
     
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, client: Optional[AsyncOpenAI] = None, scheduler: Optional[LLMScheduler] = None):
+        self.client = client or create_openai_client()
         self.model = settings.OPENAI_MODEL
+        self.scheduler = scheduler or get_llm_scheduler()
+        self._schemas: Dict[str, Dict[str, Any]] = {}
     
-    def create_extraction_prompt(self, text: str) -> str:
+    def create_extraction_prompt(self, text: str, table_items: bool = False) -> str:
         """
-        Crea el prompt para extraer información de la factura
+        Crea el prompt para extraer información de la factura. Con `table_items`
+        los ítems ya se leyeron de la tabla del PDF y no se le piden al modelo.
         """
+        items_prompt = "" if table_items else ITEMS_PROMPT
+        table_note = (
+            "\n8. Los ítems ya se extrajeron de la tabla de la factura (ver el resumen entre corchetes): no los incluyas"
+            if table_items else ""
+        )
         prompt = f"""
 Analiza el siguiente texto de una factura y extrae la información en formato JSON. 
 El texto puede estar en español y contener información de facturas electrónicas colombianas.
@@ -44,16 +207,7 @@ Extrae la siguiente información y devuélvela en formato JSON válido:
         "email": "email"
     }},
     "currency": "moneda (COP, USD, etc.)",
-    "items": [
-        {{
-            "description": "descripción del producto/servicio",
-            "quantity": cantidad_numérica,
-            "unit_price": precio_unitario_numérico,
-            "discount_percentage": porcentaje_descuento_numérico,
-            "subtotal": subtotal_numérico
-        }}
-    ],
-    "taxes": {{
+{items_prompt}    "taxes": {{
         "ica_percentage": porcentaje_ica_numérico,
         "ica_amount": valor_ica_numérico,
         "fuente_percentage": porcentaje_retefuente_numérico,
@@ -77,69 +231,327 @@ INSTRUCCIONES IMPORTANTES:
 4. Las fechas deben estar en formato YYYY-MM-DD
 5. Si no encuentras un campo, usa null en lugar de texto vacío
 6. Para arrays vacíos, usa []
-7. Para porcentajes, usa el valor numérico (ej: 19.0 para 19%)
+7. Para porcentajes, usa el valor numérico (ej: 19.0 para 19%){table_note}
 
 JSON:
 """
         return prompt
     
-    async def extract_invoice_data(self, text: str) -> InvoiceResponse:
+    def create_chunk_prompt(self, text: str) -> str:
         """
-        Extrae datos de la factura usando GPT-4o
+        Prompt para los fragmentos siguientes al primero: solo ítems, impuestos y totales
         """
-        try:
-            # Crear prompt
-            prompt = self.create_extraction_prompt(text)
-            
-            # Llamada a OpenAI
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un experto en procesamiento de facturas electrónicas colombianas. Extrae información de manera precisa y devuelve solo JSON válido."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.1,
-                max_tokens=2000
-            )
+        return f"""
+Este texto es una parte (no la primera página) de una factura electrónica colombiana.
+Extrae únicamente los ítems que aparecen en este fragmento y, si están presentes, los
+impuestos y totales de la factura. Devuélvelo en formato JSON válido:
+
+TEXTO DEL FRAGMENTO:
+{text}
+
+{{
+{ITEMS_PROMPT}    "taxes": {{
+        "ica_percentage": porcentaje_ica_numérico,
+        "ica_amount": valor_ica_numérico,
+        "fuente_percentage": porcentaje_retefuente_numérico,
+        "fuente_amount": valor_retefuente_numérico,
+        "iva_percentage": porcentaje_iva_numérico,
+        "iva_amount": valor_iva_numérico
+    }},
+    "totals": {{
+        "subtotal": subtotal_total_numérico,
+        "discount_total": descuentos_total_numérico,
+        "tax_total": impuestos_total_numérico,
+        "retention_total": retenciones_total_numérico,
+        "total": total_final_numérico
+    }}
+}}
+
+INSTRUCCIONES IMPORTANTES:
+1. Devuelve SOLO el JSON válido, sin texto adicional
+2. Usa null en "taxes" y "totals" si no aparecen en este fragmento
+3. Convierte todos los valores monetarios a números (sin símbolos ni comas)
+4. Para porcentajes, usa el valor numérico (ej: 19.0 para 19%)
+
+JSON:
+"""
+    
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": "Eres un experto en procesamiento de facturas electrónicas colombianas. Extrae información de manera precisa y devuelve solo JSON válido."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    def _response_format(self, fields) -> Dict[str, Any]:
+        """
+        Parámetro response_format según OPENAI_RESPONSE_FORMAT
+        """
+        mode = settings.OPENAI_RESPONSE_FORMAT
+        if mode == "json_schema":
+            name = SCHEMA_NAMES[tuple(fields)]
+            if name not in self._schemas:
+                self._schemas[name] = build_extraction_schema(fields)
+            return {"response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": name, "schema": self._schemas[name], "strict": True}
+            }}
+        if mode == "json_object":
+            return {"response_format": {"type": "json_object"}}
+        return {}
+    
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """
+        Tokens que la llamada descuenta del límite por minuto: el proveedor
+        reserva el prompt más max_tokens al recibirla
+        """
+        return sum(count_tokens(m["content"]) for m in messages) + max_tokens
+    
+    async def _settle(self, estimated: int, usage):
+        """
+        Corrige en el planificador la estimación con el consumo que informa
+        el proveedor; sin usage se queda la estimación
+        """
+        used = getattr(usage, "total_tokens", None)
+        if used:
+            await self.scheduler.settle(estimated, used)
+    
+    async def _complete_json(
+        self,
+        prompt: str,
+        max_tokens: int = 2000,
+        fields=EXTRACTED_FIELDS,
+        priority: Priority = Priority.SYNC
+    ) -> Dict[str, Any]:
+        """
+        Llama al modelo y devuelve el JSON de la respuesta ya parseado. Si no
+        se puede parsear, reintenta como máximo OPENAI_REPAIR_RETRIES veces
+        pidiendo al modelo que corrija su propia respuesta.
+        """
+        messages = self._messages(prompt)
+        content = ""
+        for attempt in range(settings.OPENAI_REPAIR_RETRIES + 1):
+            estimated = self._estimate_tokens(messages, max_tokens)
+            # Llamada a OpenAI cuando el planificador le da turno dentro de la cuota
+            try:
+                with stage("llm"):
+                    response = await self.scheduler.run(
+                        lambda: self.client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=0.1,
+                            max_tokens=max_tokens,
+                            **self._response_format(fields)
+                        ),
+                        estimated,
+                        priority
+                    )
+            except Exception:
+                LLM_REQUESTS.inc(outcome="error")
+                raise
             
             # Obtener contenido de la respuesta
-            content = response.choices[0].message.content.strip()
+            content = (response.choices[0].message.content or "").strip()
             logger.info(f"Respuesta de OpenAI: {content[:200]}...")
+            data, error = self._parse_json(content)
+            usage = getattr(response, "usage", None)
+            tokens = _record_tokens(usage, content, messages)
+            await self._settle(estimated, usage)
+            completion_stats.record(tokens, failed=data is None, repair=attempt > 0)
+            if data is not None:
+                return data
             
+            logger.warning(f"Respuesta de OpenAI no parseable (intento {attempt + 1}): {error}")
+            messages = messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": REPAIR_PROMPT.format(error=error)}
+            ]
+        
+        logger.error(f"Contenido recibido: {content}")
+        raise json.JSONDecodeError(f"Respuesta no parseable tras {settings.OPENAI_REPAIR_RETRIES} reparaciones", content, 0)
+    
+    def _parse_json(self, content: str):
+        """
+        Devuelve (datos, None) o (None, descripción del error)
+        """
+        try:
             # Limpiar la respuesta (remover texto que no sea JSON)
-            json_content = self._extract_json_from_response(content)
+            data = json.loads(self._extract_json_from_response(content))
+        except json.JSONDecodeError as e:
+            return None, str(e)
+        if not isinstance(data, dict):
+            return None, "se esperaba un objeto JSON"
+        return data, None
+    
+    async def extract_invoice_data(
+        self,
+        text: str,
+        priority: Priority = Priority.SYNC,
+        items: Optional[List[Dict[str, Any]]] = None
+    ) -> InvoiceResponse:
+        """
+        Extrae datos de la factura usando GPT-4o. Si `items` trae las filas de
+        la tabla del PDF, el modelo solo extrae la cabecera, impuestos y totales.
+        """
+        try:
+            # Crear prompt y parsear el JSON devuelto por el modelo
+            prompt = self.create_extraction_prompt(text, table_items=items is not None)
+            fields = EXTRACTED_FIELDS if items is None else TABLE_FIELDS
+            extracted_data = await self._complete_json(prompt, fields=fields, priority=priority)
+            if items is not None:
+                extracted_data["items"] = items
+            return self._build_response(extracted_data, text)
             
-            # Parsear JSON
-            extracted_data = json.loads(json_content)
+        except LLMRateLimitError:
+            # El endpoint responde 503 con Retry-After en lugar de un error interno
+            ERRORS.inc(kind="llm_rate_limit")
+            raise
             
-            # Crear ID único para la factura
-            invoice_id = str(uuid.uuid4())
+        except json.JSONDecodeError as e:
+            ERRORS.inc(kind="llm_parse")
+            logger.error(f"Error parseando JSON de OpenAI: {str(e)}")
+            raise Exception(f"Error interpretando respuesta de IA: {str(e)}")
             
-            # Convertir a objeto InvoiceResponse
-            invoice_response = self._convert_to_invoice_response(extracted_data, invoice_id, text)
+        except Exception as e:
+            ERRORS.inc(kind="llm")
+            logger.error(f"Error en extracción con IA: {str(e)}")
+            raise Exception(f"Error procesando factura con IA: {str(e)}")
+    
+    async def stream_invoice_data(
+        self,
+        text: str,
+        priority: Priority = Priority.SYNC,
+        items: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[Tuple[str, Optional[str], Any]]:
+        """
+        Igual que extract_invoice_data pero consumiendo la respuesta en streaming.
+        Emite ("field", clave, valor) e ("item", None, ítem) a medida que el JSON
+        se cierra y, al final, ("result", None, InvoiceResponse). Los ítems de
+        la tabla del PDF (`items`) se emiten antes de llamar al modelo.
+        """
+        parser = IncrementalJSONParser()
+        try:
+            prompt = self.create_extraction_prompt(text, table_items=items is not None)
+            fields = EXTRACTED_FIELDS if items is None else TABLE_FIELDS
+            for item in items or []:
+                yield "item", None, item
+            usage = None
+            messages = self._messages(prompt)
             
-            # Calcular score de confianza
-            confidence_score = self._calculate_confidence_score(extracted_data, text)
-            invoice_response.confidence_score = confidence_score
+            def create():
+                return self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=2000,
+                    stream=True,
+                    # El último fragmento trae el consumo de tokens
+                    stream_options={"include_usage": True},
+                    **self._response_format(fields)
+                )
+            
+            # El hueco del planificador se conserva mientras se consume el stream
+            try:
+                with stage("llm"):
+                    estimated = self._estimate_tokens(messages, 2000)
+                    async with self.scheduler.slot(create, estimated, priority) as stream:
+                        async for chunk in stream:
+                            usage = getattr(chunk, "usage", None) or usage
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if delta:
+                                for event in parser.feed(delta):
+                                    yield event
+            except Exception:
+                LLM_REQUESTS.inc(outcome="error")
+                raise
             
-            logger.info(f"Factura procesada exitosamente: {invoice_id}")
-            return invoice_response
+            content = parser.text.strip()
+            logger.info(f"Respuesta de OpenAI (streaming): {content[:200]}...")
+            extracted_data, error = self._parse_json(content)
+            tokens = _record_tokens(usage, content, messages)
+            await self._settle(estimated, usage)
+            completion_stats.record(tokens, failed=extracted_data is None, repair=False)
+            if extracted_data is None:
+                # La respuesta en streaming se repara con una llamada normal
+                logger.warning(f"Respuesta en streaming no parseable: {error}")
+                extracted_data = await self._complete_json(prompt, fields=fields, priority=priority)
+            if items is not None:
+                extracted_data["items"] = items
+            yield "result", None, self._build_response(extracted_data, text)
+            
+        except LLMRateLimitError:
+            ERRORS.inc(kind="llm_rate_limit")
+            raise
             
         except json.JSONDecodeError as e:
+            ERRORS.inc(kind="llm_parse")
             logger.error(f"Error parseando JSON de OpenAI: {str(e)}")
-            logger.error(f"Contenido recibido: {content}")
+            logger.error(f"Contenido recibido: {parser.text}")
             raise Exception(f"Error interpretando respuesta de IA: {str(e)}")
             
         except Exception as e:
+            ERRORS.inc(kind="llm")
             logger.error(f"Error en extracción con IA: {str(e)}")
             raise Exception(f"Error procesando factura con IA: {str(e)}")
     
+    async def extract_invoice_chunks(
+        self,
+        chunks: List[str],
+        raw_text: str,
+        priority: Priority = Priority.SYNC
+    ) -> InvoiceResponse:
+        """
+        Extrae una factura larga por fragmentos de páginas en paralelo (map) y
+        combina los resultados parciales en una sola respuesta (reduce). El
+        tiempo total lo marca el fragmento más lento, no la suma de todos.
+        """
+        try:
+            prompts = [self.create_extraction_prompt(chunks[0])] + [
+                self.create_chunk_prompt(chunk) for chunk in chunks[1:]
+            ]
+            max_tokens = [2000] + [settings.EXTRACTION_CHUNK_MAX_OUTPUT_TOKENS] * (len(chunks) - 1)
+            partials = await asyncio.gather(*(
+                self._complete_json(prompt, limit, EXTRACTED_FIELDS if index == 0 else CHUNK_FIELDS, priority)
+                for index, (prompt, limit) in enumerate(zip(prompts, max_tokens))
+            ))
+            logger.info(f"Factura extraída en {len(chunks)} fragmentos")
+            return self._build_response(merge_partial_results(partials, chunks), raw_text)
+            
+        except LLMRateLimitError:
+            ERRORS.inc(kind="llm_rate_limit")
+            raise
+            
+        except json.JSONDecodeError as e:
+            ERRORS.inc(kind="llm_parse")
+            logger.error(f"Error parseando JSON de OpenAI: {str(e)}")
+            raise Exception(f"Error interpretando respuesta de IA: {str(e)}")
+            
+        except Exception as e:
+            ERRORS.inc(kind="llm")
+            logger.error(f"Error en extracción con IA: {str(e)}")
+            raise Exception(f"Error procesando factura con IA: {str(e)}")
+    
+    def _build_response(self, extracted_data: Dict[str, Any], text: str) -> InvoiceResponse:
+        # Crear ID único para la factura
+        invoice_id = str(uuid.uuid4())
+        
+        with stage("convert"):
+            # Convertir a objeto InvoiceResponse
+            invoice_response = self._convert_to_invoice_response(extracted_data, invoice_id, text)
+            
+            # Calcular score de confianza
+            confidence_score = self._calculate_confidence_score(extracted_data, text)
+            invoice_response.confidence_score = confidence_score
+        
+        logger.info(f"Factura procesada exitosamente: {invoice_id}")
+        return invoice_response
+    
     def _extract_json_from_response(self, content: str) -> str:
         """
         Extrae el JSON válido de la respuesta de OpenAI
@@ -167,106 +579,84 @@ JSON:
         
         # Como último recurso, devolver el contenido completo
         return content
-    
-    def _convert_to_invoice_response(self, data: Dict[str, Any], invoice_id: str, raw_text: str) -> InvoiceResponse:
-        """
-        Convierte los datos extraídos a InvoiceResponse
-        """
-        # Convertir supplier
-        supplier = None
-        if data.get('supplier'):
-            supplier = SupplierInfo(**data['supplier'])
-        
-        # Convertir items
-        items = []
-        if data.get('items'):
-            for item_data in data['items']:
-                # Validar y convertir valores numéricos
-                item_data = self._validate_numeric_fields(item_data, ['quantity', 'unit_price', 'discount_percentage', 'subtotal'])
-                items.append(InvoiceItem(**item_data))
-        
-        # Convertir taxes
-        taxes = None
-        if data.get('taxes'):
-            tax_data = self._validate_numeric_fields(data['taxes'], [
-                'ica_percentage', 'ica_amount', 'fuente_percentage', 'fuente_amount', 
-                'iva_percentage', 'iva_amount'
-            ])
-            taxes = TaxInfo(**tax_data)
-        
-        # Convertir totals
-        totals = None
-        if data.get('totals'):
-            total_data = self._validate_numeric_fields(data['totals'], [
-                'subtotal', 'discount_total', 'tax_total', 'retention_total', 'total'
-            ])
-            totals = InvoiceTotals(**total_data)
-        
-        # Crear respuesta
-        invoice_response = InvoiceResponse(
-            invoice_id=invoice_id,
-            document_type=data.get('document_type'),
-            series=data.get('series'),
-            number=data.get('number'),
-            issue_date=data.get('issue_date'),
-            due_date=data.get('due_date'),
-            supplier=supplier,
-            currency=data.get('currency', 'COP'),
-            items=items,
-            taxes=taxes,
-            totals=totals,
-            raw_text=raw_text[:1000] if raw_text else None  # Limitar texto crudo
-        )
-        
-        return invoice_response
-    
-    def _validate_numeric_fields(self, data: Dict[str, Any], numeric_fields: list) -> Dict[str, Any]:
-        """
-        Valida y convierte campos numéricos
-        """
-        for field in numeric_fields:
-            if field in data and data[field] is not None:
-                try:
-                    # Convertir a float si es string
-                    if isinstance(data[field], str):
-                        # Remover comas y espacios
-                        cleaned = data[field].replace(',', '').replace(' ', '')
-                        data[field] = float(cleaned) if cleaned else 0.0
-                    else:
-                        data[field] = float(data[field])
-                except (ValueError, TypeError):
-                    logger.warning(f"No se pudo convertir {field}: {data[field]} a número")
-                    data[field] = 0.0
-        
-        return data
-    
-    def _calculate_confidence_score(self, data: Dict[str, Any], text: str) -> float:
-        """
-        Calcula un score de confianza basado en la información extraída
-        """
-        score = 0.0
-        max_score = 10.0
-        
-        # Verificar campos obligatorios
-        if data.get('document_type'):
-            score += 1.0
-        if data.get('number'):
-            score += 1.5
-        if data.get('issue_date'):
-            score += 1.0
-        if data.get('supplier', {}).get('name'):
-            score += 1.5
-        if data.get('totals', {}).get('total'):
-            score += 2.0
-        if data.get('items') and len(data['items']) > 0:
-            score += 2.0
-        if data.get('currency'):
-            score += 0.5
-        if data.get('taxes'):
-            score += 0.5
-        
-        # Normalizar a 0-1
-        confidence = min(score / max_score, 1.0)
-        
-        logger.info(f"Score de confianza calculado: {confidence:.2f}")
-        return round(confidence, 2)
+
+def _item_key(item: Dict[str, Any]):
+    description = " ".join(str(item.get("description") or "").lower().split())
+    return description, item.get("quantity"), item.get("unit_price"), item.get("subtotal")
+
+def _row_in_text(item: Dict[str, Any], text: str) -> bool:
+    """
+    La descripción completa del ítem aparece en el texto del fragmento
+    """
+    description = " ".join(str(item.get("description") or "").lower().split())
+    if not description:
+        return False
+    pattern = r"(?<!\w)" + r"\s+".join(re.escape(word) for word in description.split()) + r"(?!\w)"
+    return re.search(pattern, text.lower()) is not None
+
+def merge_partial_results(partials: List[Dict[str, Any]], chunks: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Combina los resultados por fragmento de forma determinista:
+    - cabecera y proveedor del primer fragmento
+    - ítems de todos los fragmentos en orden. Los fragmentos no se solapan:
+      el primer ítem de un fragmento que repite el último del anterior solo
+      se descarta si su fila está partida entre páginas, es decir, si su
+      descripción no aparece completa en el texto del fragmento (`chunks`).
+      Dos filas iguales a ambos lados del corte (el mismo producto facturado
+      dos veces) se conservan, y también si no se conoce el texto.
+    - impuestos y totales campo a campo, del último fragmento que los trae
+    """
+    merged = dict(partials[0])
+    items = list(merged.get("items") or [])
+    taxes = dict(merged.get("taxes") or {})
+    totals = dict(merged.get("totals") or {})
+
+    for index, partial in enumerate(partials[1:], start=1):
+        chunk_items = list(partial.get("items") or [])
+        # Como mucho una fila (la del corte) puede estar partida entre dos fragmentos
+        if (
+            chunks is not None
+            and items and chunk_items
+            and _item_key(items[-1]) == _item_key(chunk_items[0])
+            and not _row_in_text(chunk_items[0], chunks[index])
+        ):
+            chunk_items = chunk_items[1:]
+        items.extend(chunk_items)
+        for target, source in ((taxes, partial.get("taxes")), (totals, partial.get("totals"))):
+            for field, value in (source or {}).items():
+                if value is not None:
+                    target[field] = value
+
+    merged["items"] = items
+    merged["taxes"] = taxes
+    merged["totals"] = totals
+    return merged
+
+# Extractor compartido durante la vida de la aplicación (reutiliza conexiones)
+_shared_extractor: Optional[AIExtractor] = None
+
+def get_ai_extractor() -> AIExtractor:
+    """
+    Devuelve el extractor compartido, creándolo si aún no existe
+    """
+    global _shared_extractor
+    if _shared_extractor is None:
+        _shared_extractor = AIExtractor()
+    return _shared_extractor
+
+def init_ai_extractor():
+    """
+    Crea el extractor compartido al arrancar (si OpenAI está configurado)
+    """
+    if not settings.OPENAI_API_KEY:
+        logger.warning("OPENAI_API_KEY no configurada; el cliente de OpenAI no se inicializa")
+        return
+    get_ai_extractor()
+    logger.info("Cliente de OpenAI inicializado con pool de conexiones compartido")
+
+async def close_ai_extractor():
+    global _shared_extractor
+    if _shared_extractor is not None:
+        await _shared_extractor.client.close()
+        _shared_extractor = None
+    await close_llm_scheduler()
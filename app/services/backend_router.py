@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos al guardar
+    fcntl = None
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Backends de texto en el orden por defecto: pdfplumber conserva mejor la estructura
+BACKENDS = ("pdfplumber", "pypdf2")
+
+# Peso de la última medida en la media móvil de segundos por página
+LATENCY_ALPHA = 0.2
+
+def producer_family(metadata: Dict[str, Any]) -> str:
+    """
+    Familia del generador del PDF a partir de Producer (o Creator), sin
+    versiones ni símbolos: "iText® 5.5.13 ©2000-2018 iText Group NV" -> "itext group"
+    """
+    name = str(metadata.get("Producer") or metadata.get("Creator") or "").lower()
+    name = re.sub(r"\(.*?\)|[^\w\s]", " ", name)
+    words = [word for word in name.split() if not any(char.isdigit() for char in word)]
+    return " ".join(list(dict.fromkeys(words))[:2]) or "unknown"
+
+class BackendStats:
+    """Intentos, éxitos y latencia por página de un backend para una familia"""
+
+    def __init__(self, attempts: int = 0, successes: int = 0, seconds_per_page: float = 0.0):
+        self.attempts = attempts
+        self.successes = successes
+        self.seconds_per_page = seconds_per_page
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.attempts if self.attempts else 0.0
+
+    def add(self, seconds_per_page: float, ok: bool):
+        self.seconds_per_page = seconds_per_page if not self.attempts else (
+            LATENCY_ALPHA * seconds_per_page + (1 - LATENCY_ALPHA) * self.seconds_per_page
+        )
+        self.attempts += 1
+        self.successes += int(ok)
+
+    def merge(self, other: "BackendStats"):
+        """
+        Suma los intentos de `other` (p. ej. de otro proceso); su latencia pesa
+        como si sus intentos se hubieran añadido uno a uno con add
+        """
+        if not other.attempts:
+            return
+        weight = 1 - (1 - LATENCY_ALPHA) ** other.attempts if self.attempts else 1.0
+        self.seconds_per_page = weight * other.seconds_per_page + (1 - weight) * self.seconds_per_page
+        self.attempts += other.attempts
+        self.successes += other.successes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"attempts": self.attempts, "successes": self.successes, "seconds_per_page": self.seconds_per_page}
+
+Families = Dict[str, Dict[str, BackendStats]]
+
+def _merge_families(target: Families, source: Families):
+    for family, backends in source.items():
+        stats = target.setdefault(family, {})
+        for backend, backend_stats in backends.items():
+            stats.setdefault(backend, BackendStats()).merge(backend_stats)
+
+def _trim_families(families: Families, keep: Optional[str] = None):
+    """
+    Olvida las familias con menos datos (salvo `keep`) por encima de BACKEND_MAX_FAMILIES
+    """
+    while len(families) > settings.BACKEND_MAX_FAMILIES:
+        rarest = min(
+            (f for f in families if f != keep),
+            key=lambda f: sum(s.attempts for s in families[f].values())
+        )
+        del families[rarest]
+
+class BackendRouter:
+    """
+    Elige el orden de los backends de texto por familia de generador del PDF.
+
+    Con suficientes muestras va primero el backend más rápido entre los que
+    dan texto útil de forma fiable; mientras falten muestras se usa el orden
+    por defecto y, con probabilidad `explore_rate`, se prueba primero el
+    backend con menos datos. Las estadísticas se guardan en un JSON para
+    sobrevivir a los reinicios; cada proceso (API, workers) suma al archivo
+    solo los intentos que registró desde su último guardado.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        min_samples: Optional[int] = None,
+        explore_rate: Optional[float] = None,
+        reliability: Optional[float] = None,
+        rng: Optional[random.Random] = None
+    ):
+        self.path = path
+        self.min_samples = settings.BACKEND_MIN_SAMPLES if min_samples is None else min_samples
+        self.explore_rate = settings.BACKEND_EXPLORE_RATE if explore_rate is None else explore_rate
+        self.reliability = settings.BACKEND_RELIABILITY if reliability is None else reliability
+        self.rng = rng or random.Random()
+        self._families: Families = {}
+        # Intentos registrados en este proceso que aún no están en el archivo
+        self._pending: Families = {}
+        self._save_task: Optional[asyncio.Task] = None
+        self._saved_at = time.monotonic()
+        if path:
+            self._families = self._read()
+            if self._families:
+                logger.info(f"Estadísticas de backends cargadas: {len(self._families)} familias")
+
+    def _read(self) -> Families:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+            return {
+                family: {backend: BackendStats(**stats) for backend, stats in backends.items() if backend in BACKENDS}
+                for family, backends in data.get("families", {}).items()
+            }
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"No se pudieron leer las estadísticas de backends ({self.path}): {str(e)}")
+            return {}
+
+    def _write(self, pending: Families) -> Families:
+        """
+        Suma `pending` a lo que hay en el archivo (otros procesos también lo
+        actualizan) y lo reemplaza de forma atómica (archivo temporal +
+        rename). Devuelve las estadísticas guardadas.
+        """
+        with open(f"{self.path}.lock", "a") as lock:
+            if fcntl is not None:
+                # Sin el bloqueo, dos procesos leerían lo mismo y el último pisaría al otro
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            stored = self._read()
+            _merge_families(stored, pending)
+            _trim_families(stored)
+            descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                    json.dump({
+                        "families": {
+                            family: {backend: stats.to_dict() for backend, stats in backends.items()}
+                            for family, backends in stored.items()
+                        }
+                    }, file)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+        return stored
+
+    def _take_pending(self) -> Families:
+        pending, self._pending = self._pending, {}
+        self._saved_at = time.monotonic()
+        return pending
+
+    def _saved(self, stored: Families):
+        # Lo guardado ya incluye lo de otros procesos; faltan los intentos registrados mientras tanto
+        _merge_families(stored, self._pending)
+        self._families = stored
+
+    def _save_failed(self, pending: Families, error: Exception):
+        logger.warning(f"No se pudieron guardar las estadísticas de backends: {str(error)}")
+        _merge_families(pending, self._pending)
+        self._pending = pending
+
+    async def save(self):
+        """
+        Guarda los intentos pendientes en un hilo, sin bloquear el event loop
+        """
+        if not self.path or not self._pending:
+            return
+        pending = self._take_pending()
+        try:
+            stored = await asyncio.to_thread(self._write, pending)
+        except OSError as e:
+            self._save_failed(pending, e)
+            return
+        self._saved(stored)
+
+    def _save_blocking(self):
+        pending = self._take_pending()
+        try:
+            self._saved(self._write(pending))
+        except OSError as e:
+            self._save_failed(pending, e)
+
+    def _schedule_save(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sin event loop (PDFProcessor síncrono) se guarda en este mismo hilo
+            self._save_blocking()
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self.save())
+
+    def order(self, family: str, explore: bool = False) -> List[str]:
+        """
+        Orden en que probar los backends para una familia
+        """
+        stats = self._families.get(family, {})
+        sampled = {backend: stats[backend] for backend in BACKENDS if backend in stats}
+        if explore:
+            undersampled = [b for b in BACKENDS if b not in sampled or sampled[b].attempts < self.min_samples]
+            if undersampled and len(undersampled) < len(BACKENDS):
+                return undersampled[:1] + [b for b in BACKENDS if b != undersampled[0]]
+        known = {b: s for b, s in sampled.items() if s.attempts >= self.min_samples}
+        reliable = [b for b, s in known.items() if s.success_rate >= self.reliability]
+        if reliable:
+            first = min(reliable, key=lambda b: known[b].seconds_per_page)
+        elif known:
+            # Ninguno es fiable todavía: primero el que más veces dio texto útil
+            first = max(BACKENDS, key=lambda b: known[b].success_rate if b in known else -1.0)
+        else:
+            first = BACKENDS[0]
+        return [first] + [b for b in BACKENDS if b != first]
+
+    def routes(self) -> Dict[str, List[str]]:
+        """
+        Tabla familia -> orden para los trabajos del pool (solo las que difieren del defecto)
+        """
+        if not settings.BACKEND_ROUTING:
+            return {}
+        explore = self.rng.random() < self.explore_rate
+        table = {family: self.order(family, explore) for family in self._families}
+        return {family: order for family, order in table.items() if tuple(order) != BACKENDS}
+
+    def record(self, family: str, attempts: Sequence[Dict[str, Any]], num_pages: int):
+        """
+        Registra los intentos de extracción de un documento (backend, seconds, ok)
+        """
+        if not settings.BACKEND_ROUTING or not attempts:
+            return
+        stats = self._families.setdefault(family, {})
+        pending = self._pending.setdefault(family, {})
+        for attempt in attempts:
+            seconds_per_page = attempt["seconds"] / max(num_pages, 1)
+            stats.setdefault(attempt["backend"], BackendStats()).add(seconds_per_page, attempt["ok"])
+            pending.setdefault(attempt["backend"], BackendStats()).add(seconds_per_page, attempt["ok"])
+        # Se olvida la familia con menos datos (salvo la que acaba de llegar)
+        _trim_families(self._families, keep=family)
+        if self.path and time.monotonic() - self._saved_at >= settings.BACKEND_STATS_SAVE_INTERVAL:
+            self._schedule_save()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            family: {
+                "order": self.order(family),
+                **{backend: stats.to_dict() for backend, stats in backends.items()}
+            }
+            for family, backends in self._families.items()
+        }
+
+# Instancia compartida por el proceso del API
+backend_router = BackendRouter(settings.BACKEND_STATS_PATH)
@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.core.metrics import stage
+from app.services.backend_router import BACKENDS, producer_family
+from app.services.pdf_processor import MIN_TEXT_CHARS, ParsedDocument
+from app.services.prompt_compactor import compact_pages, chunk_pages
+from app.services.rules_extractor import rules_extractor
+from app.services.table_extractor import find_item_table
+
+logger = logging.getLogger(__name__)
+
+# Segundos de margen sobre el timeout del trabajo: la alarma del worker debe actuar primero
+TIMEOUT_MARGIN = 5
+
+class ExtractionTimeoutError(Exception):
+    """El trabajo de extracción superó el tiempo máximo permitido"""
+
+class _JobTimeout(BaseException):
+    """
+    Se lanza dentro del worker cuando vence la alarma. Hereda de BaseException
+    para que los `except Exception` de PDFProcessor no lo absorban.
+    """
+
+def _on_alarm(signum, frame):
+    raise _JobTimeout()
+
+def _run_with_deadline(func: Callable, timeout: float, *args) -> Any:
+    """
+    Ejecuta `func` dentro del worker con una alarma que corta PDFs patológicos
+    """
+    use_alarm = timeout > 0 and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    except _JobTimeout:
+        raise ExtractionTimeoutError(f"La extracción superó {timeout} segundos")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _open_document(source: Union[bytes, str]) -> ParsedDocument:
+    return ParsedDocument(source) if isinstance(source, bytes) else ParsedDocument.from_path(source)
+
+def _spill(data: bytes) -> str:
+    """
+    Vuelca el PDF a un archivo temporal y devuelve su ruta
+    """
+    descriptor, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(data)
+    return path
+
+def _merge_timings(result: Dict[str, Any], parts: List[Dict[str, Any]]):
+    """
+    Suma al resultado el tiempo de CPU por etapa de los otros procesos que intervinieron
+    """
+    timings = result["timings"]
+    for part in parts:
+        for name, elapsed in part["timings"].items():
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def page_ranges(num_pages: int, parts: int) -> List[Tuple[int, int]]:
+    """
+    Divide las páginas en `parts` rangos contiguos [inicio, fin) de tamaño parecido
+    """
+    parts = max(1, min(parts, num_pages))
+    size, extra = divmod(num_pages, parts)
+    ranges = []
+    start = 0
+    for index in range(parts):
+        stop = start + size + (1 if index < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def extract_pages_job(source: Union[bytes, str], start: int, stop: int) -> Dict[str, Any]:
+    """
+    Trabajo ejecutado en el worker: texto de las páginas [start, stop) de un PDF grande
+    """
+    document = _open_document(source)
+    with document:
+        with stage("pdfplumber", document.timings):
+            pages = document.page_texts(start, stop)
+        return {"pages": pages, "layouts": document.page_layouts(start, stop), "timings": document.timings}
+
+def extract_pdf_job(
+    source: Union[bytes, str],
+    split_min_pages: int = 0,
+    page_texts: Optional[List[str]] = None,
+    routes: Optional[Dict[str, List[str]]] = None,
+    page_layouts: Optional[List[list]] = None
+) -> Dict[str, Any]:
+    """
+    Trabajo ejecutado en el worker: parsea el PDF una vez, lo valida y extrae su texto.
+    `source` son los bytes del PDF o la ruta de un archivo volcado a disco.
+
+    Si el PDF tiene al menos `split_min_pages` páginas devuelve solo
+    {"split": True, ...} con los datos del documento para que el texto se
+    extraiga por rangos en paralelo. `page_texts` (y la posición de sus líneas
+    en `page_layouts`) son textos de página ya extraídos, p. ej. por el OCR.
+    `routes` es la tabla familia de generador -> orden de backends del
+    enrutador del proceso principal; los intentos vuelven en `backend_attempts`.
+    """
+    document = _open_document(source)
+    timings = document.timings
+    with document:
+        if not document.is_valid:
+            return {"valid": False, "text": "", "prompt_text": "", "num_pages": 0, "metadata": {}, "timings": timings}
+        if page_texts is not None:
+            document.preload_page_texts(page_texts, page_layouts)
+        family = producer_family(document.metadata)
+        order = (routes or {}).get(family, BACKENDS)
+        probe = document.probe(order)
+        if probe.backend is None:
+            # Escaneado o vacío: se descarta con el muestreo, sin recorrer el resto de páginas
+            return {
+                "valid": True, "text": "", "prompt_text": "", "num_pages": document.num_pages,
+                "metadata": document.metadata, "pdf_kind": probe.kind, "timings": timings
+            }
+        # El reparto por rangos es de pdfplumber; si el enrutador prefiere PyPDF2 no hace falta
+        if (
+            page_texts is None
+            and split_min_pages
+            and probe.backend == "pdfplumber"
+            and document.num_pages >= split_min_pages
+        ):
+            return {
+                "valid": True, "split": True, "num_pages": document.num_pages, "metadata": document.metadata,
+                "pdf_kind": probe.kind, "producer_family": family, "timings": timings,
+                # Las páginas muestreadas ya están extraídas: los rangos empiezan después
+                "probe_pages": document.page_texts(0, probe.sampled_pages),
+                "probe_layouts": document.page_layouts(0, probe.sampled_pages),
+                # El intento de pdfplumber se completa con el tiempo de los rangos
+                "backend_attempts": document.backend_attempts + [
+                    {"backend": "pdfplumber", "seconds": document.sample_seconds("pdfplumber"), "ok": True}
+                ]
+            }
+        text = document.extract_text(order)
+        result = {
+            "valid": True,
+            "text": text,
+            "prompt_text": text,
+            "num_pages": document.num_pages,
+            "metadata": document.metadata,
+            "pdf_kind": probe.kind,
+            # Medidas en el worker; el proceso principal las registra
+            "timings": timings,
+            "text_backend": document.text_backend,
+            "producer_family": family,
+            "backend_attempts": document.backend_attempts
+        }
+        # Las páginas (y su layout) solo se conocen si el texto viene de pdfplumber;
+        # con PyPDF2 no se vuelve a parsear el documento con pdfplumber
+        if document.text_backend == "pdfplumber":
+            layouts = document.page_layouts() if settings.TABLE_EXTRACTION else None
+            return finish_extraction(result, document.page_texts(), layouts)
+        return finish_extraction(result, [text])
+
+def finish_extraction(
+    result: Dict[str, Any],
+    pages: List[str],
+    page_layouts: Optional[List[list]] = None
+) -> Dict[str, Any]:
+    """
+    Prepara el texto extraído (`result["text"]`) para el modelo: tabla de
+    ítems, compactación, fragmentos y reglas. No necesita el documento, así
+    que sirve tanto en el worker como en el proceso principal tras unir los
+    rangos de páginas. `page_layouts` es None si el texto no salió de pdfplumber.
+    """
+    text = result["text"]
+    timings = result["timings"]
+    table = None
+    if settings.TABLE_EXTRACTION and page_layouts is not None:
+        with stage("tables", timings):
+            table = find_item_table(page_layouts)
+        if table is not None and not table.consistent_with(text):
+            logger.info("La suma de la tabla de ítems no coincide con el subtotal; se descarta")
+            table = None
+    if table is not None:
+        # Las filas ya están estructuradas: el modelo solo recibe un resumen de la tabla
+        result["table_items"] = table.items
+        pages = table.strip_rows(pages)
+        result["prompt_text"] = "".join(page + "\n" for page in pages if page)
+    truncated = 0
+    if settings.PROMPT_COMPACTION:
+        with stage("compaction", timings):
+            compaction = compact_pages(pages)
+        result["prompt_text"] = compaction.text
+        result["prompt_tokens"] = (compaction.original_tokens, compaction.tokens)
+        truncated = compaction.truncated_lines
+    # Sin las filas de ítems el texto cabe en una llamada: no hace falta repartirlo
+    if settings.EXTRACTION_CHUNKING and len(pages) > 1 and table is None:
+        with stage("chunking", timings):
+            chunks = chunk_pages(pages)
+        if len(chunks) > 1:
+            # Los fragmentos llevan el texto completo: lo recortado por el presupuesto no se pierde
+            result["prompt_chunks"] = chunks
+            truncated = 0
+    if truncated:
+        # Una sola llamada con el texto recortado (una página o sin fragmentos): se avisa
+        logger.warning(f"El texto del prompt supera el presupuesto: {truncated} líneas omitidas")
+        result["prompt_truncated_lines"] = truncated
+    if settings.RULES_FAST_PATH:
+        try:
+            with stage("rules", timings):
+                result["rules_result"] = rules_extractor.extract(text, result.get("table_items")).model_dump()
+        except Exception as e:
+            logger.warning(f"Extractor por reglas falló: {str(e)}")
+    return result
+
+class ExtractionPool:
+    """Pool de procesos para ejecutar el parseo de PDFs fuera del event loop"""
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = None,
+        job_timeout: Optional[float] = None
+    ):
+        self.max_workers = max_workers or settings.PDF_POOL_SIZE
+        self.max_tasks_per_child = max_tasks_per_child or settings.PDF_POOL_MAX_TASKS_PER_CHILD
+        self.job_timeout = job_timeout if job_timeout is not None else settings.PDF_JOB_TIMEOUT
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_child
+            )
+            logger.info(f"Pool de extracción iniciado con {self.max_workers} procesos")
+        return self._executor
+
+    def _recycle(self, executor: ProcessPoolExecutor):
+        """
+        Descarta `executor` terminando sus procesos (último recurso cuando un
+        worker no responde a la alarma, p. ej. bloqueado en código C). Si ya se
+        reemplazó por otro pool no hace nada: el nuevo tiene trabajos sanos.
+        """
+        if executor is not self._executor:
+            return
+        self._executor = None
+        # ProcessPoolExecutor no expone una forma pública de matar un worker colgado
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
+        # Sin cancelar: los trabajos pendientes reciben BrokenProcessPool y se reintentan
+        executor.shutdown(wait=False)
+        logger.warning("Pool de extracción reciclado tras un trabajo colgado")
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta `func(*args)` en el pool con límite de tiempo por trabajo. Si
+        otro trabajo obliga a reciclar el pool, este se reenvía una vez al
+        pool nuevo: solo falla el trabajo que se colgó.
+        """
+        timeout = self.job_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executor()
+            future = loop.run_in_executor(executor, _run_with_deadline, func, timeout, *args)
+            try:
+                return await asyncio.wait_for(future, timeout + TIMEOUT_MARGIN if timeout > 0 else None)
+            except asyncio.TimeoutError:
+                self._recycle(executor)
+                raise ExtractionTimeoutError(f"La extracción superó {timeout} segundos")
+            except BrokenProcessPool:
+                self._recycle(executor)
+                if attempt:
+                    raise
+                logger.warning("Trabajo de extracción interrumpido por el reciclado del pool; se reintenta")
+
+    async def extract(
+        self,
+        source: Union[bytes, str],
+        routes: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Valida y extrae el texto de un PDF (bytes o ruta) en un proceso del pool.
+        Los PDFs de PDF_PARALLEL_MIN_PAGES páginas o más se reparten por rangos
+        de páginas entre los procesos (salvo las ya muestreadas) y se unen en
+        orden en otro trabajo del pool, fuera del event loop. `routes` es la
+        tabla de orden de backends por familia de generador (BackendRouter.routes).
+        """
+        split_min_pages = settings.PDF_PARALLEL_MIN_PAGES if self.max_workers > 1 else 0
+        result = await self.run(extract_pdf_job, source, split_min_pages, None, routes)
+        if not result.get("split"):
+            return result
+
+        # Los rangos leen el PDF de disco en lugar de recibir una copia de los bytes cada uno
+        spilled = await asyncio.to_thread(_spill, source) if isinstance(source, bytes) else None
+        try:
+            sampled = len(result["probe_pages"])
+            remaining = result["num_pages"] - sampled
+            ranges = [(start + sampled, stop + sampled) for start, stop in page_ranges(remaining, self.max_workers)]
+            logger.info(f"Extrayendo {remaining} páginas en {len(ranges)} rangos en paralelo")
+            parts = await asyncio.gather(*(
+                self.run(extract_pages_job, spilled or source, start, stop) for start, stop in ranges
+            )) if remaining > 0 else []
+            page_texts = result.pop("probe_pages") + [page_text for part in parts for page_text in part["pages"]]
+            page_layouts = result.pop("probe_layouts") + [layout for part in parts for layout in part["layouts"]]
+            text = "".join(page_text + "\n" for page_text in page_texts if page_text)
+            ranges_seconds = sum(part["timings"].get("pdfplumber", 0.0) for part in parts)
+            if len(text.strip()) <= MIN_TEXT_CHARS:
+                # Sin texto de pdfplumber hace falta el documento para probar PyPDF2
+                final = await self.run(extract_pdf_job, spilled or source, 0, page_texts, routes, page_layouts)
+                for attempt in final.get("backend_attempts", []):
+                    if attempt["backend"] == "pdfplumber":
+                        # Su intento fue el muestreo y los rangos, no la relectura de los textos ya extraídos
+                        attempt["seconds"] += result["backend_attempts"][-1]["seconds"] + ranges_seconds
+                _merge_timings(final, [result] + parts)
+                return final
+        finally:
+            if spilled:
+                Path(spilled).unlink(missing_ok=True)
+
+        result.pop("split")
+        result.update({
+            "text": text,
+            "prompt_text": text,
+            "text_backend": "pdfplumber"
+        })
+        # El muestreo y los rangos son todo el coste de pdfplumber
+        result["backend_attempts"][-1]["seconds"] += ranges_seconds
+        _merge_timings(result, parts)
+        # La tabla, la compactación y las reglas son CPU: en el proceso del API
+        # retendrían el GIL y pararían el event loop
+        return await self.run(
+            finish_extraction, result, page_texts, page_layouts if settings.TABLE_EXTRACTION else None
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+# Instancia compartida por los endpoints
+extraction_pool = ExtractionPool()
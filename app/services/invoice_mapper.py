@@ -0,0 +1,115 @@
+import logging
+from typing import Dict, Any
+
+from app.schemas.invoice import InvoiceResponse, SupplierInfo, InvoiceItem, TaxInfo, InvoiceTotals
+
+logger = logging.getLogger(__name__)
+
+class InvoiceDataMapper:
+    """Convierte el diccionario extraído (por IA o por reglas) a InvoiceResponse"""
+    
+    def _convert_to_invoice_response(self, data: Dict[str, Any], invoice_id: str, raw_text: str) -> InvoiceResponse:
+        """
+        Convierte los datos extraídos a InvoiceResponse
+        """
+        # Convertir supplier
+        supplier = None
+        if data.get('supplier'):
+            supplier = SupplierInfo(**data['supplier'])
+        
+        # Convertir items
+        items = []
+        if data.get('items'):
+            for item_data in data['items']:
+                if not item_data:
+                    continue
+                # Validar y convertir valores numéricos
+                item_data = self._validate_numeric_fields(item_data, ['quantity', 'unit_price', 'discount_percentage', 'subtotal'])
+                items.append(InvoiceItem(**item_data))
+        
+        # Convertir taxes
+        taxes = None
+        if data.get('taxes'):
+            tax_data = self._validate_numeric_fields(data['taxes'], [
+                'ica_percentage', 'ica_amount', 'fuente_percentage', 'fuente_amount', 
+                'iva_percentage', 'iva_amount'
+            ])
+            taxes = TaxInfo(**tax_data)
+        
+        # Convertir totals
+        totals = None
+        if data.get('totals'):
+            total_data = self._validate_numeric_fields(data['totals'], [
+                'subtotal', 'discount_total', 'tax_total', 'retention_total', 'total'
+            ])
+            totals = InvoiceTotals(**total_data)
+        
+        # Crear respuesta
+        invoice_response = InvoiceResponse(
+            invoice_id=invoice_id,
+            document_type=data.get('document_type'),
+            series=data.get('series'),
+            number=data.get('number'),
+            issue_date=data.get('issue_date'),
+            due_date=data.get('due_date'),
+            supplier=supplier,
+            currency=data.get('currency') or 'COP',
+            items=items,
+            taxes=taxes,
+            totals=totals,
+            raw_text=raw_text[:1000] if raw_text else None  # Limitar texto crudo
+        )
+        
+        return invoice_response
+    
+    def _validate_numeric_fields(self, data: Dict[str, Any], numeric_fields: list) -> Dict[str, Any]:
+        """
+        Valida y convierte campos numéricos
+        """
+        for field in numeric_fields:
+            if field in data and data[field] is not None:
+                try:
+                    # Convertir a float si es string
+                    if isinstance(data[field], str):
+                        # Remover comas y espacios
+                        cleaned = data[field].replace(',', '').replace(' ', '')
+                        data[field] = float(cleaned) if cleaned else 0.0
+                    else:
+                        data[field] = float(data[field])
+                except (ValueError, TypeError):
+                    logger.warning(f"No se pudo convertir {field}: {data[field]} a número")
+                    data[field] = 0.0
+        
+        return data
+    
+    def _calculate_confidence_score(self, data: Dict[str, Any], text: str) -> float:
+        """
+        Calcula un score de confianza basado en la información extraída
+        """
+        score = 0.0
+        max_score = 10.0
+        
+        # Verificar campos obligatorios
+        if data.get('document_type'):
+            score += 1.0
+        if data.get('number'):
+            score += 1.5
+        if data.get('issue_date'):
+            score += 1.0
+        # Con structured outputs los objetos anidados pueden venir como null
+        if (data.get('supplier') or {}).get('name'):
+            score += 1.5
+        if (data.get('totals') or {}).get('total'):
+            score += 2.0
+        if any(data.get('items') or []):
+            score += 2.0
+        if data.get('currency'):
+            score += 0.5
+        if data.get('taxes'):
+            score += 0.5
+        
+        # Normalizar a 0-1
+        confidence = min(score / max_score, 1.0)
+        
+        logger.info(f"Score de confianza calculado: {confidence:.2f}")
+        return round(confidence, 2)
@@ -0,0 +1,298 @@
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.core.metrics import (
+    stage, record_stages, CACHE_REQUESTS, COALESCED_REQUESTS, PDF_TEXT_BACKEND, EXTRACTION_METHOD, ERRORS,
+    LLM_PROMPT_TRUNCATED
+)
+from app.database.repository import invoice_writer
+from app.schemas.invoice import InvoiceResponse
+from app.services.ai_extractor import get_ai_extractor, EXTRACTED_FIELDS
+from app.services.backend_router import backend_router
+from app.services.extraction_pool import extraction_pool, ExtractionTimeoutError
+from app.services.llm_scheduler import Priority
+from app.services.ocr import ocr_service
+from app.services.pdf_processor import has_pdf_header
+from app.services.result_cache import result_cache
+from app.services.single_flight import single_flight, flight_lock
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentError(Exception):
+    """El PDF no es válido o no tiene texto suficiente (no tiene sentido reintentar)"""
+
+async def _persist(invoice_data: InvoiceResponse):
+    """
+    Guarda la factura en la base de datos; un fallo no pierde la respuesta al cliente
+    """
+    if not settings.PERSIST_INVOICES:
+        return
+    try:
+        with stage("persist"):
+            await invoice_writer.save(invoice_data)
+    except Exception as e:
+        logger.error(f"No se pudo guardar la factura {invoice_data.invoice_id}: {str(e)}")
+
+async def _extract_document(source: Union[bytes, str]) -> Dict[str, Any]:
+    """
+    Valida y extrae el texto del PDF en el pool de procesos
+    """
+    logger.info("Validando y extrayendo texto del PDF...")
+    if not has_pdf_header(source):
+        # Lo que no es un PDF se rechaza sin pasar por el pool
+        ERRORS.inc(kind="invalid_pdf")
+        raise DocumentError("El archivo PDF está corrupto o no es válido")
+    try:
+        # Incluye la espera por un proceso libre y el paso de datos entre procesos
+        with stage("extraction_pool"):
+            extraction = await extraction_pool.extract(source, backend_router.routes())
+    except ExtractionTimeoutError as e:
+        ERRORS.inc(kind="timeout")
+        raise DocumentError(f"El PDF tardó demasiado en procesarse: {str(e)}")
+
+    if extraction.get("pdf_kind") == "scanned" and not extraction["text"] and ocr_service.enabled:
+        logger.info("PDF escaneado: extrayendo texto con OCR...")
+        try:
+            extraction = await ocr_service.extract(source, extraction)
+        except ExtractionTimeoutError as e:
+            ERRORS.inc(kind="timeout")
+            raise DocumentError(f"El OCR del PDF tardó demasiado: {str(e)}")
+        except Exception as e:
+            # Sin OCR la factura se rechaza como escaneada, igual que con OCR desactivado
+            ERRORS.inc(kind="ocr")
+            logger.error(f"Error en el OCR: {str(e)}")
+
+    record_stages(extraction.get("timings", {}))
+    if extraction.get("backend_attempts"):
+        backend_router.record(extraction["producer_family"], extraction["backend_attempts"], extraction["num_pages"])
+    if extraction.get("text_backend"):
+        PDF_TEXT_BACKEND.inc(backend=extraction["text_backend"])
+    if not extraction["valid"]:
+        ERRORS.inc(kind="invalid_pdf")
+        raise DocumentError("El archivo PDF está corrupto o no es válido")
+
+    extracted_text = extraction["text"]
+    if extraction.get("pdf_kind") == "scanned" and not extraction["text"]:
+        ERRORS.inc(kind="scanned")
+        raise DocumentError("El PDF parece escaneado: sus primeras páginas son imágenes sin texto extraíble")
+    if not extracted_text or len(extracted_text.strip()) < 50:
+        ERRORS.inc(kind="no_text")
+        raise DocumentError("No se pudo extraer texto suficiente del PDF")
+
+    logger.info(f"Texto extraído: {len(extracted_text)} caracteres")
+    if "prompt_tokens" in extraction:
+        original_tokens, prompt_tokens = extraction["prompt_tokens"]
+        logger.info(f"Texto compactado para el prompt: {original_tokens} -> {prompt_tokens} tokens")
+    return extraction
+
+def _rules_result(extraction: Dict[str, Any]) -> Optional[InvoiceResponse]:
+    """
+    Resultado del extractor por reglas si su confianza alcanza el umbral
+    """
+    rules_result = extraction.get("rules_result")
+    if (
+        settings.RULES_FAST_PATH
+        and rules_result
+        and rules_result["confidence_score"] >= settings.RULES_CONFIDENCE_THRESHOLD
+    ):
+        invoice_data = InvoiceResponse(**rules_result)
+        logger.info(f"Factura extraída por reglas (confianza {invoice_data.confidence_score:.2f})")
+        return invoice_data
+    return None
+
+def _text_notes(extraction: Dict[str, Any]) -> List[str]:
+    """
+    Notas sobre el texto extraído del PDF
+    """
+    notes = [f"Texto extraído: {len(extraction['text'])} caracteres"]
+    skipped = extraction.get("ocr_skipped_pages")
+    if skipped:
+        notes.append(f"OCR limitado a {extraction['num_pages'] - skipped} de {extraction['num_pages']} páginas (OCR_MAX_PAGES)")
+    return notes
+
+def _prompt_notes(extraction: Dict[str, Any]) -> List[str]:
+    """
+    Notas sobre el texto que recibe el modelo en una sola llamada
+    """
+    notes = []
+    table_items = extraction.get("table_items")
+    if table_items:
+        notes.append(f"Ítems leídos de la tabla del PDF ({len(table_items)} filas)")
+    truncated = extraction.get("prompt_truncated_lines")
+    if truncated:
+        LLM_PROMPT_TRUNCATED.inc()
+        notes.append(f"Texto recortado para el modelo: {truncated} líneas omitidas (PROMPT_MAX_INPUT_TOKENS)")
+    return notes
+
+async def _cached(cache_key: str) -> Optional[InvoiceResponse]:
+    with stage("cache_lookup"):
+        cached = await result_cache.get(cache_key)
+    CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        logger.info(f"Resultado servido desde caché: {cached.invoice_id}")
+        cached.processing_notes = ["cache_hit"]
+    return cached
+
+async def _store(cache_key: str, invoice_data: InvoiceResponse, notes: List[str]) -> InvoiceResponse:
+    await result_cache.set(cache_key, invoice_data)
+    await _persist(invoice_data)
+    invoice_data.processing_notes = notes
+    return invoice_data
+
+async def _run_pipeline(source: Union[bytes, str], cache_key: str, priority: Priority) -> InvoiceResponse:
+    """
+    Extracción de texto e IA (o reglas) y guardado del resultado
+    """
+    extraction = await _extract_document(source)
+    extracted_text = extraction["text"]
+    notes = _text_notes(extraction)
+
+    invoice_data = _rules_result(extraction)
+    if invoice_data is not None:
+        # Factura regular: las reglas bastan y no se paga la llamada al modelo
+        notes += ["Extraído por reglas (sin IA)"] + (invoice_data.processing_notes or [])
+        EXTRACTION_METHOD.inc(method="rules")
+    else:
+        # Procesar con IA (el modelo recibe el texto compactado; raw_text conserva el original)
+        logger.info("Procesando con IA...")
+        ai_extractor = get_ai_extractor()
+        chunks = extraction.get("prompt_chunks")
+        if chunks and settings.EXTRACTION_CHUNKING:
+            invoice_data = await ai_extractor.extract_invoice_chunks(chunks, extracted_text, priority)
+            notes.append(f"Extraído por IA en {len(chunks)} fragmentos")
+            EXTRACTION_METHOD.inc(method="llm_chunks")
+        else:
+            table_items = extraction.get("table_items")
+            invoice_data = await ai_extractor.extract_invoice_data(
+                extraction["prompt_text"] or extracted_text, priority, table_items
+            )
+            notes += _prompt_notes(extraction)
+            EXTRACTION_METHOD.inc(method="llm_table" if table_items else "llm")
+        invoice_data.raw_text = extracted_text[:1000]
+    return await _store(cache_key, invoice_data, notes)
+
+async def _run_exclusive(source: Union[bytes, str], cache_key: str, priority: Priority) -> InvoiceResponse:
+    """
+    Ejecuta el pipeline con el candado distribuido de la clave, si está configurado
+    """
+    if flight_lock is None:
+        return await _run_pipeline(source, cache_key, priority)
+    async with flight_lock.hold(cache_key) as waited:
+        if waited:
+            # Otro worker acaba de procesar la misma factura: su resultado ya debería estar en caché
+            cached = await _cached(cache_key)
+            if cached is not None:
+                COALESCED_REQUESTS.inc(scope="redis")
+                return cached
+        return await _run_pipeline(source, cache_key, priority)
+
+async def process_document(
+    source: Union[bytes, str],
+    cache_key: str,
+    priority: Priority = Priority.SYNC
+) -> InvoiceResponse:
+    """
+    Ejecuta el pipeline completo para un PDF: caché, extracción de texto e IA.
+    Lo comparten los endpoints HTTP y los workers de la cola de trabajos;
+    `priority` es el carril de las llamadas al modelo. Las peticiones
+    idénticas en curso comparten una sola extracción.
+    """
+    cached = await _cached(cache_key)
+    if cached is not None:
+        return cached
+
+    invoice_data, shared = await single_flight.do(cache_key, lambda: _run_exclusive(source, cache_key, priority))
+    # Cada llamador recibe su copia: los endpoints modifican processing_notes
+    invoice_data = invoice_data.model_copy(deep=True)
+    if shared:
+        logger.info(f"Petición idéntica en curso; se comparte su resultado: {invoice_data.invoice_id}")
+        COALESCED_REQUESTS.inc(scope="process")
+        invoice_data.processing_notes = (invoice_data.processing_notes or []) + ["coalesced"]
+    return invoice_data
+
+def _field_events(invoice_data: InvoiceResponse):
+    """
+    Eventos de campo de un resultado ya completo (caché, reglas o fragmentos)
+    """
+    for name, value in invoice_data.model_dump(include=set(EXTRACTED_FIELDS)).items():
+        yield "field", name, value
+
+async def stream_document(source: Union[bytes, str], cache_key: str) -> AsyncIterator[Tuple[str, Optional[str], Any]]:
+    """
+    Variante de process_document que emite los campos a medida que están
+    disponibles: ("field", clave, valor), ("item", None, ítem) y al final
+    ("result", None, InvoiceResponse).
+    """
+    cached = await _cached(cache_key)
+    if cached is not None:
+        for event in _field_events(cached):
+            yield event
+        yield "result", None, cached
+        return
+
+    flight = single_flight.lead(cache_key)
+    if flight is None:
+        # Ya se está extrayendo la misma factura: se espera ese resultado en lugar de repetirla
+        invoice_data = await process_document(source, cache_key)
+        for event in _field_events(invoice_data):
+            yield event
+        yield "result", None, invoice_data
+        return
+
+    # Las peticiones idénticas que lleguen mientras tanto (stream o no) esperan este resultado
+    try:
+        invoice_data = None
+        async for event in _stream_pipeline(source, cache_key):
+            if event[0] == "result":
+                invoice_data = event[2]
+            else:
+                yield event
+        flight.set_result(invoice_data)
+    except Exception as e:
+        flight.set_exception(e)
+        raise
+    finally:
+        if not flight.done():
+            # El cliente se desconectó: los que esperaban repiten la extracción
+            flight.cancel()
+    # Copia propia, como en process_document: el endpoint modifica processing_notes
+    yield "result", None, invoice_data.model_copy(deep=True)
+
+async def _stream_pipeline(source: Union[bytes, str], cache_key: str) -> AsyncIterator[Tuple[str, Optional[str], Any]]:
+    """
+    Extracción en streaming de stream_document, sin caché ni coalescencia
+    """
+    extraction = await _extract_document(source)
+    extracted_text = extraction["text"]
+    notes = _text_notes(extraction)
+
+    invoice_data = _rules_result(extraction)
+    chunks = extraction.get("prompt_chunks")
+    if invoice_data is not None:
+        notes += ["Extraído por reglas (sin IA)"] + (invoice_data.processing_notes or [])
+        EXTRACTION_METHOD.inc(method="rules")
+        for event in _field_events(invoice_data):
+            yield event
+    elif chunks and settings.EXTRACTION_CHUNKING:
+        # Los fragmentos se combinan al final: no hay campos parciales que adelantar
+        invoice_data = await get_ai_extractor().extract_invoice_chunks(chunks, extracted_text)
+        notes.append(f"Extraído por IA en {len(chunks)} fragmentos")
+        EXTRACTION_METHOD.inc(method="llm_chunks")
+        for event in _field_events(invoice_data):
+            yield event
+    else:
+        logger.info("Procesando con IA (streaming)...")
+        table_items = extraction.get("table_items")
+        notes += _prompt_notes(extraction)
+        EXTRACTION_METHOD.inc(method="llm_table" if table_items else "llm")
+        async for event in get_ai_extractor().stream_invoice_data(
+            extraction["prompt_text"] or extracted_text, items=table_items
+        ):
+            if event[0] == "result":
+                invoice_data = event[2]
+            else:
+                yield event
+    invoice_data.raw_text = extracted_text[:1000]
+    yield "result", None, await _store(cache_key, invoice_data, notes)
@@ -0,0 +1,540 @@
+import asyncio
+import logging
+import random
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class JobState:
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    TERMINAL = (COMPLETED, FAILED)
+
+@dataclass
+class Job:
+    """Trabajo reclamado por un worker"""
+    id: str
+    filename: str
+    cache_key: str
+    attempts: int
+    max_attempts: int
+    payload: bytes
+
+def retry_delay(attempts: int) -> float:
+    """
+    Backoff exponencial con jitter para el reintento número `attempts`
+    """
+    delay = min(settings.JOB_RETRY_BACKOFF * (2 ** max(attempts - 1, 0)), settings.JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+class JobQueue(ABC):
+    """
+    Cola durable de trabajos con almacén de estado.
+
+    Un trabajo reclamado con `dequeue` queda invisible durante el visibility
+    timeout; si el worker muere sin confirmarlo, vuelve a estar disponible.
+    """
+
+    @abstractmethod
+    async def enqueue(self, payload: bytes, filename: str, cache_key: str) -> str:
+        """
+        Encola un trabajo y devuelve su ID
+        """
+
+    @abstractmethod
+    async def enqueue_unique(self, payload: bytes, filename: str, cache_key: str) -> Tuple[str, bool]:
+        """
+        Encola salvo que ya haya un trabajo pendiente o en curso con el mismo
+        `cache_key`; devuelve (ID del trabajo, si se creó uno nuevo)
+        """
+
+    @abstractmethod
+    async def dequeue(self) -> Optional[Job]:
+        """
+        Reclama el siguiente trabajo disponible, o None si no hay ninguno
+        """
+
+    @abstractmethod
+    async def extend(self, job_id: str):
+        """
+        Renueva el visibility timeout de un trabajo en curso
+        """
+
+    @abstractmethod
+    async def complete(self, job_id: str, result: str):
+        """
+        Marca el trabajo como completado con su resultado
+        """
+
+    @abstractmethod
+    async def fail(self, job_id: str, error: str, retry: bool = True):
+        """
+        Marca un intento fallido: reprograma con backoff o falla definitivamente
+        """
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Estado del trabajo: state, filename, attempts, result, error, timestamps
+        """
+
+    @abstractmethod
+    def watch(self) -> AsyncIterator[str]:
+        """
+        Flujo de IDs de trabajos cuyo estado cambió (uno por proceso del API)
+        """
+
+    async def close(self):
+        pass
+
+class SQLiteJobQueue(JobQueue):
+    """Cola local sobre un archivo SQLite (un solo host, varios procesos)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            self._create_schema(conn)
+            self._initialized = True
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                filename TEXT,
+                cache_key TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                visible_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                result TEXT,
+                error TEXT,
+                payload BLOB
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (state, visible_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_updated ON jobs (updated_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_cache_key ON jobs (cache_key, state)")
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, payload: bytes, filename: str, cache_key: str) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        conn.execute(
+            "INSERT INTO jobs (id, state, filename, cache_key, max_attempts, visible_at, created_at, updated_at, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, JobState.QUEUED, filename, cache_key, settings.JOB_MAX_ATTEMPTS, now, now, now, payload)
+        )
+        return job_id
+
+    def _enqueue(self, payload: bytes, filename: str, cache_key: str) -> str:
+        with closing(self._connect()) as conn:
+            return self._insert(conn, payload, filename, cache_key)
+
+    def _enqueue_unique(self, payload: bytes, filename: str, cache_key: str) -> Tuple[str, bool]:
+        with closing(self._connect()) as conn:
+            # BEGIN IMMEDIATE serializa la comprobación y la inserción entre procesos
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE cache_key = ? AND state IN (?, ?) LIMIT 1",
+                (cache_key, JobState.QUEUED, JobState.PROCESSING)
+            ).fetchone()
+            job_id = row["id"] if row is not None else self._insert(conn, payload, filename, cache_key)
+            conn.execute("COMMIT")
+        return job_id, row is None
+
+    @staticmethod
+    def _purge(conn: sqlite3.Connection, now: float):
+        # Como el expire de Redis: los trabajos terminados se guardan JOB_RESULT_TTL
+        conn.execute(
+            "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+            (JobState.COMPLETED, JobState.FAILED, now - settings.JOB_RESULT_TTL)
+        )
+
+    def _dequeue(self) -> Optional[Job]:
+        conn = self._connect()
+        try:
+            while True:
+                now = time.time()
+                # BEGIN IMMEDIATE serializa el reclamo entre procesos
+                conn.execute("BEGIN IMMEDIATE")
+                self._purge(conn, now)
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE state IN (?, ?) AND visible_at <= ? ORDER BY visible_at LIMIT 1",
+                    (JobState.QUEUED, JobState.PROCESSING, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["attempts"] >= row["max_attempts"]:
+                    # Reclamado tras vencer el visibility timeout en su último intento
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, error = ?, payload = NULL, updated_at = ? WHERE id = ?",
+                        (JobState.FAILED, row["error"] or "Visibility timeout agotado", now, row["id"])
+                    )
+                    conn.execute("COMMIT")
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET state = ?, attempts = attempts + 1, visible_at = ?, updated_at = ? WHERE id = ?",
+                    (JobState.PROCESSING, now + settings.JOB_VISIBILITY_TIMEOUT, now, row["id"])
+                )
+                conn.execute("COMMIT")
+                return Job(
+                    id=row["id"],
+                    filename=row["filename"],
+                    cache_key=row["cache_key"],
+                    attempts=row["attempts"] + 1,
+                    max_attempts=row["max_attempts"],
+                    payload=row["payload"]
+                )
+        finally:
+            conn.close()
+
+    def _execute(self, query: str, params: tuple):
+        with closing(self._connect()) as conn:
+            conn.execute(query, params)
+
+    def _complete(self, job_id: str, result: str):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = NULL, payload = NULL, updated_at = ? WHERE id = ?",
+                (JobState.COMPLETED, result, now, job_id)
+            )
+            self._purge(conn, now)
+            conn.execute("COMMIT")
+
+    def _fail(self, job_id: str, error: str, retry: bool):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            # BEGIN IMMEDIATE: la lectura de intentos y la actualización no se intercalan con un reclamo
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return
+            if retry and row["attempts"] < row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, error = ?, visible_at = ?, updated_at = ? WHERE id = ?",
+                    (JobState.QUEUED, error, now + retry_delay(row["attempts"]), now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, error = ?, payload = NULL, updated_at = ? WHERE id = ?",
+                    (JobState.FAILED, error, now, job_id)
+                )
+            conn.execute("COMMIT")
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id, state, filename, attempts, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    async def enqueue(self, payload: bytes, filename: str, cache_key: str) -> str:
+        return await asyncio.to_thread(self._enqueue, payload, filename, cache_key)
+
+    async def enqueue_unique(self, payload: bytes, filename: str, cache_key: str) -> Tuple[str, bool]:
+        return await asyncio.to_thread(self._enqueue_unique, payload, filename, cache_key)
+
+    async def dequeue(self) -> Optional[Job]:
+        return await asyncio.to_thread(self._dequeue)
+
+    async def extend(self, job_id: str):
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET visible_at = ? WHERE id = ? AND state = ?",
+            (time.time() + settings.JOB_VISIBILITY_TIMEOUT, job_id, JobState.PROCESSING)
+        )
+
+    async def complete(self, job_id: str, result: str):
+        await asyncio.to_thread(self._complete, job_id, result)
+
+    async def fail(self, job_id: str, error: str, retry: bool = True):
+        await asyncio.to_thread(self._fail, job_id, error, retry)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    def _changed_since(self, since: float):
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT id, updated_at FROM jobs WHERE updated_at > ? ORDER BY updated_at",
+                (since,)
+            ).fetchall()
+
+    async def watch(self) -> AsyncIterator[str]:
+        # Una sola consulta por intervalo, sin importar cuántos clientes esperen
+        since = time.time()
+        while True:
+            await asyncio.sleep(settings.JOB_WATCH_INTERVAL)
+            for row in await asyncio.to_thread(self._changed_since, since):
+                since = max(since, row["updated_at"])
+                yield row["id"]
+
+# Reclama atómicamente el siguiente trabajo visible y lo oculta durante el visibility timeout
+_REDIS_CLAIM = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #ids == 0 then
+    return false
+end
+local id = ids[1]
+redis.call('ZADD', KEYS[1], ARGV[2], id)
+local key = ARGV[3] .. id
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'state', 'processing', 'updated_at', ARGV[1])
+redis.call('PUBLISH', ARGV[4], id)
+return id
+"""
+
+# Reserva el índice del cache_key para un trabajo nuevo salvo que apunte a uno pendiente o en curso
+_REDIS_RESERVE = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local state = redis.call('HGET', ARGV[2] .. current, 'state')
+    -- Sin estado: el trabajo se está creando en este momento
+    if not state or (state ~= 'completed' and state ~= 'failed') then
+        return current
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return ARGV[1]
+"""
+
+class RedisJobQueue(JobQueue):
+    """Cola compartida entre máquinas usando Redis"""
+
+    def __init__(self, url: str, prefix: str = "jobs:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise Exception("El backend de trabajos 'redis' requiere el paquete redis")
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self.ready_key = f"{prefix}ready"
+        self.events_channel = f"{prefix}events"
+        self._claim = self.client.register_script(_REDIS_CLAIM)
+        self._reserve = self.client.register_script(_REDIS_RESERVE)
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}{job_id}"
+
+    async def enqueue(self, payload: bytes, filename: str, cache_key: str) -> str:
+        job_id = str(uuid.uuid4())
+        await self._push(job_id, payload, filename, cache_key)
+        return job_id
+
+    async def enqueue_unique(self, payload: bytes, filename: str, cache_key: str) -> Tuple[str, bool]:
+        job_id = str(uuid.uuid4())
+        reserved = await self._reserve(
+            keys=[f"{self.prefix}active:{cache_key}"],
+            args=[job_id, self.prefix, settings.JOB_RESULT_TTL]
+        )
+        reserved = reserved.decode()
+        if reserved != job_id:
+            return reserved, False
+        await self._push(job_id, payload, filename, cache_key)
+        return job_id, True
+
+    async def _push(self, job_id: str, payload: bytes, filename: str, cache_key: str):
+        now = time.time()
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_key(job_id), mapping={
+                "id": job_id,
+                "state": JobState.QUEUED,
+                "filename": filename,
+                "cache_key": cache_key,
+                "attempts": 0,
+                "max_attempts": settings.JOB_MAX_ATTEMPTS,
+                "created_at": now,
+                "updated_at": now
+            })
+            pipe.set(f"{self._job_key(job_id)}:payload", payload)
+            pipe.zadd(self.ready_key, {job_id: now})
+            await pipe.execute()
+
+    async def dequeue(self) -> Optional[Job]:
+        while True:
+            now = time.time()
+            job_id = await self._claim(
+                keys=[self.ready_key],
+                args=[now, now + settings.JOB_VISIBILITY_TIMEOUT, self.prefix, self.events_channel]
+            )
+            if not job_id:
+                return None
+            job_id = job_id.decode()
+            data = await self.client.hgetall(self._job_key(job_id))
+            attempts = int(data.get(b"attempts", 0))
+            max_attempts = int(data.get(b"max_attempts", settings.JOB_MAX_ATTEMPTS))
+            if attempts > max_attempts:
+                # Reclamado tras vencer el visibility timeout en su último intento
+                await self._mark_failed(job_id, (data.get(b"error") or b"Visibility timeout agotado").decode())
+                continue
+            payload = await self.client.get(f"{self._job_key(job_id)}:payload")
+            return Job(
+                id=job_id,
+                filename=data.get(b"filename", b"").decode(),
+                cache_key=data.get(b"cache_key", b"").decode(),
+                attempts=attempts,
+                max_attempts=max_attempts,
+                payload=payload or b""
+            )
+
+    async def extend(self, job_id: str):
+        await self.client.zadd(self.ready_key, {job_id: time.time() + settings.JOB_VISIBILITY_TIMEOUT}, xx=True)
+
+    async def _finish(self, job_id: str, fields: Dict[str, Any]):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.ready_key, job_id)
+            pipe.hset(self._job_key(job_id), mapping={**fields, "updated_at": time.time()})
+            pipe.delete(f"{self._job_key(job_id)}:payload")
+            pipe.expire(self._job_key(job_id), settings.JOB_RESULT_TTL)
+            pipe.publish(self.events_channel, job_id)
+            await pipe.execute()
+
+    async def _mark_failed(self, job_id: str, error: str):
+        await self._finish(job_id, {"state": JobState.FAILED, "error": error})
+
+    async def complete(self, job_id: str, result: str):
+        await self._finish(job_id, {"state": JobState.COMPLETED, "result": result, "error": ""})
+
+    async def fail(self, job_id: str, error: str, retry: bool = True):
+        attempts, max_attempts = await self.client.hmget(self._job_key(job_id), "attempts", "max_attempts")
+        attempts = int(attempts or 0)
+        if retry and attempts < int(max_attempts or 0):
+            now = time.time()
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.hset(self._job_key(job_id), mapping={"state": JobState.QUEUED, "error": error, "updated_at": now})
+                pipe.zadd(self.ready_key, {job_id: now + retry_delay(attempts)})
+                pipe.publish(self.events_channel, job_id)
+                await pipe.execute()
+        else:
+            await self._mark_failed(job_id, error)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.client.hgetall(self._job_key(job_id))
+        if not data:
+            return None
+        data = {key.decode(): value.decode() for key, value in data.items()}
+        return {
+            "id": data["id"],
+            "state": data["state"],
+            "filename": data.get("filename"),
+            "attempts": int(data.get("attempts", 0)),
+            "result": data.get("result") or None,
+            "error": data.get("error") or None,
+            "created_at": float(data["created_at"]),
+            "updated_at": float(data["updated_at"])
+        }
+
+    async def watch(self) -> AsyncIterator[str]:
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.events_channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"].decode()
+        finally:
+            await pubsub.aclose()
+
+    async def close(self):
+        await self.client.aclose()
+
+class JobWatcher:
+    """
+    Despierta a los clientes que esperan cambios de estado de un trabajo.
+
+    Todas las esperas del proceso comparten un único flujo `JobQueue.watch`,
+    así miles de long-polls o streams SSE no multiplican las consultas.
+    """
+
+    def __init__(self, queue: JobQueue):
+        self.queue = queue
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                async for job_id in self.queue.watch():
+                    for waiter in self._waiters.pop(job_id, ()):
+                        if not waiter.done():
+                            waiter.set_result(None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error observando cambios de trabajos: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def wait_for_change(self, job_id: str, state: Optional[str], timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve el trabajo cuando su estado difiere de `state` o es terminal;
+        si vence `timeout`, devuelve el estado actual sin cambios
+        """
+        self._ensure_running()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Registrar la espera antes de leer evita perder un cambio intermedio
+            waiter = loop.create_future()
+            self._waiters.setdefault(job_id, set()).add(waiter)
+            try:
+                job = await self.queue.get(job_id)
+                remaining = deadline - loop.time()
+                if job is None or job["state"] != state or job["state"] in JobState.TERMINAL or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                waiters = self._waiters.get(job_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[job_id]
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+def create_job_queue() -> JobQueue:
+    """
+    Crea la cola configurada en JOB_BACKEND (sqlite o redis)
+    """
+    if settings.JOB_BACKEND.lower() == "redis":
+        return RedisJobQueue(settings.REDIS_URL)
+    return SQLiteJobQueue(settings.JOB_SQLITE_PATH)
+
+# Instancias compartidas por los endpoints y los workers
+job_queue = create_job_queue()
+job_watcher = JobWatcher(job_queue)
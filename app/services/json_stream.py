@@ -0,0 +1,112 @@
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class IncrementalJSONParser:
+    """
+    Parser incremental para el objeto JSON que devuelve el modelo en streaming.
+
+    Recibe el texto por fragmentos y emite cada campo de primer nivel en cuanto
+    su valor se cierra: ("field", clave, valor). Dentro del arreglo "items"
+    emite además cada ítem al cerrarse: ("item", None, ítem). El texto previo
+    al primer '{' (p. ej. ```json) se ignora.
+    """
+
+    def __init__(self, item_key: str = "items"):
+        self.item_key = item_key
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # Estado dentro del objeto raíz: key, colon, value, in_value, comma
+        self._expect = "key"
+        self._key: Optional[str] = None
+        self._key_start = 0
+        self._value_start = 0
+        self._item_start = 0
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[str, Optional[str], Any]]:
+        events: List[Tuple[str, Optional[str], Any]] = []
+        self._text += chunk
+        text = self._text
+        i = self._pos
+        while i < len(text) and not self.done:
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key":
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._expect = "colon"
+            elif self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._expect = "key"
+            elif self._depth == 1 and self._expect == "key":
+                if char == '"':
+                    self._in_string = True
+                    self._key_start = i
+                elif char == "}":
+                    self._depth = 0
+                    self.done = True
+            elif self._depth == 1 and self._expect == "colon":
+                if char == ":":
+                    self._expect = "value"
+            elif self._depth == 1 and self._expect == "value":
+                if not char.isspace():
+                    self._value_start = i
+                    self._expect = "in_value"
+                    continue  # se vuelve a procesar el carácter como parte del valor
+            elif self._depth == 1 and self._expect == "comma":
+                if char == ",":
+                    self._expect = "key"
+                elif char == "}":
+                    self._depth = 0
+                    self.done = True
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 3 and char == "{" and self._key == self.item_key:
+                    self._item_start = i
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 2 and char == "}" and self._key == self.item_key:
+                    events.append(("item", None, self._loads(text[self._item_start:i + 1])))
+                elif self._depth == 1:
+                    events.append(("field", self._key, self._loads(text[self._value_start:i + 1])))
+                    self._expect = "comma"
+                elif self._depth == 0:
+                    # Cierre del objeto raíz justo después de un valor escalar
+                    events.append(("field", self._key, self._loads(text[self._value_start:i].strip())))
+                    self.done = True
+            elif self._depth == 1 and char == ",":
+                # Fin de un valor escalar (número, cadena, true/false/null)
+                events.append(("field", self._key, self._loads(text[self._value_start:i].strip())))
+                self._expect = "key"
+            i += 1
+        self._pos = i
+        return [event for event in events if event[2] is not _INVALID]
+
+    @staticmethod
+    def _loads(fragment: str) -> Any:
+        try:
+            return json.loads(fragment)
+        except json.JSONDecodeError:
+            logger.warning(f"Fragmento JSON inválido en streaming: {fragment[:100]}")
+            return _INVALID
+
+# Marcador para valores que no se pudieron parsear (no se emiten)
+_INVALID = object()
@@ -0,0 +1,424 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+import openai
+
+from app.core.config import settings
+from app.core.metrics import LLM_QUEUE_SECONDS, LLM_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+# Errores transitorios del proveedor que se reintentan con backoff
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class Priority(IntEnum):
+    """Carriles de prioridad: un número menor se atiende antes"""
+    SYNC = 0    # /process y /process-stream: hay un cliente esperando la respuesta
+    BATCH = 1   # /batch
+    ASYNC = 2   # trabajos de la cola (/process-async)
+
+class LLMRateLimitError(Exception):
+    """El proveedor siguió limitando tras los reintentos o se agotó la espera en cola"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """
+    Cubo de tokens que se rellena de forma continua a `per_minute` por minuto.
+    La capacidad limita la ráfaga a `burst_seconds` de cuota (el proveedor
+    aplica el límite en fracciones de minuto, no por minuto); una petición
+    mayor que la capacidad espera al cubo lleno y lo deja en deuda, así que el
+    ritmo a largo plazo nunca supera el límite. `per_minute <= 0` = sin límite.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 1.0):
+        self.per_minute = per_minute
+        self.capacity = max(1.0, per_minute * burst_seconds / 60)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Segundos hasta poder consumir `amount`
+        """
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def consume(self, amount: float, now: float):
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens -= amount
+
+class RateBuckets(ABC):
+    """
+    Cubos de peticiones/minuto y tokens/minuto de la cuenta de OpenAI. El
+    límite es de la cuenta: todos los procesos que llaman al modelo (API y
+    workers) deben compartir los mismos cubos.
+    """
+
+    @abstractmethod
+    async def take(self, tokens: int) -> float:
+        """
+        Consume una petición y `tokens` si ambos cubos tienen saldo y devuelve
+        0; si no, no consume nada y devuelve los segundos de espera
+        """
+
+    @abstractmethod
+    async def adjust(self, tokens: int):
+        """
+        Corrige el cubo de tokens en `tokens` (negativo = devolución)
+        """
+
+    async def close(self):
+        pass
+
+class MemoryRateBuckets(RateBuckets):
+    """Cubos del proceso: sirven si un solo proceso llama al modelo"""
+
+    def __init__(self, rpm: float, tpm: float, burst_seconds: float = 1.0):
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+
+    async def take(self, tokens: int) -> float:
+        now = time.monotonic()
+        delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if delay <= 0:
+            self.requests.consume(1, now)
+            self.tokens.consume(tokens, now)
+        return delay
+
+    async def adjust(self, tokens: int):
+        self.tokens.consume(tokens, time.monotonic())
+
+# Los dos cubos en un hash con el reloj de Redis: el mismo saldo para todos los procesos
+_REDIS_BUCKETS = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rpm, tpm, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local amount = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated')
+local updated = tonumber(state[3]) or now
+local function refill(current, per_minute)
+    local capacity = math.max(1, per_minute * burst / 60)
+    local level = tonumber(current) or capacity
+    return math.min(capacity, level + (now - updated) * per_minute / 60), capacity
+end
+local requests = refill(state[1], rpm)
+local tokens, token_capacity = refill(state[2], tpm)
+local wait = 0
+if ARGV[5] == 'take' then
+    if rpm > 0 then
+        wait = math.max(wait, (1 - requests) * 60 / rpm)
+    end
+    if tpm > 0 then
+        wait = math.max(wait, (math.min(amount, token_capacity) - tokens) * 60 / tpm)
+    end
+    if wait > 0 then
+        return tostring(wait)
+    end
+    requests = requests - 1
+end
+tokens = tokens - amount
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+return '0'
+"""
+
+class RedisRateBuckets(RateBuckets):
+    """
+    Cubos compartidos en Redis entre el API y los workers (de una o varias
+    máquinas). Si Redis falla se usan los del proceso para no cortar las llamadas.
+    """
+
+    def __init__(self, url: str, rpm: float, tpm: float, burst_seconds: float = 1.0, prefix: str = "llm-rate:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise Exception("El backend de límites 'redis' requiere el paquete redis")
+        self.client = redis.from_url(url)
+        self.key = f"{prefix}{settings.OPENAI_MODEL}"
+        self.limits = (rpm, tpm, burst_seconds)
+        self.fallback = MemoryRateBuckets(rpm, tpm, burst_seconds)
+        self._script = None
+
+    async def _call(self, tokens: int, mode: str) -> float:
+        rpm, tpm, burst = self.limits
+        # Un cubo inactivo más de un minuto está lleno: la clave puede caducar
+        ttl = int(max(burst, 1)) + 60
+        if self._script is None:
+            self._script = self.client.register_script(_REDIS_BUCKETS)
+        result = await self._script(keys=[self.key], args=[rpm, tpm, burst, tokens, mode, ttl])
+        return float(result)
+
+    async def take(self, tokens: int) -> float:
+        rpm, tpm, _ = self.limits
+        if rpm <= 0 and tpm <= 0:
+            return 0.0
+        try:
+            return await self._call(tokens, "take")
+        except Exception as e:
+            logger.warning(f"Error en los límites compartidos de OpenAI; se usan los del proceso: {str(e)}")
+            return await self.fallback.take(tokens)
+
+    async def adjust(self, tokens: int):
+        if self.limits[1] <= 0:
+            return
+        try:
+            await self._call(tokens, "adjust")
+        except Exception as e:
+            logger.warning(f"Error ajustando los límites compartidos de OpenAI: {str(e)}")
+
+    async def close(self):
+        await self.client.aclose()
+
+def create_rate_buckets(rpm: float, tpm: float, burst_seconds: float) -> RateBuckets:
+    """
+    Crea los cubos configurados en OPENAI_RATE_BACKEND (memory o redis)
+    """
+    if settings.OPENAI_RATE_BACKEND.lower() == "redis":
+        return RedisRateBuckets(settings.REDIS_URL, rpm, tpm, burst_seconds)
+    return MemoryRateBuckets(rpm, tpm, burst_seconds)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Segundos indicados por el proveedor en retry-after-ms / retry-after
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # retry-after también puede ser una fecha HTTP; se usa el backoff propio
+        return None
+    return None
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        # Sin saldo no hay espera que lo arregle
+        return error.status_code in RETRYABLE_STATUS and getattr(error, "code", None) != "insufficient_quota"
+    return False
+
+class LLMScheduler:
+    """
+    Planificador central de las llamadas al modelo.
+
+    Cada llamada espera en su carril de prioridad hasta que hay un hueco de
+    concurrencia y los cubos de peticiones/minuto y tokens/minuto tienen
+    saldo; dentro de un carril el orden es de llegada. Los cubos descuentan
+    una estimación que se corrige con el consumo real (`settle`). Un 429
+    pausa a todas las llamadas durante el Retry-After, y los errores
+    transitorios se reintentan con backoff exponencial con jitter.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        burst_seconds: Optional[float] = None,
+        buckets: Optional[RateBuckets] = None
+    ):
+        self.buckets = buckets or create_rate_buckets(
+            settings.OPENAI_RPM_LIMIT if rpm is None else rpm,
+            settings.OPENAI_TPM_LIMIT if tpm is None else tpm,
+            settings.OPENAI_RATE_BURST_SECONDS if burst_seconds is None else burst_seconds
+        )
+        self.max_concurrency = max_concurrency or settings.OPENAI_MAX_CONCURRENCY
+        self.max_retries = settings.OPENAI_MAX_RETRIES if max_retries is None else max_retries
+        self.queue_timeout = settings.OPENAI_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.in_flight = 0
+        self._waiters: List[list] = []
+        self._order = itertools.count()
+        self._blocked_until = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _event(self) -> asyncio.Event:
+        # Los eventos de asyncio quedan ligados a un loop; se recrean si cambia
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _notify(self):
+        event = self._event()
+        self._changed = asyncio.Event()
+        event.set()
+
+    def pause(self, seconds: float):
+        """
+        Detiene todas las llamadas nuevas durante `seconds` (Retry-After de un 429)
+        """
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int, priority: Priority = Priority.SYNC, order: Optional[int] = None):
+        """
+        Espera turno para una llamada de `tokens` tokens estimados
+        """
+        start = time.monotonic()
+        waiter = [int(priority), next(self._order) if order is None else order, tokens]
+        heapq.heappush(self._waiters, waiter)
+        try:
+            while True:
+                now = time.monotonic()
+                delay: Optional[float] = None
+                if self._waiters[0] is waiter and self.in_flight < self.max_concurrency:
+                    delay = self._blocked_until - now
+                    if delay <= 0:
+                        # El hueco se reserva mientras se consulta el cubo (en Redis es una espera)
+                        self.in_flight += 1
+                        try:
+                            delay = await self.buckets.take(tokens)
+                        except BaseException:
+                            self.in_flight -= 1
+                            raise
+                        if delay <= 0:
+                            self._waiters.remove(waiter)
+                            heapq.heapify(self._waiters)
+                            LLM_QUEUE_SECONDS.observe(time.monotonic() - start, priority=priority.name.lower())
+                            self._notify()
+                            return
+                        self.in_flight -= 1
+                        self._notify()
+                        now = time.monotonic()
+                # Solo el carril síncrono tiene un cliente esperando; batch y cola esperan su turno
+                if self.queue_timeout > 0 and priority == Priority.SYNC:
+                    remaining = start + self.queue_timeout - now
+                    if remaining <= 0:
+                        raise LLMRateLimitError(
+                            f"Sin cupo en el límite de OpenAI tras {self.queue_timeout:.0f} s en cola",
+                            retry_after=delay or 1.0
+                        )
+                    delay = remaining if delay is None else min(delay, remaining)
+                event = self._event()
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._notify()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._notify()
+
+    async def settle(self, estimated: int, used: int):
+        """
+        Corrige el cubo de tokens con el consumo real de una llamada (usage):
+        devuelve lo que sobró de la estimación o cobra lo que faltó
+        """
+        if used != estimated:
+            await self.buckets.adjust(used - estimated)
+
+    async def close(self):
+        await self.buckets.close()
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            # Jitter pequeño para que las llamadas pausadas no vuelvan todas a la vez
+            return retry_after + random.uniform(0, min(1.0, retry_after * 0.1))
+        cap = min(settings.OPENAI_BACKOFF_MAX, settings.OPENAI_BACKOFF_BASE * 2 ** attempt)
+        return random.uniform(cap / 2, cap)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        tokens: int,
+        priority: Priority = Priority.SYNC
+    ) -> AsyncIterator[Any]:
+        """
+        Ejecuta `call` cuando hay cupo y conserva el hueco de concurrencia
+        mientras dura el bloque (p. ej. mientras se consume un stream)
+        """
+        order = next(self._order)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens, priority, order)
+            try:
+                response = await call()
+                break
+            except Exception as e:
+                self.release()
+                if not _is_retryable(e):
+                    raise
+                retry_after = _retry_after(e)
+                delay = self._backoff(attempt, retry_after)
+                rate_limited = getattr(e, "status_code", None) == 429
+                if rate_limited:
+                    LLM_RATE_LIMITED.inc()
+                if attempt == self.max_retries:
+                    if rate_limited:
+                        raise LLMRateLimitError(f"OpenAI sigue limitando tras {attempt} reintentos", delay)
+                    raise
+                logger.warning(f"Llamada a OpenAI falló ({str(e)}); reintento {attempt + 1} en {delay:.1f} s")
+                if rate_limited:
+                    self.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+        try:
+            yield response
+        finally:
+            self.release()
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        tokens: int,
+        priority: Priority = Priority.SYNC
+    ) -> Any:
+        async with self.slot(call, tokens, priority) as response:
+            return response
+
+# Planificador compartido por todas las llamadas del proceso
+_scheduler: Optional[LLMScheduler] = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
+async def close_llm_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.close()
+        _scheduler = None
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import importlib.util
+import io
+import logging
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pdfplumber
+from pdfminer.pdftypes import resolve1
+
+from app.core.config import settings
+from app.core.metrics import stage
+from app.services.extraction_pool import ExtractionPool, _spill, extract_pdf_job, extraction_pool
+from app.services.pdf_processor import MIN_TEXT_CHARS
+from app.services.result_cache import create_cache_backend
+
+logger = logging.getLogger(__name__)
+
+def ocr_available() -> bool:
+    """
+    pytesseract y el binario de Tesseract están instalados
+    """
+    return importlib.util.find_spec("pytesseract") is not None and shutil.which(settings.OCR_TESSERACT_CMD) is not None
+
+def page_dpi(page) -> int:
+    """
+    Resolución de rasterizado para una página: la de la imagen escaneada
+    que contiene (más no añade detalle), o la que da OCR_TARGET_PIXELS en el
+    lado mayor si no se conoce; siempre entre OCR_MIN_DPI y OCR_MAX_DPI
+    """
+    native = [
+        image["srcsize"][0] / (image["width"] / 72)
+        for image in page.images
+        if image.get("srcsize") and image.get("width")
+    ]
+    dpi = max(native) if native else settings.OCR_TARGET_PIXELS / (max(page.width, page.height) / 72)
+    return int(min(max(dpi, settings.OCR_MIN_DPI), settings.OCR_MAX_DPI))
+
+def _rasterize(source: Union[bytes, str], page_number: int, dpi: Optional[int] = None):
+    """
+    Imagen en escala de grises de una página y la resolución usada
+    """
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        page = pdf.pages[page_number]
+        dpi = dpi or page_dpi(page)
+        return page.to_image(resolution=dpi).original.convert("L"), dpi
+
+def _recognize(image, dpi: int) -> str:
+    try:
+        import pytesseract
+    except ImportError:
+        raise Exception("El OCR requiere el paquete pytesseract y el binario tesseract")
+    pytesseract.pytesseract.tesseract_cmd = settings.OCR_TESSERACT_CMD
+    return pytesseract.image_to_string(image, lang=settings.OCR_LANG, config=f"--dpi {dpi}")
+
+def page_digest(page) -> str:
+    """
+    Hash de lo que se ve en la página sin rasterizarla: su tamaño, el flujo
+    de contenido y los flujos crudos de las imágenes que dibuja
+    """
+    digest = hashlib.sha256(f"{page.width}x{page.height}".encode())
+    for stream in page.page_obj.contents:
+        digest.update(resolve1(stream).get_rawdata() or b"")
+    for image in page.images:
+        digest.update(image["stream"].get_rawdata() or b"")
+    return digest.hexdigest()
+
+def page_hashes_job(source: Union[bytes, str], num_pages: int) -> List[Dict[str, Any]]:
+    """
+    Trabajo del pool de OCR: hash y resolución de rasterizado de las
+    primeras `num_pages` páginas, abriendo el PDF una sola vez
+    """
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        return [
+            {"hash": page_digest(page), "dpi": page_dpi(page)}
+            for page in pdf.pages[:num_pages]
+        ]
+
+def ocr_page_job(source: Union[bytes, str], page_number: int, dpi: int) -> str:
+    """
+    Trabajo del pool de OCR: reconoce el texto de una página. Si sale poco
+    texto se repite una vez a OCR_MAX_DPI (escaneos pequeños o borrosos).
+    """
+    image, dpi = _rasterize(source, page_number, dpi)
+    text = _recognize(image, dpi)
+    if len(text.strip()) < MIN_TEXT_CHARS and dpi < settings.OCR_MAX_DPI:
+        image, retry_dpi = _rasterize(source, page_number, settings.OCR_MAX_DPI)
+        retry_text = _recognize(image, retry_dpi)
+        if len(retry_text.strip()) > len(text.strip()):
+            text = retry_text
+    return text
+
+class OCRService:
+    """
+    OCR local de PDFs escaneados en un pool de procesos propio, para no
+    bloquear la extracción de texto de los demás PDFs. El texto de cada
+    página se cachea por el hash de su contenido (page_digest).
+    """
+
+    def __init__(self, pool: Optional[ExtractionPool] = None, cache=None):
+        self.pool = pool or ExtractionPool(
+            max_workers=settings.OCR_POOL_SIZE,
+            job_timeout=settings.OCR_PAGE_TIMEOUT
+        )
+        self.cache = cache if cache is not None else create_cache_backend()
+        self._available: Optional[bool] = None
+
+    @property
+    def enabled(self) -> bool:
+        if not settings.OCR_ENABLED:
+            return False
+        if self._available is None:
+            self._available = ocr_available()
+            if not self._available:
+                logger.warning("OCR_ENABLED está activo pero no se encontró pytesseract o tesseract; OCR desactivado")
+        return self._available
+
+    @staticmethod
+    def _cache_key(digest: str) -> str:
+        return f"ocr:{settings.OCR_LANG}:{digest}"
+
+    async def _cached_text(self, digest: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        try:
+            return await self.cache.get(self._cache_key(digest))
+        except Exception as e:
+            logger.warning(f"Error leyendo caché de OCR: {str(e)}")
+            return None
+
+    async def _store_text(self, digest: str, text: str):
+        if self.cache is None:
+            return
+        try:
+            await self.cache.set(self._cache_key(digest), text, settings.CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Error guardando en caché de OCR: {str(e)}")
+
+    async def page_texts(self, source: Union[bytes, str], num_pages: int) -> List[str]:
+        """
+        Texto de las primeras OCR_MAX_PAGES páginas, reconociendo en paralelo
+        solo las que no están en caché. Los trabajos reciben la ruta del PDF,
+        no sus bytes: si llega en memoria se vuelca a disco una sola vez.
+        """
+        spilled = await asyncio.to_thread(_spill, source) if isinstance(source, bytes) else None
+        try:
+            return await self._page_texts(spilled or source, num_pages)
+        finally:
+            if spilled:
+                Path(spilled).unlink(missing_ok=True)
+
+    async def _page_texts(self, path: str, num_pages: int) -> List[str]:
+        pages = range(min(num_pages, settings.OCR_MAX_PAGES))
+        if num_pages > len(pages):
+            logger.warning(f"OCR limitado a las primeras {len(pages)} de {num_pages} páginas (OCR_MAX_PAGES)")
+        # Solo se rasteriza una vez cada página que no está en caché, en ocr_page_job
+        hashes = await self.pool.run(page_hashes_job, path, len(pages))
+        texts = await asyncio.gather(*(self._cached_text(page["hash"]) for page in hashes))
+        # Una página por imagen distinta: las repetidas (p. ej. hojas de condiciones) se reconocen una vez
+        missing: Dict[str, int] = {}
+        for page, text in zip(pages, texts):
+            if text is None:
+                missing.setdefault(hashes[page]["hash"], page)
+        logger.info(f"OCR de {len(missing)} imágenes de página ({len(pages)} páginas)")
+        recognized = await asyncio.gather(*(
+            self.pool.run(ocr_page_job, path, page, hashes[page]["dpi"]) for page in missing.values()
+        ))
+        by_hash = dict(zip(missing, recognized))
+        for digest, text in by_hash.items():
+            await self._store_text(digest, text)
+        return [text if text is not None else by_hash[page["hash"]] for text, page in zip(texts, hashes)]
+
+    async def extract(self, source: Union[bytes, str], extraction: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Completa la extracción de un PDF escaneado con el texto del OCR. El
+        texto reconocido pasa por extract_pdf_job en el pool de extracción,
+        que le aplica la compactación, los fragmentos y las reglas. Si el PDF
+        supera OCR_MAX_PAGES, `ocr_skipped_pages` indica cuántas quedaron fuera.
+        """
+        spilled = await asyncio.to_thread(_spill, source) if isinstance(source, bytes) else None
+        try:
+            with stage("ocr"):
+                texts = await self.page_texts(spilled or source, extraction["num_pages"])
+            if len("".join(texts).strip()) <= MIN_TEXT_CHARS:
+                logger.warning("El OCR no encontró texto suficiente")
+                return extraction
+            result = await extraction_pool.run(extract_pdf_job, spilled or source, 0, texts)
+        finally:
+            if spilled:
+                Path(spilled).unlink(missing_ok=True)
+        # El texto no salió de pdfplumber: no cuenta para el enrutador de backends
+        result.pop("backend_attempts", None)
+        result["text_backend"] = "ocr"
+        result["pdf_kind"] = "scanned"
+        if extraction["num_pages"] > len(texts):
+            result["ocr_skipped_pages"] = extraction["num_pages"] - len(texts)
+        timings = result["timings"]
+        for name, elapsed in extraction.get("timings", {}).items():
+            timings[name] = timings.get(name, 0.0) + elapsed
+        return result
+
+    async def close(self):
+        self.pool.shutdown()
+        if self.cache is not None:
+            await self.cache.close()
+
+# Instancia compartida por el pipeline
+ocr_service = OCRService()
@@ -1,11 +1,281 @@
 import PyPDF2
 import pdfplumber
-from typing import Optional, Dict, Any
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Sequence, Union
+import io
 import logging
+import time
 from pathlib import Path
 
+from app.core.config import settings
+from app.core.metrics import stage, record_stages, PDF_TEXT_BACKEND
+from app.services.backend_router import BACKENDS, backend_router, producer_family
+from app.services.table_extractor import page_layout
+
 logger = logging.getLogger(__name__)
 
+# Caracteres mínimos para considerar que el texto extraído es significativo
+MIN_TEXT_CHARS = 50
+
+def has_pdf_header(source: Union[bytes, str]) -> bool:
+    """
+    El archivo empieza por la cabecera %PDF- (la especificación la admite en el primer KB)
+    """
+    if isinstance(source, bytes):
+        head = source[:1024]
+    else:
+        with open(source, "rb") as file:
+            head = file.read(1024)
+    return b"%PDF-" in head
+
+@dataclass
+class PDFProbe:
+    """Resultado del muestreo de las primeras páginas"""
+    kind: str                 # text, scanned (solo imágenes) o empty
+    backend: Optional[str]    # pdfplumber, pypdf2 o None si no hay texto que extraer
+    sampled_pages: int
+
+class ParsedDocument:
+    """
+    PDF parseado una sola vez desde un buffer en memoria.
+    
+    La validez, el número de páginas, los metadatos y el texto por página se
+    calculan de forma perezosa sobre el mismo parseo de pdfplumber. PyPDF2 solo
+    se abre si hace falta el fallback de texto.
+    """
+    
+    def __init__(self, data: bytes):
+        self._data = data
+        self._pdf = None
+        self._error: Optional[str] = None
+        self._opened = False
+        self._page_texts: Dict[int, str] = {}
+        self._page_images: Dict[int, int] = {}
+        self._page_layouts: Dict[int, list] = {}
+        self._probe: Optional[PDFProbe] = None
+        self._preloaded = False
+        self._sample_seconds: Dict[str, float] = {}
+        # Intentos de extracción (backend, seconds, ok) para el enrutador de backends
+        self.backend_attempts: List[Dict[str, Any]] = []
+        # Duración por etapa (el documento suele parsearse en un proceso del pool)
+        self.timings: Dict[str, float] = {}
+        self.text_backend: Optional[str] = None
+    
+    @classmethod
+    def from_path(cls, file_path: str) -> "ParsedDocument":
+        if not Path(file_path).exists():
+            raise FileNotFoundError(f"Archivo no encontrado: {file_path}")
+        return cls(Path(file_path).read_bytes())
+    
+    def __enter__(self) -> "ParsedDocument":
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _open(self):
+        if not self._opened:
+            self._opened = True
+            if not has_pdf_header(self._data):
+                # Descarta lo que no es un PDF sin llegar a parsearlo
+                self._error = "El archivo no tiene la cabecera %PDF-"
+                logger.error(f"PDF inválido: {self._error}")
+                return None
+            try:
+                with stage("validate", self.timings):
+                    self._pdf = pdfplumber.open(io.BytesIO(self._data))
+            except Exception as e:
+                self._error = str(e)
+                logger.error(f"PDF inválido: {self._error}")
+        return self._pdf
+    
+    @property
+    def is_valid(self) -> bool:
+        """
+        El PDF se pudo parsear y tiene al menos una página
+        """
+        return self._open() is not None and self.num_pages > 0
+    
+    @property
+    def error(self) -> Optional[str]:
+        self._open()
+        return self._error
+    
+    @property
+    def num_pages(self) -> int:
+        pdf = self._open()
+        return len(pdf.pages) if pdf is not None else 0
+    
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """
+        Metadatos del documento con el mismo formato que PDFProcessor.extract_metadata
+        """
+        metadata = {"num_pages": self.num_pages}
+        pdf = self._open()
+        if pdf is not None and pdf.metadata:
+            for key, value in pdf.metadata.items():
+                if value:
+                    metadata[key.replace('/', '')] = str(value)
+        return metadata
+    
+    def page_text(self, page_number: int) -> str:
+        """
+        Texto de una página (0-indexada), extraído solo la primera vez que se pide
+        """
+        if page_number not in self._page_texts:
+            page_text = ""
+            try:
+                page = self._open().pages[page_number]
+                page_text = page.extract_text() or ""
+                # Los objetos ya están parseados por extract_text: contar imágenes no cuesta otra pasada
+                self._page_images[page_number] = len(page.images)
+                if settings.TABLE_EXTRACTION:
+                    # Posición de las palabras para la tabla de ítems, antes de liberar la página
+                    self._page_layouts[page_number] = page_layout(page)
+                # Libera los caracteres y el layout cacheados: en PDFs largos son la mayor parte de la memoria
+                page.close()
+            except Exception as e:
+                logger.warning(f"Error en página {page_number}: {str(e)}")
+            self._page_texts[page_number] = page_text
+        return self._page_texts[page_number]
+    
+    def page_texts(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        stop = self.num_pages if stop is None else min(stop, self.num_pages)
+        return [self.page_text(i) for i in range(start, stop)]
+    
+    def page_layouts(self, start: int = 0, stop: Optional[int] = None) -> List[list]:
+        """
+        Líneas con posición de cada página (table_extractor.page_layout); vacías
+        si la página no se extrajo con pdfplumber o TABLE_EXTRACTION está desactivado
+        """
+        self.page_texts(start, stop)
+        stop = self.num_pages if stop is None else min(stop, self.num_pages)
+        return [self._page_layouts.get(i, []) for i in range(start, stop)]
+    
+    def preload_page_texts(self, page_texts: List[str], page_layouts: Optional[List[list]] = None):
+        """
+        Usa textos de página ya extraídos (p. ej. por rangos en otros procesos)
+        """
+        self._page_texts = dict(enumerate(page_texts))
+        self._page_layouts = dict(enumerate(page_layouts or []))
+        self._preloaded = True
+    
+    @property
+    def text(self) -> str:
+        """
+        Texto completo con pdfplumber, una línea en blanco entre páginas
+        """
+        return "".join(page_text + "\n" for page_text in self.page_texts() if page_text)
+    
+    def fallback_text(self, max_pages: Optional[int] = None) -> str:
+        """
+        Texto con PyPDF2 sobre el mismo buffer (solo se usa como fallback)
+        """
+        reader = PyPDF2.PdfReader(io.BytesIO(self._data))
+        texts = []
+        for page_num, page in enumerate(reader.pages):
+            if max_pages is not None and page_num >= max_pages:
+                break
+            try:
+                page_text = page.extract_text()
+                if page_text:
+                    texts.append(page_text + "\n")
+            except Exception as e:
+                logger.warning(f"Error en página {page_num}: {str(e)}")
+        return "".join(texts)
+    
+    def probe(self, order: Sequence[str] = BACKENDS) -> PDFProbe:
+        """
+        Muestrea las primeras PDF_PROBE_PAGES páginas para decidir si el PDF
+        tiene texto y con qué backend extraerlo (el primero de `order` que dé
+        texto), sin recorrer el documento completo. Los textos muestreados con
+        pdfplumber quedan cacheados para la extracción. Los backends anteriores
+        al elegido quedan en `backend_attempts` como intentos fallidos.
+        """
+        if self._probe is not None:
+            return self._probe
+        # Con los textos ya extraídos (rangos u OCR) se revisan todas las páginas: no cuesta nada
+        sample = self.num_pages if self._preloaded else min(settings.PDF_PROBE_PAGES, self.num_pages)
+        if sample <= 0:
+            self._probe = PDFProbe(kind="text", backend=order[0], sampled_pages=0)
+            return self._probe
+        backend = None
+        with stage("probe", self.timings):
+            for candidate in order:
+                start = time.perf_counter()
+                if candidate == "pdfplumber":
+                    sample_text = "".join(self.page_texts(0, sample))
+                else:
+                    sample_text = self._safe_fallback_text(sample)
+                self._sample_seconds[candidate] = time.perf_counter() - start
+                text_chars = len(sample_text.strip())
+                # Documento completo muestreado: basta algo de texto, como en extract_text
+                if text_chars > MIN_TEXT_CHARS or (sample == self.num_pages and text_chars > 0):
+                    backend = candidate
+                    break
+            if backend is not None:
+                # Los backends que no dieron texto en un PDF que sí lo tiene cuentan como fallo
+                for candidate in order[:list(order).index(backend)]:
+                    self.backend_attempts.append({"backend": candidate, "seconds": self._sample_seconds[candidate], "ok": False})
+                self._probe = PDFProbe(kind="text", backend=backend, sampled_pages=sample)
+            else:
+                scanned = any(self._page_images.get(i) for i in range(sample))
+                self._probe = PDFProbe(kind="scanned" if scanned else "empty", backend=None, sampled_pages=sample)
+        logger.info(f"Muestreo de {sample} páginas: {self._probe.kind} ({self._probe.backend or 'sin texto'})")
+        return self._probe
+    
+    def sample_seconds(self, backend: str) -> float:
+        """
+        Tiempo que tardó `backend` en el muestreo (0 si no se probó)
+        """
+        return self._sample_seconds.get(backend, 0.0)
+    
+    def _safe_fallback_text(self, max_pages: int) -> str:
+        try:
+            return self.fallback_text(max_pages)
+        except Exception as e:
+            logger.warning(f"PyPDF2 falló en el muestreo: {str(e)}")
+            return ""
+    
+    def extract_text(self, order: Sequence[str] = BACKENDS) -> str:
+        """
+        Extrae texto con los backends en el orden `order` (pdfplumber y luego
+        PyPDF2 por defecto), empezando por el que eligió el muestreo. Sin texto
+        en las primeras páginas (PDF escaneado o vacío) falla sin recorrer el
+        resto del documento. Cada intento queda en `backend_attempts`.
+        """
+        probe = self.probe(order)
+        if probe.backend is None:
+            raise Exception(f"No se pudo extraer texto del PDF: las primeras {probe.sampled_pages} páginas no tienen texto ({probe.kind})")
+        
+        candidates = list(order[list(order).index(probe.backend):]) if probe.backend in order else [probe.backend]
+        for index, backend in enumerate(candidates):
+            start = time.perf_counter()
+            text = ""
+            try:
+                with stage(backend, self.timings):
+                    text = self.text if backend == "pdfplumber" else self.fallback_text()
+                logger.info(f"Texto extraído exitosamente con {backend}: {len(text)} caracteres")
+            except Exception as e:
+                logger.warning(f"{backend} falló: {str(e)}")
+            # El muestreo es parte del coste de cada backend (con pdfplumber, además, sus páginas ya están extraídas)
+            seconds = time.perf_counter() - start + self._sample_seconds.get(backend, 0.0)
+            text_chars = len(text.strip())
+            self.backend_attempts.append({"backend": backend, "seconds": seconds, "ok": text_chars > MIN_TEXT_CHARS})
+            # El último backend acepta textos cortos, como el fallback de siempre
+            if text_chars > MIN_TEXT_CHARS or (index == len(candidates) - 1 and text_chars > 10):
+                self.text_backend = backend
+                return text
+        
+        logger.error("Todos los métodos de extracción fallaron")
+        raise Exception("No se pudo extraer texto del PDF: No se pudo extraer texto significativo del PDF")
+    
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
 class PDFProcessor:
     """Clase para procesar archivos PDF y extraer texto"""
     
@@ -15,12 +285,14 @@ class PDFProcessor:
         Extrae texto usando pdfplumber (mejor para tablas y estructura)
         """
         try:
-            text = ""
-            with pdfplumber.open(file_path) as pdf:
+            texts = []
+            with stage("pdfplumber"), pdfplumber.open(file_path) as pdf:
                 for page in pdf.pages:
                     page_text = page.extract_text()
                     if page_text:
-                        text += page_text + "\n"
+                        texts.append(page_text + "\n")
+            # Un solo join: concatenar con += copia el texto acumulado en cada página
+            text = "".join(texts)
             
             logger.info(f"Texto extraído exitosamente con pdfplumber: {len(text)} caracteres")
             return text
@@ -35,18 +307,19 @@ class PDFProcessor:
         Extrae texto usando PyPDF2 (fallback)
         """
         try:
-            text = ""
-            with open(file_path, 'rb') as file:
+            texts = []
+            with stage("pypdf2"), open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
                 
                 for page_num, page in enumerate(pdf_reader.pages):
                     try:
                         page_text = page.extract_text()
                         if page_text:
-                            text += page_text + "\n"
+                            texts.append(page_text + "\n")
                     except Exception as e:
                         logger.warning(f"Error en página {page_num}: {str(e)}")
                         continue
+            text = "".join(texts)
             
             logger.info(f"Texto extraído exitosamente con PyPDF2: {len(text)} caracteres")
             return text
@@ -55,32 +328,28 @@ class PDFProcessor:
             logger.error(f"Error extrayendo texto con PyPDF2: {str(e)}")
             raise Exception(f"Error procesando PDF con PyPDF2: {str(e)}")
     
+    @staticmethod
+    def parse(data: bytes) -> ParsedDocument:
+        """
+        Parsea el PDF una sola vez desde memoria
+        """
+        return ParsedDocument(data)
+    
     @staticmethod
     def extract_text(file_path: str) -> str:
         """
         Extrae texto del PDF usando múltiples métodos
         """
-        if not Path(file_path).exists():
-            raise FileNotFoundError(f"Archivo no encontrado: {file_path}")
-        
-        # Intentar primero con pdfplumber
-        try:
-            text = PDFProcessor.extract_text_with_pdfplumber(file_path)
-            if text and len(text.strip()) > 50:  # Verificar que el texto sea significativo
-                return text
-        except Exception as e:
-            logger.warning(f"pdfplumber falló, intentando con PyPDF2: {str(e)}")
-        
-        # Fallback a PyPDF2
-        try:
-            text = PDFProcessor.extract_text_with_pypdf2(file_path)
-            if text and len(text.strip()) > 10:
-                return text
-            else:
-                raise Exception("No se pudo extraer texto significativo del PDF")
-        except Exception as e:
-            logger.error(f"Todos los métodos de extracción fallaron: {str(e)}")
-            raise Exception(f"No se pudo extraer texto del PDF: {str(e)}")
+        with ParsedDocument.from_path(file_path) as document:
+            # Orden de backends aprendido para el generador del PDF (Producer/Creator)
+            family = producer_family(document.metadata)
+            try:
+                return document.extract_text(backend_router.routes().get(family, BACKENDS))
+            finally:
+                record_stages(document.timings)
+                backend_router.record(family, document.backend_attempts, document.num_pages)
+                if document.text_backend:
+                    PDF_TEXT_BACKEND.inc(backend=document.text_backend)
     
     @staticmethod
     def extract_metadata(file_path: str) -> Dict[str, Any]:
@@ -113,13 +382,14 @@ class PDFProcessor:
         Valida que el archivo sea un PDF válido
         """
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                # Intentar acceder a la primera página
-                if len(pdf_reader.pages) > 0:
-                    first_page = pdf_reader.pages[0]
-                    return True
-                return False
+            with stage("validate"):
+                # La cabecera descarta lo que no es un PDF sin leer el archivo completo
+                if not has_pdf_header(file_path):
+                    logger.error("PDF inválido: el archivo no tiene la cabecera %PDF-")
+                    return False
+                # El xref y el árbol de páginas bastan; el contenido de las páginas no se parsea
+                with ParsedDocument.from_path(file_path) as document:
+                    return document.is_valid
         except Exception as e:
             logger.error(f"PDF inválido: {str(e)}")
             return False
@@ -0,0 +1,244 @@
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.utils import clean_text
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken es opcional: sin él se estima por caracteres
+    _encoding = None
+
+# Líneas con datos que el modelo necesita siempre (cabecera, impuestos y totales)
+KEY_LINE_PATTERN = re.compile(
+    r"\b(nit|c\.?c\.?|factura|nota|serie|prefijo|n[uú]mero|no\.|fecha|vence|vencimiento|"
+    r"cufe|cude|moneda|subtotal|total|iva|rete|retenci[oó]n|ica|descuento|"
+    r"raz[oó]n social|proveedor|emisor|direcci[oó]n|tel[eé]fono|email|correo)\b",
+    re.IGNORECASE
+)
+
+# Líneas que llevan valores aunque se repitan en el borde de cada página
+# ("Subtotal", "Suma y sigue", "Van"...): no se tratan como cabecera repetida
+VALUE_LINE_PATTERN = re.compile(
+    r"\b(subtotal|total|suma y sigue|van|vienen|saldo|valor|iva|rete|retenci[oó]n|descuento)\b",
+    re.IGNORECASE
+)
+AMOUNT_PATTERN = re.compile(r"\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?\b|\d+[.,]\d{2}\b")
+
+NUMBER_PATTERN = re.compile(r"\d[\d.,]*")
+PAGE_NUMBER_PATTERN = re.compile(r"(p[aá]g(?:ina)?\.?\s*)?\d+(\s*(de|/)\s*\d+)?", re.IGNORECASE)
+
+# Texto legal y de representación gráfica que no aporta campos a la extracción
+BOILERPLATE_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r"se asimila en todos sus efectos a una letra de cambio",
+        r"art[ií]culo\s+774|art\.?\s*774",
+        r"ley\s+1231\s+de\s+2008",
+        r"representaci[oó]n gr[aá]fica de (la )?factura",
+        r"proveedor tecnol[oó]gico",
+        r"(documento|factura) generad[oa] por",
+        r"software (de facturaci[oó]n|propio)",
+        r"esta factura (de venta )?se rige",
+        r"no somos (grandes )?contribuyentes|somos grandes contribuyentes",
+        r"no efectuar retenci[oó]n",
+        r"gracias por su (compra|preferencia)",
+        r"^p[aá]gina\s+\d+(\s+de\s+\d+)?$",
+    )
+]
+
+# Reparto del presupuesto de tokens entre secciones (lo que sobra pasa a la siguiente)
+SECTION_BUDGETS = (("claves", 0.3), ("items", 0.6), ("otros", 0.1))
+
+@dataclass
+class CompactionResult:
+    text: str
+    original_tokens: int
+    tokens: int
+    dropped_lines: int = 0
+    # Líneas con contenido omitidas por el presupuesto (no cabeceras repetidas ni texto legal)
+    truncated_lines: int = 0
+
+    @property
+    def saved_ratio(self) -> float:
+        if not self.original_tokens:
+            return 0.0
+        return 1 - self.tokens / self.original_tokens
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens del texto con tiktoken si está instalado; si no, ~4 caracteres por token
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+def _normalize_lines(page: str) -> List[str]:
+    """
+    Aplica clean_text línea a línea: conserva los saltos que separan filas de tablas
+    """
+    return [line for line in (clean_text(raw) for raw in page.splitlines()) if line]
+
+def _line_signature(line: str) -> str:
+    # Los números de página cambian entre páginas; se ignoran al comparar
+    return PAGE_NUMBER_PATTERN.sub(lambda m: "#" if m.group(1) or m.group(2) else m.group(0), line.lower())
+
+def _repeated_signatures(pages: List[List[str]], edge_lines: int = 4) -> set:
+    """
+    Firmas de las líneas de cabecera/pie que se repiten en al menos la mitad de las páginas
+    """
+    if len(pages) < 2:
+        return set()
+    counts = Counter()
+    for lines in pages:
+        edges = lines[:edge_lines] + lines[-edge_lines:]
+        # Dos filas de ítems iguales en páginas distintas son datos, no cabeceras;
+        # tampoco lo son los subtotales por página aunque repitan etiqueta e importe
+        counts.update({_line_signature(line) for line in edges if not _carries_value(line)})
+    threshold = max(2, math.ceil(len(pages) / 2))
+    return {signature for signature, count in counts.items() if count >= threshold}
+
+def _carries_value(line: str) -> bool:
+    """
+    Ítems, importes y etiquetas de totales: se conservan en todas las páginas.
+    Las cabeceras de identidad (NIT, razón social, número) sí se deduplican.
+    """
+    return _section(line) == "items" or bool(VALUE_LINE_PATTERN.search(line) or AMOUNT_PATTERN.search(line))
+
+def _is_boilerplate(line: str) -> bool:
+    return any(pattern.search(line) for pattern in BOILERPLATE_PATTERNS)
+
+def _section(line: str) -> str:
+    if KEY_LINE_PATTERN.search(line):
+        return "claves"
+    if len(NUMBER_PATTERN.findall(line)) >= 2:
+        return "items"
+    return "otros"
+
+def _clean_pages(pages: List[str]):
+    """
+    Líneas normalizadas de cada página sin cabeceras/pies repetidos ni texto
+    legal. Devuelve (líneas por página, líneas descartadas).
+    """
+    page_lines = [_normalize_lines(page) for page in pages]
+    repeated = _repeated_signatures(page_lines)
+
+    cleaned = []
+    seen_repeated = set()
+    dropped = 0
+    for page in page_lines:
+        kept = []
+        for line in page:
+            signature = _line_signature(line)
+            if signature in repeated:
+                if signature in seen_repeated:
+                    dropped += 1
+                    continue
+                seen_repeated.add(signature)
+            if _is_boilerplate(line):
+                dropped += 1
+                continue
+            kept.append(line)
+        cleaned.append(kept)
+    return cleaned, dropped
+
+def compact_pages(pages: List[str], max_tokens: Optional[int] = None) -> CompactionResult:
+    """
+    Reduce el texto de la factura que se envía al modelo sin perder campos:
+    normaliza espacios, deja una sola copia de cabeceras/pies repetidos, quita
+    texto legal y, si aún supera `max_tokens`, recorta por secciones (lo
+    indica `truncated_lines`; quien llama debería repartir las páginas en
+    fragmentos con chunk_pages antes que perder esas líneas).
+    """
+    max_tokens = max_tokens or settings.PROMPT_MAX_INPUT_TOKENS
+    original_tokens = count_tokens("".join(page + "\n" for page in pages if page))
+
+    cleaned, dropped = _clean_pages(pages)
+    lines = [line for page in cleaned for line in page]
+
+    line_tokens = [count_tokens(line) + 1 for line in lines]
+    omitted = 0
+    if sum(line_tokens) > max_tokens:
+        keep, omitted = _apply_section_budgets(lines, line_tokens, max_tokens)
+        dropped += omitted
+        compacted = []
+        gap = False
+        for index, line in enumerate(lines):
+            if index in keep:
+                compacted.append(line)
+                gap = False
+            elif not gap:
+                compacted.append("[...]")
+                gap = True
+        lines = compacted
+        logger.info(f"Texto recortado por presupuesto de {max_tokens} tokens: {omitted} líneas omitidas")
+
+    text = "\n".join(lines)
+    return CompactionResult(
+        text=text, original_tokens=original_tokens, tokens=count_tokens(text),
+        dropped_lines=dropped, truncated_lines=omitted
+    )
+
+def _apply_section_budgets(lines: List[str], line_tokens: List[int], max_tokens: int):
+    """
+    Elige qué líneas conservar respetando el presupuesto de cada sección. Dentro
+    de una sección se prioriza el principio y el final (cabecera y totales).
+    """
+    by_section = {name: [] for name, _ in SECTION_BUDGETS}
+    for index, line in enumerate(lines):
+        by_section[_section(line)].append(index)
+
+    keep = set()
+    carry = 0
+    for name, share in SECTION_BUDGETS:
+        budget = int(max_tokens * share) + carry
+        indices = by_section[name]
+        head, tail = 0, len(indices) - 1
+        used = 0
+        take_head = True
+        while head <= tail:
+            index = indices[head] if take_head else indices[tail]
+            if used + line_tokens[index] > budget:
+                break
+            used += line_tokens[index]
+            keep.add(index)
+            if take_head:
+                head += 1
+            else:
+                tail -= 1
+            take_head = not take_head
+        carry = budget - used
+    return keep, len(lines) - len(keep)
+
+def chunk_pages(pages: List[str], max_tokens: Optional[int] = None) -> List[str]:
+    """
+    Agrupa páginas consecutivas en fragmentos de hasta `max_tokens` sin partir
+    ninguna página. La cabecera repetida solo queda en el primer fragmento.
+    """
+    max_tokens = max_tokens or settings.EXTRACTION_CHUNK_TOKENS
+    if settings.PROMPT_COMPACTION:
+        cleaned, _ = _clean_pages(pages)
+    else:
+        cleaned = [page.splitlines() for page in pages]
+
+    chunks = []
+    current: List[str] = []
+    used = 0
+    for lines in cleaned:
+        tokens = sum(count_tokens(line) + 1 for line in lines)
+        if current and used + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, used = [], 0
+        current.extend(lines)
+        used += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.schemas.invoice import InvoiceResponse, SCHEMA_VERSION
+from app.services.ai_extractor import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(ABC):
+    """Interfaz de los backends de caché (valores serializados como texto)"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Valor guardado en `key`, o None si no está o ha vencido
+        """
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: int):
+        """
+        Guarda `value` en `key` durante `ttl` segundos
+        """
+
+    async def close(self):
+        pass
+
+class MemoryCacheBackend(CacheBackend):
+    """Caché LRU en memoria del proceso, limitada por entradas, bytes y TTL"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._size = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._size += len(value)
+        # Expulsar las entradas menos usadas hasta respetar los límites
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._size -= len(value)
+
+class RedisCacheBackend(CacheBackend):
+    """Caché compartida entre procesos y máquinas usando Redis"""
+
+    def __init__(self, url: str, prefix: str = "invoice-cache:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise Exception("El backend de caché 'redis' requiere el paquete redis")
+        self.prefix = prefix
+        self.client = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self.client.set(self.prefix + key, value, ex=ttl)
+
+    async def close(self):
+        await self.client.aclose()
+
+def create_cache_backend() -> Optional[CacheBackend]:
+    """
+    Crea el backend configurado en CACHE_BACKEND (memory, redis o none)
+    """
+    backend = settings.CACHE_BACKEND.lower()
+    if backend == "memory":
+        return MemoryCacheBackend(settings.CACHE_MAX_ENTRIES, settings.CACHE_MAX_BYTES)
+    if backend == "redis":
+        return RedisCacheBackend(settings.REDIS_URL)
+    return None
+
+class ResultCache:
+    """Caché de resultados de extracción direccionada por contenido"""
+
+    def __init__(self, backend: Optional[CacheBackend], ttl: int = 86400):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(content: bytes) -> str:
+        """
+        Clave = SHA-256 del PDF + modelo + versión de prompt + versión de esquema
+        """
+        return ResultCache.key_for_digest(hashlib.sha256(content).hexdigest())
+
+    @staticmethod
+    def key_for_digest(digest: str) -> str:
+        """
+        Clave a partir de un SHA-256 ya calculado (p. ej. leyendo por bloques)
+        """
+        return f"{digest}:{settings.OPENAI_MODEL}:p{PROMPT_VERSION}:s{SCHEMA_VERSION}"
+
+    async def get(self, key: str) -> Optional[InvoiceResponse]:
+        if self.backend is None:
+            return None
+        try:
+            cached = await self.backend.get(key)
+            if cached is None:
+                return None
+            return InvoiceResponse.model_validate_json(cached)
+        except Exception as e:
+            logger.warning(f"Error leyendo caché de resultados: {str(e)}")
+            return None
+
+    async def set(self, key: str, invoice: InvoiceResponse):
+        if self.backend is None:
+            return
+        try:
+            # Las notas dependen de cada petición, no se guardan
+            value = invoice.model_copy(update={"processing_notes": None}).model_dump_json()
+            await self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"Error guardando en caché de resultados: {str(e)}")
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+# Instancia compartida por los endpoints
+result_cache = ResultCache(create_cache_backend(), settings.CACHE_TTL_SECONDS)
@@ -0,0 +1,300 @@
+import logging
+import re
+import uuid
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from app.schemas.invoice import InvoiceResponse
+from app.services.invoice_mapper import InvoiceDataMapper
+
+logger = logging.getLogger(__name__)
+
+# Cifras con separadores de miles y decimales en formato colombiano o inglés
+AMOUNT = r"\$?[ \t]*(\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)"
+PERCENT = r"(\d{1,2}(?:[.,]\d{1,2})?)\s*%"
+
+DOCUMENT_TYPE_PATTERN = re.compile(
+    r"(factura\s+electr[oó]nica\s+de\s+venta|factura\s+electr[oó]nica|factura\s+de\s+venta|"
+    r"nota\s+cr[eé]dito(?:\s+electr[oó]nica)?|nota\s+d[eé]bito(?:\s+electr[oó]nica)?)",
+    re.IGNORECASE
+)
+NUMBER_PATTERN = re.compile(
+    r"(?:factura|nota)[^\n]*?(?:\bNo\.?|N[°º]|N[uú]mero)\s*:?\s*([A-Z]{1,5})\s*-?\s*(\d{1,12})\b",
+    re.IGNORECASE
+)
+PREFIX_PATTERN = re.compile(r"\bprefijo\s*:?\s*([A-Z]{1,5})\b", re.IGNORECASE)
+CONSECUTIVE_PATTERN = re.compile(r"\b(?:n[uú]mero|consecutivo)\s*:?\s*(\d{1,12})\b", re.IGNORECASE)
+NIT_PATTERN = re.compile(r"\bNIT\.?\s*:?\s*(\d{1,3}(?:\.?\d{3}){2,3})\s*-\s*(\d)\b", re.IGNORECASE)
+CUFE_PATTERN = re.compile(r"\b(?:CUFE|CUDE)\s*:?\s*([0-9a-f]{96})\b", re.IGNORECASE)
+BUSINESS_NAME_PATTERN = re.compile(r"raz[oó]n\s+social\s*:?\s*([^\n]+)", re.IGNORECASE)
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE_PATTERN = re.compile(r"\b(?:tel[eé]fono|tel|cel|celular)\.?\s*:?\s*(\+?[\d ()-]{7,20}\d)", re.IGNORECASE)
+ADDRESS_PATTERN = re.compile(r"\bdirecci[oó]n\s*:?\s*([^\n]+)", re.IGNORECASE)
+CURRENCY_PATTERN = re.compile(r"\b(COP|USD|EUR)\b")
+
+ISSUE_DATE_PATTERN = re.compile(
+    r"fecha\s*(?:de\s*)?(?:emisi[oó]n|expedici[oó]n|generaci[oó]n|factura)\s*:?\s*([^\n]{6,30})",
+    re.IGNORECASE
+)
+DUE_DATE_PATTERN = re.compile(
+    r"(?:fecha\s*(?:de\s*)?vencimiento|vence)\s*:?\s*([^\n]{6,30})",
+    re.IGNORECASE
+)
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12
+}
+
+SUBTOTAL_PATTERN = re.compile(r"\bsub\s*-?\s*total\b[^\d\n$]*" + AMOUNT, re.IGNORECASE)
+DISCOUNT_PATTERN = re.compile(r"\b(?:total\s+)?descuentos?\b[^\d\n$]*" + AMOUNT, re.IGNORECASE)
+TOTAL_PATTERN = re.compile(
+    r"\b(?:total\s+a\s+pagar|valor\s+total|total\s+factura|neto\s+a\s+pagar|(?<!sub)(?<!sub\s)total)\b[ \t]*:?[ \t]*(?:COP)?[ \t]*" + AMOUNT,
+    re.IGNORECASE
+)
+IVA_PATTERN = re.compile(r"(?<!rete)(?<!rete\s)\bIVA\b\s*(?:" + PERCENT + r")?[^\d\n$]*" + AMOUNT, re.IGNORECASE)
+FUENTE_PATTERN = re.compile(
+    r"\b(?:rete\s*-?\s*fuente|retenci[oó]n\s+(?:en\s+la\s+)?fuente)\b\s*(?:" + PERCENT + r")?[^\d\n$]*" + AMOUNT,
+    re.IGNORECASE
+)
+ICA_PATTERN = re.compile(
+    r"\b(?:rete\s*-?\s*ica|retenci[oó]n\s+(?:de\s+)?ica)\b\s*(?:" + PERCENT + r")?(?:[^\n$]*?x\s*mil)?[^\d\n$]*" + AMOUNT,
+    re.IGNORECASE
+)
+ITEM_PATTERN = re.compile(
+    r"^(?P<description>[^\d\n].*?)\s+(?P<quantity>\d+(?:[.,]\d+)?)\s+" + AMOUNT.replace("(", "(?P<unit_price>", 1)
+    + r"\s+" + AMOUNT.replace("(", "(?P<subtotal>", 1) + r"\s*$",
+    re.MULTILINE
+)
+
+def parse_amount(value: str) -> Optional[float]:
+    """
+    Convierte '1.234.567,89', '1,234,567.89' o '119.000' a float
+    """
+    value = value.replace("$", "").replace(" ", "").strip()
+    if not value:
+        return None
+    if "," in value and "." in value:
+        decimal = "," if value.rfind(",") > value.rfind(".") else "."
+        thousands = "." if decimal == "," else ","
+        value = value.replace(thousands, "").replace(decimal, ".")
+    elif "," in value or "." in value:
+        separator = "," if "," in value else "."
+        head, _, tail = value.rpartition(separator)
+        # Un único separador seguido de 1-2 cifras es decimal; si no, es de miles
+        if value.count(separator) == 1 and len(tail) in (1, 2):
+            value = f"{head}.{tail}"
+        else:
+            value = value.replace(separator, "")
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def parse_date(value: str) -> Optional[str]:
+    """
+    Normaliza fechas 'YYYY-MM-DD', 'DD/MM/YYYY' o '24 de julio de 2025' a YYYY-MM-DD
+    """
+    match = re.search(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})", value)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+    else:
+        match = re.search(r"(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})", value)
+        if match:
+            day, month, year = (int(part) for part in match.groups())
+        else:
+            match = re.search(r"(\d{1,2})\s+de\s+([a-zA-Z]+)\s+(?:de\s+|del\s+)?(\d{4})", value, re.IGNORECASE)
+            if not match or match.group(2).lower() not in MONTHS:
+                return None
+            day, month, year = int(match.group(1)), MONTHS[match.group(2).lower()], int(match.group(3))
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+def _close(a: float, b: float, tolerance: float = 0.001) -> bool:
+    return abs(a - b) <= max(1.0, abs(b) * tolerance)
+
+class RulesExtractor(InvoiceDataMapper):
+    """
+    Extractor determinista para facturas electrónicas DIAN de texto regular.
+    Solo rellena un campo cuando lo encuentra con su etiqueta y descarta
+    ítems y totales que no cuadran entre sí, de modo que un resultado
+    incompleto baje el score de confianza y la factura pase al modelo.
+    """
+
+    def extract(self, text: str, table_items: Optional[List[Dict[str, Any]]] = None) -> InvoiceResponse:
+        data = self.extract_fields(text, table_items)
+        invoice_response = self._convert_to_invoice_response(data, str(uuid.uuid4()), text)
+        invoice_response.confidence_score = self._calculate_confidence_score(data, text)
+        if data.get("cufe"):
+            invoice_response.processing_notes = [f"CUFE: {data['cufe']}"]
+        return invoice_response
+
+    def extract_fields(self, text: str, table_items: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Devuelve los campos en el mismo formato JSON que se le pide a la IA.
+        `table_items` son las filas de la tabla de ítems leídas del layout del
+        PDF (table_extractor), si las hay.
+        """
+        data: Dict[str, Any] = {
+            "document_type": None,
+            "series": None,
+            "number": None,
+            "issue_date": None,
+            "due_date": None,
+            "supplier": self._supplier(text),
+            "currency": None,
+            "items": [],
+            "taxes": None,
+            "totals": {}
+        }
+
+        match = DOCUMENT_TYPE_PATTERN.search(text)
+        if match:
+            data["document_type"] = " ".join(match.group(1).upper().split())
+
+        match = NUMBER_PATTERN.search(text)
+        if match:
+            data["series"], data["number"] = match.group(1).upper(), match.group(2)
+        else:
+            prefix, consecutive = PREFIX_PATTERN.search(text), CONSECUTIVE_PATTERN.search(text)
+            if consecutive:
+                data["series"] = prefix.group(1).upper() if prefix else None
+                data["number"] = consecutive.group(1)
+
+        match = ISSUE_DATE_PATTERN.search(text)
+        if match:
+            data["issue_date"] = parse_date(match.group(1))
+        match = DUE_DATE_PATTERN.search(text)
+        if match:
+            data["due_date"] = parse_date(match.group(1))
+
+        match = CURRENCY_PATTERN.search(text)
+        data["currency"] = match.group(1) if match else "COP"
+
+        match = CUFE_PATTERN.search(text)
+        if match:
+            data["cufe"] = match.group(1).lower()
+
+        taxes = self._taxes(text)
+        if taxes:
+            data["taxes"] = taxes
+        totals = self._totals(text, taxes or {})
+        if totals:
+            data["totals"] = totals
+            data["items"] = self._items(text, totals["subtotal"], table_items)
+        return data
+
+    def _supplier(self, text: str) -> Dict[str, Any]:
+        supplier: Dict[str, Any] = {}
+        nit = NIT_PATTERN.search(text)
+        if nit:
+            supplier["tax_id"] = f"{nit.group(1).replace('.', '')}-{nit.group(2)}"
+
+        name = BUSINESS_NAME_PATTERN.search(text)
+        if name:
+            supplier["name"] = name.group(1).strip()
+        elif nit:
+            # El emisor suele aparecer justo antes de su NIT (misma línea o la anterior)
+            line_start = text.rfind("\n", 0, nit.start()) + 1
+            before = text[line_start:nit.start()].strip(" :-,")
+            if not before:
+                previous_start = text.rfind("\n", 0, max(line_start - 1, 0)) + 1
+                before = text[previous_start:max(line_start - 1, 0)].strip()
+            if before and re.search(r"[A-Za-z]{3}", before) and not DOCUMENT_TYPE_PATTERN.search(before):
+                supplier["name"] = before
+
+        email = EMAIL_PATTERN.search(text)
+        if email:
+            supplier["email"] = email.group(0)
+        phone = PHONE_PATTERN.search(text)
+        if phone:
+            supplier["phone"] = " ".join(phone.group(1).split())
+        address = ADDRESS_PATTERN.search(text)
+        if address:
+            supplier["address"] = address.group(1).strip()
+        return supplier
+
+    def _taxes(self, text: str) -> Dict[str, Any]:
+        taxes: Dict[str, Any] = {}
+        for prefix, pattern in (("iva", IVA_PATTERN), ("fuente", FUENTE_PATTERN), ("ica", ICA_PATTERN)):
+            match = pattern.search(text)
+            if not match:
+                continue
+            if match.group(1):
+                taxes[f"{prefix}_percentage"] = parse_amount(match.group(1))
+            taxes[f"{prefix}_amount"] = parse_amount(match.group(2))
+        return taxes
+
+    def _totals(self, text: str, taxes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Subtotal y total solo si cuadran con los impuestos y retenciones encontrados
+        """
+        subtotal_match = SUBTOTAL_PATTERN.search(text)
+        total_matches = TOTAL_PATTERN.findall(text)
+        if not subtotal_match or not total_matches:
+            return None
+        subtotal = parse_amount(subtotal_match.group(1))
+        # La última coincidencia suele ser el total a pagar del pie de la factura
+        total = parse_amount(total_matches[-1])
+        if subtotal is None or total is None:
+            return None
+
+        discount_match = DISCOUNT_PATTERN.search(text)
+        discount = parse_amount(discount_match.group(1)) if discount_match else 0.0
+        tax_total = taxes.get("iva_amount") or 0.0
+        retention_total = (taxes.get("fuente_amount") or 0.0) + (taxes.get("ica_amount") or 0.0)
+
+        before_retentions = subtotal - (discount or 0.0) + tax_total
+        if _close(before_retentions - retention_total, total):
+            pass
+        elif _close(before_retentions, total):
+            # El total impreso no descuenta las retenciones (son informativas)
+            pass
+        else:
+            logger.info("Totales por reglas no cuadran; se descartan")
+            return None
+
+        return {
+            "subtotal": subtotal,
+            "discount_total": discount or 0.0,
+            "tax_total": tax_total,
+            "retention_total": retention_total,
+            "total": total
+        }
+
+    def _items(
+        self,
+        text: str,
+        subtotal: float,
+        table_items: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Filas 'descripción cantidad precio subtotal' coherentes entre sí; se
+        descartan todas si su suma no coincide con el subtotal de la factura.
+        Las filas de la tabla del layout se prefieren a las del texto plano.
+        """
+        if table_items and _close(sum(item["subtotal"] for item in table_items), subtotal):
+            return [dict(item) for item in table_items]
+        items = []
+        for match in ITEM_PATTERN.finditer(text):
+            quantity = parse_amount(match.group("quantity"))
+            unit_price = parse_amount(match.group("unit_price"))
+            line_total = parse_amount(match.group("subtotal"))
+            if not quantity or unit_price is None or line_total is None:
+                continue
+            if not _close(quantity * unit_price, line_total):
+                continue
+            items.append({
+                "description": match.group("description").strip(),
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "discount_percentage": 0.0,
+                "subtotal": line_total
+            })
+        if not items or not _close(sum(item["subtotal"] for item in items), subtotal):
+            return []
+        return items
+
+# Instancia compartida (no tiene estado)
+rules_extractor = RulesExtractor()
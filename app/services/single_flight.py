@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Deduplica trabajos idénticos en curso dentro del proceso: las llamadas
+    concurrentes con la misma clave esperan la misma tarea en lugar de
+    repetirla. La entrada se elimina al terminar, así que no guarda resultados
+    (eso lo hace la caché).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+
+    def _register(self, key: str, flight: asyncio.Future):
+        self._flights[key] = flight
+        flight.add_done_callback(lambda done: self._forget(key, done))
+
+    def _forget(self, key: str, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Marca la excepción como leída aunque todos los que esperaban se hayan cancelado
+        if not flight.cancelled():
+            flight.exception()
+
+    def lead(self, key: str) -> Optional[asyncio.Future]:
+        """
+        Registra una ejecución en curso para `key` que resuelve quien llama
+        (set_result / set_exception, o cancel si la abandona), para trabajos
+        que no caben en `do` como un stream. Devuelve None si ya hay una en curso.
+        """
+        if key in self._flights:
+            return None
+        flight = asyncio.get_running_loop().create_future()
+        self._register(key, flight)
+        return flight
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Ejecuta `func` salvo que ya haya una ejecución en curso para `key`.
+        Devuelve (resultado, compartido); un error lo reciben todos los que esperan.
+        """
+        while True:
+            flight = self._flights.get(key)
+            shared = flight is not None
+            if flight is None:
+                flight = asyncio.ensure_future(func())
+                self._register(key, flight)
+            try:
+                # Si el primer cliente se desconecta, la extracción sigue para los demás
+                return await asyncio.shield(flight), shared
+            except asyncio.CancelledError:
+                # Solo un lead() abandonado (un stream desconectado) cancela la ejecución
+                # compartida: se vuelve a ejecutar en lugar de cancelar a quien esperaba
+                if not (shared and flight.cancelled()):
+                    raise
+
+class RedisFlightLock:
+    """
+    Candado por clave compartido entre workers y máquinas. Quien lo obtiene
+    extrae; los demás esperan a que termine y reutilizan el resultado de la
+    caché (requiere CACHE_BACKEND=redis para que la caché sea común).
+    """
+
+    def __init__(self, url: str, prefix: str = "invoice-flight:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise Exception("El backend de coalescencia 'redis' requiere el paquete redis")
+        self.prefix = prefix
+        self.client = redis.from_url(url)
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[bool]:
+        """
+        Mantiene el candado de `key` durante el bloque. Produce True si otro
+        proceso lo tenía y hubo que esperar (el resultado puede estar ya en caché).
+        """
+        from redis.exceptions import LockError
+
+        lock = self.client.lock(
+            self.prefix + key,
+            timeout=settings.COALESCE_LOCK_TTL,
+            sleep=0.05,
+            blocking_timeout=settings.COALESCE_WAIT_TIMEOUT
+        )
+        waited = not await lock.acquire(blocking=False)
+        acquired = not waited or await lock.acquire()
+        if not acquired:
+            # Mejor extraer dos veces que dejar al cliente esperando indefinidamente
+            logger.warning(f"Tiempo de espera agotado por el candado de {key}; se procesa sin él")
+        try:
+            yield waited
+        finally:
+            if acquired:
+                try:
+                    await lock.release()
+                except LockError:
+                    # El candado venció (COALESCE_LOCK_TTL) y puede tenerlo otro proceso
+                    pass
+
+    async def close(self):
+        await self.client.aclose()
+
+def create_flight_lock() -> Optional[RedisFlightLock]:
+    """
+    Crea el candado configurado en COALESCE_BACKEND (memory = solo dentro del proceso, o redis)
+    """
+    if settings.COALESCE_BACKEND.lower() == "redis":
+        return RedisFlightLock(settings.REDIS_URL)
+    return None
+
+# Instancias compartidas por el pipeline
+single_flight = SingleFlight()
+flight_lock = create_flight_lock()
+
+async def close_flight_lock():
+    if flight_lock is not None:
+        await flight_lock.close()
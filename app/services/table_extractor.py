@@ -0,0 +1,244 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from app.core.config import settings
+from app.services.rules_extractor import AMOUNT, SUBTOTAL_PATTERN, _close, parse_amount
+
+logger = logging.getLogger(__name__)
+
+# Bloque de texto de una línea: (x0, x1, texto)
+Segment = Tuple[float, float, str]
+# Línea de una página: (top, bottom, bloques de izquierda a derecha)
+Line = Tuple[float, float, List[Segment]]
+
+# Diferencia vertical máxima (pt) entre palabras de la misma línea, como y_tolerance de pdfplumber
+LINE_TOLERANCE = 3
+
+# Encabezados de columna reconocidos; el orden importa ("Vr. Unitario" antes que "Vr. Total")
+COLUMN_PATTERNS = [
+    (name, re.compile(pattern, re.IGNORECASE)) for name, pattern in (
+        ("unit_price", r"(?:(?:vr|vlr|valor|precio|p)\.?\s*)?unit(?:ario|\.)?"),
+        ("discount_percentage", r"(?:%\s*)?(?:desc(?:uento|\.)?|dcto\.?)(?:\s*%)?"),
+        ("subtotal", r"(?:(?:vr|vlr|valor)\.?\s*)?(?:sub\s*-?\s*)?total|importe"),
+        ("quantity", r"cant(?:idad|\.)?|unds?\.?|qty"),
+        ("description", r"descripci[oó]n|detalle|concepto|producto"),
+    )
+]
+REQUIRED_COLUMNS = {"description", "quantity", "unit_price", "subtotal"}
+NUMERIC_COLUMNS = ("quantity", "unit_price", "discount_percentage", "subtotal")
+
+# Líneas que cierran la tabla (totales e impuestos del pie)
+TABLE_END_PATTERN = re.compile(r"^(sub\s*-?\s*total|total|valor\s+total|iva|son|observaciones)\b", re.IGNORECASE)
+# Celda numérica completa (un texto con números sueltos no es una celda de la tabla)
+AMOUNT_PATTERN = re.compile(AMOUNT + r"\s*%?")
+
+def _normalize(line: str) -> str:
+    return " ".join(line.split())
+
+def page_layout(page) -> List[Line]:
+    """
+    Líneas de una página de pdfplumber con la posición de sus bloques de
+    texto. Los bloques se separan donde hay un hueco sin caracteres (entre
+    columnas), no en los espacios entre palabras.
+    """
+    words = sorted(page.extract_words(keep_blank_chars=True), key=lambda word: (word["top"], word["x0"]))
+    lines: List[Line] = []
+    for word in words:
+        text = word["text"].strip()
+        if not text:
+            continue
+        if lines and word["top"] - lines[-1][0] <= LINE_TOLERANCE:
+            top, bottom, segments = lines[-1]
+            segments.append((word["x0"], word["x1"], text))
+            lines[-1] = (top, max(bottom, word["bottom"]), segments)
+        else:
+            lines.append((word["top"], word["bottom"], [(word["x0"], word["x1"], text)]))
+    for _, _, segments in lines:
+        segments.sort()
+    return lines
+
+def _line_text(segments: List[Segment]) -> str:
+    return _normalize(" ".join(text for _, _, text in segments))
+
+def _header_columns(segments: List[Segment]) -> Optional[List[Tuple[Optional[str], float, float, str]]]:
+    """
+    Columnas (nombre, x0, x1, encabezado) si la línea es el encabezado de la
+    tabla de ítems. Las columnas no reconocidas (código, unidad, IVA...) se
+    conservan sin nombre para que sus celdas no caigan en las vecinas.
+    """
+    columns = []
+    for x0, x1, text in segments:
+        name = next((name for name, pattern in COLUMN_PATTERNS if pattern.fullmatch(_normalize(text))), None)
+        columns.append((name, x0, x1, text))
+    names = [name for name, _, _, _ in columns if name]
+    if not REQUIRED_COLUMNS <= set(names) or len(names) != len(set(names)):
+        return None
+    return columns
+
+def _limits(columns) -> List[float]:
+    """
+    Límites entre columnas vecinas: el punto medio del hueco entre sus
+    encabezados, salvo a la derecha de la descripción, que es texto alineado
+    a la izquierda y llega hasta donde empieza la columna siguiente
+    """
+    return [
+        right[1] - LINE_TOLERANCE if left[0] == "description" else (left[2] + right[1]) / 2
+        for left, right in zip(columns, columns[1:])
+    ]
+
+def _cells(segments: List[Segment], columns) -> Dict[str, str]:
+    """
+    Reparte los bloques de una fila entre las columnas del encabezado según
+    su centro
+    """
+    limits = _limits(columns)
+    cells: Dict[str, List[str]] = {}
+    for x0, x1, text in segments:
+        center = (x0 + x1) / 2
+        index = next((i for i, limit in enumerate(limits) if center < limit), len(columns) - 1)
+        name = columns[index][0]
+        if name:
+            cells.setdefault(name, []).append(text)
+    return {name: " ".join(texts) for name, texts in cells.items()}
+
+def _amount(cell: Optional[str]) -> Optional[float]:
+    match = AMOUNT_PATTERN.fullmatch(cell) if cell else None
+    return parse_amount(match.group(1)) if match else None
+
+def _row(cells: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Ítem de una fila si trae descripción, cantidad, precio y subtotal y
+    cuadran entre sí (el descuento puede venir en porcentaje o en valor)
+    """
+    description = cells.get("description")
+    quantity, unit_price, subtotal = (_amount(cells.get(name)) for name in ("quantity", "unit_price", "subtotal"))
+    if not description or not quantity or unit_price is None or subtotal is None:
+        return None
+    gross = quantity * unit_price
+    discount = _amount(cells.get("discount_percentage")) or 0.0
+    if discount and gross and not _close(gross * (1 - discount / 100), subtotal) and _close(gross - discount, subtotal):
+        discount = 100 * discount / gross
+    if not _close(gross * (1 - discount / 100), subtotal):
+        return None
+    return {
+        "description": description,
+        "quantity": quantity,
+        "unit_price": unit_price,
+        "discount_percentage": round(discount, 4),
+        "subtotal": subtotal
+    }
+
+@dataclass
+class ItemTable:
+    """Tabla de ítems encontrada en el PDF y las líneas de texto que ocupaba"""
+    headers: List[str]
+    items: List[Dict[str, Any]]
+    lines: Set[str] = field(default_factory=set)
+
+    @property
+    def total(self) -> float:
+        return sum(item["subtotal"] for item in self.items)
+
+    def summary(self) -> str:
+        """
+        Línea que sustituye a la tabla en el texto que recibe el modelo
+        """
+        return (
+            f"[Tabla de ítems: {len(self.items)} filas ({' | '.join(self.headers)}) "
+            f"extraídas aparte; suma de subtotales {self.total:.2f}]"
+        )
+
+    def consistent_with(self, text: str) -> bool:
+        """
+        La suma de las filas coincide con el subtotal impreso, si lo hay
+        """
+        match = SUBTOTAL_PATTERN.search(text)
+        subtotal = parse_amount(match.group(1)) if match else None
+        return subtotal is None or _close(self.total, subtotal)
+
+    def strip_rows(self, pages: List[str]) -> List[str]:
+        """
+        Quita de las páginas las líneas de la tabla y deja el resumen donde empezaba
+        """
+        stripped = []
+        summarized = False
+        for page in pages:
+            kept = []
+            for line in page.split("\n"):
+                if _normalize(line) not in self.lines:
+                    kept.append(line)
+                elif not summarized:
+                    kept.append(self.summary())
+                    summarized = True
+            stripped.append("\n".join(kept))
+        return stripped
+
+def find_item_table(layouts: Sequence[List[Line]]) -> Optional[ItemTable]:
+    """
+    Busca la tabla de ítems en las líneas de todas las páginas (page_layout).
+    La tabla empieza en un encabezado con descripción, cantidad, precio
+    unitario y total, sigue en las páginas siguientes (con o sin encabezado
+    repetido) y termina en la línea de subtotal o totales. Las líneas de solo
+    descripción pegadas a una fila son la continuación de su descripción.
+
+    Devuelve None si alguna fila no cuadra (columnas mal leídas): en ese caso
+    el texto completo va al modelo como siempre.
+    """
+    columns = None
+    description_limit = 0.0
+    headers: List[str] = []
+    items: List[Dict[str, Any]] = []
+    lines: Set[str] = set()
+    rejected = 0
+    for layout in layouts:
+        previous = None  # (ítem, bottom) de la última fila de la página
+        for top, bottom, segments in layout:
+            text = _line_text(segments)
+            header = _header_columns(segments)
+            if header is not None:
+                columns = header
+                headers = [column[3] for column in header]
+                names = [column[0] for column in header]
+                limits = _limits(header) + [float("inf")]
+                description_limit = limits[names.index("description")]
+                lines.add(text)
+                previous = None
+                continue
+            if columns is None:
+                continue
+            if TABLE_END_PATTERN.match(text):
+                columns = None
+                continue
+            cells = _cells(segments, columns)
+            # Con dos o más celdas numéricas la línea es una fila, cuadre o no
+            if sum(_amount(cells.get(name)) is not None for name in NUMERIC_COLUMNS) >= 2:
+                item = _row(cells)
+                if item is None:
+                    rejected += 1
+                    previous = None
+                    continue
+                items.append(item)
+                lines.add(text)
+                previous = (item, bottom)
+            elif (
+                previous
+                and set(cells) == {"description"}
+                and all(x1 <= description_limit for _, x1, _ in segments)
+                and top - previous[1] < bottom - top
+            ):
+                # Descripción partida en varias líneas
+                previous[0]["description"] += " " + cells["description"]
+                lines.add(text)
+                previous = (previous[0], bottom)
+            else:
+                previous = None
+
+    if rejected:
+        logger.info(f"Tabla de ítems descartada: {rejected} filas no cuadran")
+        return None
+    if len(items) < settings.TABLE_MIN_ROWS:
+        return None
+    logger.info(f"Tabla de ítems extraída del layout: {len(items)} filas")
+    return ItemTable(headers=headers, items=items, lines=lines)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Worker de la cola de trabajos de /process-async.
+
+Se ejecuta como proceso independiente del API, por lo que puede escalarse
+por separado (varios procesos o máquinas contra la misma cola):
+
+    python -m app.worker --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.core.utils import setup_logging
+from app.database.repository import invoice_writer
+from app.database.session import init_db, close_db
+from app.services.ai_extractor import init_ai_extractor, close_ai_extractor
+from app.services.backend_router import backend_router
+from app.services.extraction_pool import extraction_pool
+from app.services.invoice_pipeline import process_document, DocumentError
+from app.services.job_queue import Job, JobQueue, create_job_queue
+from app.services.llm_scheduler import Priority
+from app.services.ocr import ocr_service
+from app.services.result_cache import result_cache
+from app.services.single_flight import close_flight_lock
+
+logger = logging.getLogger(__name__)
+
+async def _heartbeat(queue: JobQueue, job_id: str):
+    """
+    Renueva el visibility timeout mientras el trabajo sigue en curso
+    """
+    interval = max(settings.JOB_VISIBILITY_TIMEOUT / 3, 1)
+    delay = interval
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await queue.extend(job_id)
+            delay = interval
+        except Exception as e:
+            # Sin renovar, el trabajo volvería a la cola mientras sigue en curso: se reintenta pronto
+            logger.warning(f"Error renovando el trabajo {job_id}: {str(e)}")
+            delay = 1
+
+async def handle_job(queue: JobQueue, job: Job):
+    """
+    Procesa un trabajo y registra su resultado o su fallo en la cola
+    """
+    logger.info(f"Procesando trabajo {job.id} ({job.filename}), intento {job.attempts}/{job.max_attempts}")
+    heartbeat = asyncio.create_task(_heartbeat(queue, job.id))
+    try:
+        invoice_data = await process_document(job.payload, job.cache_key, Priority.ASYNC)
+        invoice_data.processing_notes = [f"Archivo original: {job.filename}"] + (invoice_data.processing_notes or [])
+        await queue.complete(job.id, invoice_data.model_dump_json())
+        logger.info(f"Trabajo completado: {job.id}")
+    except DocumentError as e:
+        # Reintentar no cambia el resultado para un PDF inválido
+        logger.error(f"Trabajo {job.id} rechazado: {str(e)}")
+        await queue.fail(job.id, str(e), retry=False)
+    except Exception as e:
+        logger.error(f"Error en trabajo {job.id}: {str(e)}")
+        await queue.fail(job.id, str(e))
+    finally:
+        heartbeat.cancel()
+
+async def worker_loop(queue: JobQueue, stop: asyncio.Event):
+    """
+    Reclama trabajos de la cola hasta que se solicite la parada
+    """
+    while not stop.is_set():
+        try:
+            job = await queue.dequeue()
+        except Exception as e:
+            logger.error(f"Error leyendo la cola de trabajos: {str(e)}")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), settings.WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await handle_job(queue, job)
+
+async def run_worker(concurrency: int):
+    queue = create_job_queue()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    if settings.PERSIST_INVOICES:
+        await init_db()
+    init_ai_extractor()
+    logger.info(f"Worker iniciado con concurrencia {concurrency} (backend: {settings.JOB_BACKEND})")
+    try:
+        await asyncio.gather(*(worker_loop(queue, stop) for _ in range(concurrency)))
+    finally:
+        # Mismo orden de cierre que el lifespan del API (main.py)
+        await close_ai_extractor()
+        await invoice_writer.close()
+        await close_db()
+        extraction_pool.shutdown()
+        await ocr_service.close()
+        await backend_router.save()
+        await result_cache.close()
+        await close_flight_lock()
+        await queue.close()
+        logger.info("Worker detenido")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker de procesamiento de facturas")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(run_worker(args.concurrency))
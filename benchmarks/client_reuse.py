@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Latencia por petición con un cliente de OpenAI nuevo en cada llamada frente
+al cliente compartido (pool de conexiones con keep-alive).
+
+Con un cliente por petición cada llamada paga la creación del cliente, la
+conexión TCP y el handshake TLS; con el cliente compartido solo la primera.
+Por defecto el servidor falso sirve HTTPS para que el handshake cuente.
+
+Uso:
+    python -m benchmarks.client_reuse --requests 200 --latency 0.01
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.ai_extractor import AIExtractor, create_http_client, create_openai_client
+from app.services.llm_scheduler import LLMScheduler
+from benchmarks.fake_openai_server import start_in_thread
+
+SAMPLE_TEXT = "FACTURA ELECTRONICA DE VENTA FE-1001\nNIT 900123456-7\nTotal a pagar 119.000\n" * 5
+
+def _percentile(values, pct: int) -> float:
+    return statistics.quantiles(values, n=100)[pct - 1] if len(values) >= 100 else max(values)
+
+async def per_request(total_requests: int, concurrency: int):
+    """
+    Crea (y cierra) un cliente para cada petición, como hacía server_web.py
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            client = create_openai_client(create_http_client(verify=False))
+            try:
+                await AIExtractor(client=client, scheduler=LLMScheduler(max_concurrency=1)).extract_invoice_data(SAMPLE_TEXT)
+            finally:
+                await client.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(total_requests)))
+    return latencies
+
+async def shared(total_requests: int, concurrency: int):
+    """
+    Un único cliente durante toda la prueba, como el de la aplicación
+    """
+    client = create_openai_client(create_http_client(verify=False))
+    extractor = AIExtractor(client=client, scheduler=LLMScheduler(max_concurrency=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await extractor.extract_invoice_data(SAMPLE_TEXT)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    try:
+        await asyncio.gather(*(one() for _ in range(total_requests)))
+    finally:
+        await client.close()
+    return latencies
+
+async def main(total_requests: int, concurrency: int, latency: float, tls: bool):
+    base_url, server = start_in_thread(latency, tls=tls)
+    settings.OPENAI_API_KEY = "test"
+    settings.OPENAI_BASE_URL = base_url
+    try:
+        print(f"Servidor: {base_url} ({total_requests} peticiones, concurrencia {concurrency})")
+        print(f"{'modo':>12} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+        for name, runner in (("por petición", per_request), ("compartido", shared)):
+            latencies = await runner(total_requests, concurrency)
+            print(
+                f"{name:>12} {statistics.median(latencies):>10.2f} "
+                f"{_percentile(latencies, 95):>10.2f} {_percentile(latencies, 99):>10.2f}"
+            )
+    finally:
+        server.should_exit = True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cliente de OpenAI por petición vs compartido")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--no-tls", action="store_true", help="Usar HTTP plano en el servidor falso")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency, not args.no_tls))
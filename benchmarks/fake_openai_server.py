@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita el endpoint de chat completions de OpenAI.
+
+Responde siempre con una factura JSON fija después de una latencia
+configurable, para poder medir el cliente sin gastar tokens reales.
+"""
+import argparse
+import asyncio
+import json
+import datetime
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+SAMPLE_INVOICE = {
+    "document_type": "FACTURA ELECTRONICA DE VENTA",
+    "series": "FE",
+    "number": "1001",
+    "issue_date": "2025-07-24",
+    "due_date": "2025-08-24",
+    "supplier": {
+        "name": "Proveedor de Prueba S.A.S.",
+        "tax_id": "900123456-7",
+        "address": "Calle 123 # 45-67, Bogotá",
+        "phone": "6011234567",
+        "email": "facturacion@proveedor.com"
+    },
+    "currency": "COP",
+    "items": [
+        {
+            "description": "Servicio de consultoría",
+            "quantity": 1,
+            "unit_price": 100000,
+            "discount_percentage": 0,
+            "subtotal": 100000
+        }
+    ],
+    "taxes": {
+        "ica_percentage": None,
+        "ica_amount": None,
+        "fuente_percentage": None,
+        "fuente_amount": None,
+        "iva_percentage": 19.0,
+        "iva_amount": 19000
+    },
+    "totals": {
+        "subtotal": 100000,
+        "discount_total": 0,
+        "tax_total": 19000,
+        "retention_total": 0,
+        "total": 119000
+    }
+}
+
+def _content_chunks(content: str, size: int = 4):
+    # ~4 caracteres por token, como en los modelos reales
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+def create_app(latency: float = 0.5, token_delay: float = 0.0) -> FastAPI:
+    """
+    Crea la aplicación falsa con la latencia indicada (en segundos).
+    `token_delay` simula el tiempo de generación de cada token; con
+    `"stream": true` los tokens se envían por SSE a medida que se "generan".
+    """
+    app = FastAPI(title="Fake OpenAI")
+    app.state.latency = latency
+    app.state.token_delay = token_delay
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        content = json.dumps(SAMPLE_INVOICE, ensure_ascii=False, indent=2)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "gpt-4o")
+        chunks = _content_chunks(content)
+        await asyncio.sleep(app.state.latency)
+
+        if body.get("stream"):
+            async def event_stream():
+                for piece in chunks:
+                    await asyncio.sleep(app.state.token_delay)
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        await asyncio.sleep(app.state.token_delay * len(chunks))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }
+            ],
+            "usage": {
+                "prompt_tokens": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4,
+                "completion_tokens": len(chunks),
+                "total_tokens": 0
+            }
+        }
+
+    return app
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _self_signed_cert():
+    """
+    Genera un certificado autofirmado para 127.0.0.1 y devuelve (certfile, keyfile)
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+    import ipaddress
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    directory = tempfile.mkdtemp(prefix="fake-openai-")
+    certfile = f"{directory}/cert.pem"
+    keyfile = f"{directory}/key.pem"
+    with open(certfile, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    return certfile, keyfile
+
+def start_in_thread(latency: float = 0.5, port: int = 0, tls: bool = False, token_delay: float = 0.0):
+    """
+    Inicia el servidor en un hilo y devuelve (base_url, server).
+    Con `tls=True` sirve HTTPS con un certificado autofirmado.
+    """
+    port = port or _free_port()
+    ssl_options = {}
+    if tls:
+        certfile, keyfile = _self_signed_cert()
+        ssl_options = {"ssl_certfile": certfile, "ssl_keyfile": keyfile}
+    config = uvicorn.Config(create_app(latency, token_delay), host="127.0.0.1", port=port, log_level="warning", **ssl_options)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    scheme = "https" if tls else "http"
+    return f"{scheme}://127.0.0.1:{port}/v1", server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso de OpenAI")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.token_delay), host="127.0.0.1", port=args.port)
@@ -0,0 +1,106 @@
+"""
+PDFs sintéticos de facturas electrónicas colombianas para los benchmarks.
+
+Renderiza las páginas de invoice_corpus como un PDF de texto (una página de
+PDF por página de la factura), sin dependencias externas. Con la misma semilla
+se obtienen siempre los mismos bytes. build_pdf es también el generador de
+los PDFs de los tests (tests/conftest.py).
+"""
+import random
+from typing import List, Sequence, Tuple, Union
+
+from benchmarks.invoice_corpus import SyntheticInvoice, generate_invoice
+
+# Ítems por página de la factura (las líneas caben en una página carta con 8 pt)
+ITEMS_PER_PAGE = 25
+
+# Desplazamiento (pt) de cada columna de la tabla de ítems respecto al margen
+COLUMN_OFFSETS = (0, 300, 360, 460)
+
+# Imagen en línea de 2x2 píxeles a toda página, como la de un PDF escaneado
+SCANNED_IMAGE = b"q 612 0 0 792 0 0 cm BI /W 2 /H 2 /CS /G /BPC 8 ID \x00\xff\xff\x00 EI Q "
+
+Line = Union[str, Sequence[str]]
+
+def _escape(line: str) -> bytes:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("cp1252", errors="replace")
+
+def _line(line: Line) -> bytes:
+    """
+    Una línea de texto; si lleva tabuladores (o es una tupla de celdas), cada
+    celda en su columna de COLUMN_OFFSETS
+    """
+    if isinstance(line, str):
+        if "\t" not in line:
+            return b"(" + _escape(line) + b") Tj T*"
+        line = line.split("\t")
+    cells = [
+        b"%d 0 Td (" % offset + _escape(cell) + b") Tj %d 0 Td" % -offset
+        for offset, cell in zip(COLUMN_OFFSETS, line)
+    ]
+    return b" ".join(cells) + b" T*"
+
+def build_pdf(pages: Sequence[Union[str, Sequence[Line]]], scanned: bool = False) -> bytes:
+    """
+    Construye un PDF con una página por cada elemento de `pages`: un texto
+    (una línea de PDF por línea) o una lista de líneas. Usa Helvetica con
+    WinAnsiEncoding para las tildes. Con `scanned`, cada página lleva además
+    una imagen de página completa.
+    """
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    ]
+    page_ids = []
+    for page in pages:
+        lines = page.split("\n") if isinstance(page, str) else page
+        stream = (SCANNED_IMAGE if scanned else b"") + b"BT /F1 8 Tf 11 TL 40 770 Td " + b" ".join(
+            _line(line) for line in lines
+        ) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def generate_invoice_pdf(rng: random.Random, pages: int, columns: bool = False) -> Tuple[bytes, SyntheticInvoice]:
+    """
+    Factura de exactamente `pages` páginas con un número de ítems aleatorio
+    dentro de ese rango de páginas (con `columns`, la tabla de ítems en columnas)
+    """
+    num_items = rng.randrange(ITEMS_PER_PAGE * (pages - 1) + 1, ITEMS_PER_PAGE * pages + 1)
+    invoice = generate_invoice(rng, num_items, items_per_page=ITEMS_PER_PAGE, columns=columns)
+    return build_pdf(invoice.pages), invoice
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Genera PDFs sintéticos de facturas")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="benchmark-pdfs")
+    args = parser.parse_args()
+    output = Path(args.output)
+    output.mkdir(exist_ok=True)
+    rng = random.Random(args.seed)
+    for pages in args.pages:
+        content, invoice = generate_invoice_pdf(rng, pages)
+        path = output / f"factura-{pages:03d}p.pdf"
+        path.write_bytes(content)
+        print(f"{path}: {len(invoice.items)} ítems, {len(content)} bytes")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark de GET /api/v1/invoices (InvoiceRepository.search) con muchas facturas.
+
+Llena una base SQLite con N facturas sintéticas y recorre las páginas con el
+cursor keyset, midiendo la latencia p95 por profundidad de página. Como
+referencia mide también la misma consulta con OFFSET, que se degrada
+linealmente con la profundidad.
+
+Uso:
+    python -m benchmarks.invoice_search --invoices 1000000 --db /tmp/bench_invoices.db
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.database.repository import InvoiceRepository
+from app.models.invoice import Base
+
+PAGE_SIZE = 50
+
+def populate(db_path: str, total: int, suppliers: int = 500):
+    """
+    Crea el esquema (con sus índices) e inserta `total` facturas
+    """
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    rng = random.Random(42)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany(
+        "INSERT INTO suppliers (id, tax_id, name) VALUES (?, ?, ?)",
+        [(i, f"900{i:06d}-{i % 10}", f"Proveedor {i}") for i in range(1, suppliers + 1)]
+    )
+    start_date = date(2020, 1, 1)
+    batch = []
+    for i in range(total):
+        batch.append((
+            str(uuid.UUID(int=rng.getrandbits(128))),
+            "FACTURA ELECTRONICA",
+            rng.choice(["FE", "FV", "SETP"]),
+            str(i),
+            (start_date + timedelta(days=rng.randrange(2000))).isoformat(),
+            rng.randrange(1, suppliers + 1),
+            rng.choice(["COP", "COP", "COP", "USD"]),
+            round(rng.uniform(10_000, 50_000_000), 2)
+        ))
+        if len(batch) == 50_000:
+            _insert(conn, batch)
+            batch = []
+    if batch:
+        _insert(conn, batch)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+def _insert(conn: sqlite3.Connection, rows):
+    conn.executemany(
+        "INSERT INTO invoices (id, document_type, series, number, issue_date, supplier_id, currency, total, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+        rows
+    )
+    conn.commit()
+
+def p95(values):
+    return statistics.quantiles(values, n=20)[18] if len(values) >= 20 else max(values)
+
+async def walk_keyset(repository: InvoiceRepository, max_depth: int, filters: dict):
+    """
+    Recorre páginas con el cursor y devuelve la latencia (ms) de cada una
+    """
+    latencies = []
+    cursor = None
+    for _ in range(max_depth):
+        start = time.perf_counter()
+        items, cursor = await repository.search(limit=PAGE_SIZE, cursor=cursor, **filters)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if cursor is None:
+            break
+    return latencies
+
+async def offset_latency(engine, depth: int, samples: int = 20) -> float:
+    """
+    p95 (ms) de la consulta equivalente con OFFSET a la profundidad dada
+    """
+    query = text(
+        "SELECT id FROM invoices WHERE issue_date IS NOT NULL "
+        "ORDER BY issue_date DESC, id DESC LIMIT :limit OFFSET :offset"
+    )
+    latencies = []
+    async with engine.connect() as conn:
+        for _ in range(samples):
+            start = time.perf_counter()
+            (await conn.execute(query, {"limit": PAGE_SIZE, "offset": depth * PAGE_SIZE})).all()
+            latencies.append((time.perf_counter() - start) * 1000)
+    return p95(latencies)
+
+async def run(db_path: str, depths, filters: dict):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    repository = InvoiceRepository(async_sessionmaker(engine, expire_on_commit=False))
+    latencies = await walk_keyset(repository, max(depths), filters)
+
+    report = {"page_size": PAGE_SIZE, "filters": filters, "depths": []}
+    previous = 0
+    for depth in depths:
+        bucket = latencies[previous:depth]
+        previous = depth
+        if not bucket:
+            break
+        entry = {
+            "depth": depth,
+            "keyset_p95_ms": round(p95(bucket), 3),
+            "offset_p95_ms": round(await offset_latency(engine, depth), 3) if not filters else None
+        }
+        report["depths"].append(entry)
+    await engine.dispose()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda de facturas")
+    parser.add_argument("--invoices", type=int, default=1_000_000)
+    parser.add_argument("--db", default="bench_invoices.db")
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 10, 100, 1000, 5000])
+    parser.add_argument("--supplier-tax-id", default=None, help="Filtrar por NIT (p. ej. 900000001-1)")
+    parser.add_argument("--json", action="store_true", help="Imprimir el reporte en JSON")
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"Generando {args.invoices} facturas en {args.db}...")
+        start = time.perf_counter()
+        populate(args.db, args.invoices)
+        print(f"Base generada en {time.perf_counter() - start:.1f}s")
+
+    filters = {"supplier_tax_id": args.supplier_tax_id} if args.supplier_tax_id else {}
+    report = asyncio.run(run(args.db, args.depths, filters))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'profundidad':>12} {'keyset p95 (ms)':>16} {'offset p95 (ms)':>16}")
+        for entry in report["depths"]:
+            offset = f"{entry['offset_p95_ms']:.2f}" if entry["offset_p95_ms"] is not None else "-"
+            print(f"{entry['depth']:>12} {entry['keyset_p95_ms']:>16.2f} {offset:>16}")
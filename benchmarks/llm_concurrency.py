@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de AIExtractor contra el servidor falso de OpenAI.
+
+Lanza N extracciones con distintos límites de concurrencia y muestra el
+throughput obtenido. Con el cliente asíncrono el throughput debe crecer
+casi linealmente con la concurrencia hasta saturar el servidor.
+
+Uso:
+    python -m benchmarks.llm_concurrency --requests 64 --latency 0.5
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from openai import AsyncOpenAI
+
+from app.services.ai_extractor import AIExtractor
+from app.services.llm_scheduler import LLMScheduler
+from benchmarks.fake_openai_server import start_in_thread
+
+SAMPLE_TEXT = "FACTURA ELECTRONICA DE VENTA FE-1001\nNIT 900123456-7\nTotal a pagar 119.000\n" * 5
+
+async def run_level(base_url: str, concurrency: int, total_requests: int) -> float:
+    client = AsyncOpenAI(api_key="test", base_url=base_url)
+    extractor = AIExtractor(client=client, scheduler=LLMScheduler(max_concurrency=concurrency))
+    start = time.perf_counter()
+    await asyncio.gather(*(extractor.extract_invoice_data(SAMPLE_TEXT) for _ in range(total_requests)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed
+
+async def main(levels, total_requests: int, latency: float):
+    base_url, server = start_in_thread(latency)
+    try:
+        print(f"{'concurrencia':>12} {'tiempo (s)':>11} {'req/s':>8}")
+        for level in levels:
+            elapsed = await run_level(base_url, level, total_requests)
+            print(f"{level:>12} {elapsed:>11.2f} {total_requests / elapsed:>8.1f}")
+    finally:
+        server.should_exit = True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga concurrente sobre AIExtractor")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+    asyncio.run(main(args.levels, args.requests, args.latency))
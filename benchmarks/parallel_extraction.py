@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Extracción de texto por rangos de páginas con distintos tamaños del pool.
+
+Extrae la misma factura sintética (200 páginas por defecto) con pools de
+1, 2, 4... procesos y muestra el tiempo y la aceleración respecto a un solo
+proceso. La aceleración no puede superar el número de núcleos; solo hay
+mediciones en un núcleo (~1,0x), así que en varios núcleos está por medir.
+
+Uso:
+    python -m benchmarks.parallel_extraction --pages 200 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.extraction_pool import ExtractionPool
+from benchmarks.invoice_pdf import generate_invoice_pdf
+
+async def run_level(path: str, workers: int, runs: int) -> float:
+    """
+    Mejor tiempo de `runs` extracciones con un pool de `workers` procesos ya arrancado
+    """
+    pool = ExtractionPool(max_workers=workers, job_timeout=0)
+    try:
+        # Arranca los procesos del pool fuera de la medición
+        await asyncio.gather(*(pool.run(sum, [i]) for i in range(workers)))
+        best = float("inf")
+        text = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = await pool.extract(path)
+            best = min(best, time.perf_counter() - start)
+            if text is not None and result["text"] != text:
+                raise Exception("El texto cambió con el tamaño del pool")
+            text = result["text"]
+        return best
+    finally:
+        pool.shutdown()
+
+async def main(pages: int, levels, runs: int, seed: int):
+    # Reparte incluso con pocas páginas: la comparación es siempre por rangos
+    settings.PDF_PARALLEL_MIN_PAGES = 1
+    pdf, _ = generate_invoice_pdf(random.Random(f"{seed}-{pages}"), pages)
+    with tempfile.TemporaryDirectory(prefix="invoice-bench-") as workdir:
+        path = os.path.join(workdir, "factura.pdf")
+        Path(path).write_bytes(pdf)
+        print(f"{pages} páginas, {os.cpu_count()} núcleos")
+        print(f"{'procesos':>8} {'tiempo (s)':>11} {'aceleración':>12}")
+        baseline = None
+        for workers in levels:
+            elapsed = await run_level(path, workers, runs)
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>11.2f} {baseline / elapsed:>11.2f}x")
+        if max(levels) > (os.cpu_count() or 1):
+            print(f"Aviso: más procesos que núcleos ({os.cpu_count()}); por encima de ese número no hay aceleración")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extracción de texto en paralelo por rangos de páginas")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main(args.pages, args.workers, args.runs, args.seed))
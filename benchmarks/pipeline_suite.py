@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Suite reproducible del pipeline de facturas de punta a punta.
+
+Mide, sobre PDFs sintéticos de 1 a 200 páginas (misma semilla, mismos bytes):
+
+- extract_text:      PDFProcessor.extract_text sobre el archivo en disco
+- ai_parse_convert:  parseo del JSON del modelo y conversión a InvoiceResponse
+- process_route:     POST /api/v1/invoices/process completo (pool de procesos,
+                     reglas/IA, persistencia) contra el servidor falso de OpenAI
+
+Cada caso corre en un proceso nuevo para que el pico de RSS sea el suyo; en
+process_route el de los procesos del pool de extracción se informa aparte.
+La salida es JSON para poder comparar ejecuciones (--baseline muestra la
+variación de p50/p95).
+
+Uso:
+    python -m benchmarks.pipeline_suite --pages 1 10 50 200 --runs 5 --output bench.json
+    python -m benchmarks.pipeline_suite --cases process_route --concurrency 8 --baseline bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.invoice_pdf import generate_invoice_pdf
+
+CASES = ("extract_text", "ai_parse_convert", "process_route")
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    Percentil por rango más cercano (sin interpolar, estable con pocas muestras)
+    """
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(samples_ms: List[float], wall_s: float) -> Dict[str, Any]:
+    return {
+        "runs": len(samples_ms),
+        "latency_ms": {
+            "p50": round(percentile(samples_ms, 50), 2),
+            "p95": round(percentile(samples_ms, 95), 2),
+            "p99": round(percentile(samples_ms, 99), 2),
+            "mean": round(sum(samples_ms) / len(samples_ms), 2),
+            "max": round(max(samples_ms), 2)
+        },
+        "throughput_per_s": round(len(samples_ms) / wall_s, 3) if wall_s else None
+    }
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _measure(func: Callable[[], Any], runs: int, warmup: int, budget: float) -> Dict[str, Any]:
+    """
+    Ejecuta `func` secuencialmente; corta antes de `runs` si se agota el presupuesto
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < runs and (not samples or time.perf_counter() - start < budget):
+        begin = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - begin) * 1000)
+    return summarize(samples, time.perf_counter() - start)
+
+def case_extract_text(pdf: bytes, invoice, options: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.pdf_processor import PDFProcessor
+
+    path = Path(options["workdir"]) / "factura.pdf"
+    path.write_bytes(pdf)
+    return _measure(lambda: PDFProcessor.extract_text(str(path)), options["runs"], options["warmup"], options["budget"])
+
+def case_ai_parse_convert(pdf: bytes, invoice, options: Dict[str, Any]) -> Dict[str, Any]:
+    from app.services.ai_extractor import AIExtractor
+    from app.services.llm_scheduler import LLMScheduler
+    from app.services.rules_extractor import rules_extractor
+
+    # La respuesta del modelo se simula con los campos reales de la factura
+    content = json.dumps(rules_extractor.extract_fields(invoice.text), ensure_ascii=False, indent=2)
+    extractor = AIExtractor(client=object(), scheduler=LLMScheduler(max_concurrency=1))
+    text = invoice.text
+
+    def parse_and_convert():
+        data, error = extractor._parse_json(content)
+        if data is None:
+            raise Exception(f"JSON inválido: {error}")
+        extractor._build_response(data, text)
+
+    result = _measure(parse_and_convert, options["runs"], options["warmup"], options["budget"])
+    result["response_bytes"] = len(content.encode("utf-8"))
+    return result
+
+async def _process_route(pdf: bytes, options: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def request() -> float:
+                begin = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/invoices/process",
+                    files={"file": ("factura.pdf", pdf, "application/pdf")}
+                )
+                if response.status_code != 200:
+                    raise Exception(f"/process respondió {response.status_code}: {response.text[:200]}")
+                return (time.perf_counter() - begin) * 1000
+
+            for _ in range(options["warmup"]):
+                await request()
+            semaphore = asyncio.Semaphore(options["concurrency"])
+            samples: List[float] = []
+            start = time.perf_counter()
+
+            async def limited():
+                async with semaphore:
+                    if samples and time.perf_counter() - start >= options["budget"]:
+                        return
+                    samples.append(await request())
+
+            await asyncio.gather(*(limited() for _ in range(options["runs"])))
+            return summarize(samples, time.perf_counter() - start)
+
+def case_process_route(pdf: bytes, invoice, options: Dict[str, Any]) -> Dict[str, Any]:
+    result = asyncio.run(_process_route(pdf, options))
+    result["concurrency"] = options["concurrency"]
+    # El pool de extracción ya se cerró con el lifespan: sus procesos cuentan como hijos terminados
+    result["peak_rss_pool_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return result
+
+CASE_FUNCTIONS = {
+    "extract_text": case_extract_text,
+    "ai_parse_convert": case_ai_parse_convert,
+    "process_route": case_process_route
+}
+
+def _run_case(case: str, pages: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Punto de entrada del proceso hijo: configura el entorno antes de importar la app
+    """
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": options["base_url"],
+        # Cada petición debe recorrer el pipeline completo
+        "CACHE_BACKEND": "none",
+        "RULES_FAST_PATH": str(options["rules"]),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/invoices.db",
+        "JOB_SQLITE_PATH": f"{workdir}/jobs.db",
+        "BACKEND_STATS_PATH": f"{workdir}/backend_stats.json"
+    })
+    import logging
+    logging.disable(logging.INFO)
+
+    # La misma semilla y tamaño generan siempre el mismo PDF, en cualquier caso
+    pdf, invoice = generate_invoice_pdf(random.Random(f"{options['seed']}-{pages}"), pages)
+    result = CASE_FUNCTIONS[case](pdf, invoice, dict(options, workdir=workdir))
+    return {
+        "case": case,
+        "pages": pages,
+        "items": len(invoice.items),
+        "pdf_bytes": len(pdf),
+        **result,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF)
+    }
+
+def compare(baseline: Dict[str, Any], report: Dict[str, Any]) -> List[str]:
+    """
+    Variación de p50/p95 respecto a una ejecución anterior, por caso y tamaño
+    """
+    previous = {(r["case"], r["pages"]): r for r in baseline.get("results", [])}
+    lines = [f"{'caso':<18} {'págs':>5} {'p50 ms':>10} {'Δ p50':>8} {'p95 ms':>10} {'Δ p95':>8}"]
+    for result in report["results"]:
+        before = previous.get((result["case"], result["pages"]))
+        if before is None:
+            continue
+        deltas = [
+            (result["latency_ms"][q] / before["latency_ms"][q] - 1) * 100 if before["latency_ms"][q] else 0.0
+            for q in ("p50", "p95")
+        ]
+        lines.append(
+            f"{result['case']:<18} {result['pages']:>5} {result['latency_ms']['p50']:>10.1f} {deltas[0]:>+7.1f}%"
+            f" {result['latency_ms']['p95']:>10.1f} {deltas[1]:>+7.1f}%"
+        )
+    return lines
+
+def main(args) -> Dict[str, Any]:
+    from benchmarks.fake_openai_server import start_in_thread
+
+    # El servidor falso corre en este proceso para no competir por el GIL del caso medido
+    base_url, server = start_in_thread(args.llm_latency)
+    options = {
+        "runs": args.runs,
+        "warmup": args.warmup,
+        "budget": args.budget,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "rules": args.rules,
+        "base_url": base_url
+    }
+    report = {
+        "suite": "pipeline",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {key: value for key, value in options.items() if key != "base_url"}
+                  | {"cases": args.cases, "pages": args.pages, "llm_latency_s": args.llm_latency},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "results": []
+    }
+    context = multiprocessing.get_context("spawn")
+    try:
+        for case in args.cases:
+            for pages in args.pages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(_run_case, case, pages, options).result()
+                report["results"].append(result)
+                print(
+                    f"{case} {pages} págs: p50 {result['latency_ms']['p50']:.1f} ms, "
+                    f"{result['throughput_per_s']} /s, RSS {result['peak_rss_mb']} MB",
+                    file=sys.stderr
+                )
+    finally:
+        server.should_exit = True
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de punta a punta del pipeline de facturas")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--budget", type=float, default=60.0, help="segundos máximos de medición por caso")
+    parser.add_argument("--concurrency", type=int, default=1, help="peticiones simultáneas en process_route")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--rules", action="store_true", help="permitir la vía rápida por reglas en process_route")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto, stdout)")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    args = parser.parse_args()
+
+    report = main(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        print("\n".join(compare(baseline, report)), file=sys.stderr)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Reporte de ahorro de tokens de la compactación del prompt.
+
+Sobre un corpus sintético compara tres entradas para el modelo: el texto
+completo, el truncado a 2000 caracteres que usaba server_web.py y el texto
+compactado. Para cada una mide los tokens y qué fracción de los campos reales
+(NIT, fechas, totales, impuestos, ítems) sigue presente en el texto.
+
+Ese "recall" es solo una búsqueda de subcadenas: es condición necesaria para
+que la extracción conserve la precisión, no prueba de ello (una etiqueta
+separada de su importe cuenta como presente). Por eso también se reporta la
+exactitud de los campos extraídos: se pasa cada variante por el extractor de
+reglas y se comparan sus campos con los valores reales. El extractor de
+reglas hace de sustituto determinista del modelo; no mide al modelo mismo.
+
+Uso:
+    python -m benchmarks.prompt_compaction --invoices 50 --json
+"""
+import argparse
+import json
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.prompt_compactor import compact_pages, count_tokens
+from app.services.rules_extractor import parse_amount, rules_extractor
+from benchmarks.invoice_corpus import generate_corpus
+
+def field_recall(invoice, text: str) -> float:
+    """
+    Fracción de valores reales (campos e ítems) presentes en el texto
+    """
+    haystack = " ".join(text.split())
+    expected = list(invoice.fields.values()) + invoice.items
+    return sum(1 for value in expected if value in haystack) / len(expected)
+
+def field_accuracy(invoice, text: str) -> float:
+    """
+    Fracción de campos e ítems que el extractor de reglas devuelve con el valor real
+    """
+    data = rules_extractor.extract_fields(text)
+    supplier = data.get("supplier") or {}
+    taxes = data.get("taxes") or {}
+    totals = data.get("totals") or {}
+    extracted = {
+        "tax_id": supplier.get("tax_id"),
+        "series": data.get("series"),
+        "number": data.get("number"),
+        "issue_date": data.get("issue_date"),
+        "due_date": data.get("due_date"),
+        "supplier": supplier.get("name"),
+        "cufe": data.get("cufe"),
+        "subtotal": totals.get("subtotal"),
+        "iva_amount": taxes.get("iva_amount"),
+        "fuente_amount": taxes.get("fuente_amount"),
+        "ica_amount": taxes.get("ica_amount"),
+        "total": totals.get("total")
+    }
+    hits = 0
+    for name, expected in invoice.fields.items():
+        value = extracted.get(name)
+        if isinstance(value, float):
+            hits += abs(value - parse_amount(expected)) < 0.01
+        else:
+            hits += value == expected
+    descriptions = {item.get("description") for item in data.get("items") or []}
+    hits += sum(1 for description in invoice.items if description in descriptions)
+    return hits / (len(invoice.fields) + len(invoice.items))
+
+def run(size: int, seed: int, max_tokens: int):
+    rows = {"completo": [], "truncado_2000": [], "compactado": []}
+    for invoice in generate_corpus(size, seed):
+        full = invoice.text
+        compaction = compact_pages(invoice.pages, max_tokens=max_tokens)
+        for name, text in (("completo", full), ("truncado_2000", full[:2000]), ("compactado", compaction.text)):
+            rows[name].append((count_tokens(text), field_recall(invoice, text), field_accuracy(invoice, text)))
+
+    baseline = sum(tokens for tokens, _, _ in rows["completo"])
+    report = {"invoices": size, "max_tokens": max_tokens, "variants": {}}
+    for name, values in rows.items():
+        tokens = [t for t, _, _ in values]
+        recalls = [r for _, r, _ in values]
+        accuracies = [a for _, _, a in values]
+        report["variants"][name] = {
+            "tokens_total": sum(tokens),
+            "tokens_mean": round(statistics.mean(tokens), 1),
+            "tokens_saved_pct": round(100 * (1 - sum(tokens) / baseline), 1),
+            "field_recall_mean": round(statistics.mean(recalls), 4),
+            "field_recall_min": round(min(recalls), 4),
+            "field_accuracy_mean": round(statistics.mean(accuracies), 4),
+            "field_accuracy_min": round(min(accuracies), 4)
+        }
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ahorro de tokens de la compactación del prompt")
+    parser.add_argument("--invoices", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--max-tokens", type=int, default=12000)
+    parser.add_argument("--json", action="store_true", help="Imprimir el reporte en JSON")
+    args = parser.parse_args()
+
+    report = run(args.invoices, args.seed, args.max_tokens)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(
+            f"{'variante':>14} {'tokens':>10} {'ahorro %':>9} {'recall campos':>14} {'recall mín':>11} "
+            f"{'exactitud':>10} {'exactitud mín':>14}"
+        )
+        for name, entry in report["variants"].items():
+            print(
+                f"{name:>14} {entry['tokens_total']:>10} {entry['tokens_saved_pct']:>9.1f} "
+                f"{entry['field_recall_mean']:>14.4f} {entry['field_recall_min']:>11.4f} "
+                f"{entry['field_accuracy_mean']:>10.4f} {entry['field_accuracy_min']:>14.4f}"
+            )
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tiempo hasta el primer campo (time-to-first-field) con y sin streaming.
+
+Sin streaming ningún campo está disponible hasta que termina la respuesta
+completa; con streaming cada campo se emite en cuanto su valor JSON se
+cierra. El servidor falso simula la latencia inicial y el tiempo por token.
+
+Uso:
+    python -m benchmarks.streaming_ttff --runs 5 --latency 0.3 --token-delay 0.005
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.ai_extractor import AIExtractor, create_openai_client
+from app.services.llm_scheduler import LLMScheduler
+from benchmarks.fake_openai_server import start_in_thread
+
+SAMPLE_TEXT = "FACTURA ELECTRONICA DE VENTA FE-1001\nNIT 900123456-7\nTotal a pagar 119.000\n" * 5
+
+async def measure_blocking(extractor: AIExtractor) -> dict:
+    start = time.perf_counter()
+    await extractor.extract_invoice_data(SAMPLE_TEXT)
+    elapsed = (time.perf_counter() - start) * 1000
+    return {"first_field_ms": elapsed, "supplier_ms": elapsed, "totals_ms": elapsed, "total_ms": elapsed}
+
+async def measure_streaming(extractor: AIExtractor) -> dict:
+    start = time.perf_counter()
+    marks = {}
+    async for event, name, _ in extractor.stream_invoice_data(SAMPLE_TEXT):
+        now = (time.perf_counter() - start) * 1000
+        if event == "field":
+            marks.setdefault("first_field_ms", now)
+            if name in ("supplier", "totals"):
+                marks[f"{name}_ms"] = now
+    marks["total_ms"] = (time.perf_counter() - start) * 1000
+    return marks
+
+async def main(runs: int, latency: float, token_delay: float):
+    base_url, server = start_in_thread(latency, token_delay=token_delay)
+    settings.OPENAI_API_KEY = "test"
+    settings.OPENAI_BASE_URL = base_url
+    client = create_openai_client()
+    extractor = AIExtractor(client=client, scheduler=LLMScheduler(max_concurrency=1))
+    report = {"runs": runs, "latency_s": latency, "token_delay_s": token_delay, "modes": {}}
+    try:
+        for mode, measure in (("sin_streaming", measure_blocking), ("streaming", measure_streaming)):
+            samples = [await measure(extractor) for _ in range(runs)]
+            report["modes"][mode] = {
+                key: round(statistics.median(sample[key] for sample in samples), 1)
+                for key in ("first_field_ms", "supplier_ms", "totals_ms", "total_ms")
+            }
+    finally:
+        await client.close()
+        server.should_exit = True
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-to-first-field con y sin streaming")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.runs, args.latency, args.token_delay)), indent=2))
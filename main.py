@@ -1,19 +1,51 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 import uvicorn
 import os
 from pathlib import Path
+from contextlib import asynccontextmanager
 
 from app.api.v1.endpoints import invoices
 from app.core.config import settings
+from app.core import metrics
+from app.database.repository import invoice_writer
+from app.database.session import init_db, close_db
+from app.services.ai_extractor import init_ai_extractor, close_ai_extractor
+from app.services.backend_router import backend_router
+from app.services.extraction_pool import extraction_pool
+from app.services.job_queue import job_queue, job_watcher
+from app.services.ocr import ocr_service
+from app.services.result_cache import result_cache
+from app.services.single_flight import close_flight_lock
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Inicializa y libera los recursos compartidos de la aplicación
+    """
+    if settings.PERSIST_INVOICES:
+        await init_db()
+    init_ai_extractor()
+    yield
+    await close_ai_extractor()
+    await invoice_writer.close()
+    await close_db()
+    extraction_pool.shutdown()
+    await ocr_service.close()
+    await backend_router.save()
+    await result_cache.close()
+    await close_flight_lock()
+    await job_watcher.close()
+    await job_queue.close()
 
 # Crear instancia de FastAPI
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="API para procesamiento de facturas con IA",
     version="1.0.0",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -40,6 +72,22 @@ async def root():
         "docs": "/docs"
     }
 
+@app.get("/ui", response_class=HTMLResponse)
+async def web_interface():
+    """
+    Interfaz web; con esta API usa el endpoint de streaming (/process-stream)
+    """
+    return (Path(__file__).parent / "web_interface.html").read_text(encoding="utf-8")
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Métricas del proceso en formato de texto de Prometheus
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desactivadas")
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -26,13 +26,16 @@ except ImportError as e:
     sys.exit(1)
 
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI
     print("✅ OpenAI importado correctamente")
 except ImportError as e:
     print(f"❌ Error importando OpenAI: {e}")
     sys.exit(1)
 
 import uvicorn
+from contextlib import asynccontextmanager
+from app.services.ai_extractor import create_http_client
+from app.services.prompt_compactor import compact_pages
 import uuid
 import json
 import tempfile
@@ -48,7 +51,29 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 print("🚀 Iniciando servidor de procesamiento de facturas...")
 
-app = FastAPI(title="Sistema de Procesamiento de Facturas con IA")
+# Cliente de OpenAI compartido entre peticiones (reutiliza conexiones TCP/TLS)
+_openai_client = None
+
+def get_openai_client():
+    if _openai_client is None:
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY no configurada")
+    return _openai_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Crea el cliente de OpenAI con el mismo pool de conexiones que la API principal
+    (keep-alive y HTTP/2) y lo cierra al apagar
+    """
+    global _openai_client
+    if OPENAI_API_KEY:
+        _openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=create_http_client())
+    yield
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+app = FastAPI(title="Sistema de Procesamiento de Facturas con IA", lifespan=lifespan)
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -105,26 +130,27 @@ async def process_invoice(file: UploadFile = File(...)):
         print(f"📄 Procesando: {file.filename}")
         
         # Extraer texto con pdfplumber
-        text = ""
         with pdfplumber.open(temp_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+            pages = [page.extract_text() or "" for page in pdf.pages]
+        text = "".join(page_text + "\n" for page_text in pages if page_text)
         
         if not text or len(text.strip()) < 20:
             raise HTTPException(status_code=400, detail="No se pudo extraer texto del PDF")
         
         print(f"📝 Texto extraído: {len(text)} caracteres")
         
+        # Compactar el texto en lugar de truncarlo (no se pierden ítems)
+        compaction = compact_pages(pages)
+        print(f"🗜️ Tokens de entrada: {compaction.original_tokens} -> {compaction.tokens}")
+        
         # Procesar con OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client = get_openai_client()
         
         prompt = f"""
 Analiza esta factura colombiana y extrae la información en formato JSON estructurado.
 
 TEXTO DE LA FACTURA:
-{text[:2000]}...
+{compaction.text}
 
 Extrae SOLO la información que encuentres y devuélvela en este formato JSON:
 
@@ -170,7 +196,7 @@ Extrae SOLO la información que encuentres y devuélvela en este formato JSON:
 Usa null para valores no encontrados. Devuelve SOLO el JSON.
 """
         
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{
                 "role": "user", 
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+# Bases de datos de la suite en un directorio temporal, antes de importar la app
+_TEST_DATA_DIR = tempfile.mkdtemp(prefix="invoice-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_TEST_DATA_DIR}/invoices.db")
+os.environ.setdefault("JOB_SQLITE_PATH", f"{_TEST_DATA_DIR}/jobs.db")
+os.environ.setdefault("BACKEND_STATS_PATH", f"{_TEST_DATA_DIR}/backend_stats.json")
+
+import pytest
+
+# Un solo generador de PDFs sintéticos para tests y benchmarks
+from benchmarks.invoice_pdf import build_pdf
+
+SAMPLE_LINES = [
+    "FACTURA ELECTRONICA DE VENTA No. FE-1001",
+    "Proveedor de Prueba S.A.S. NIT 900123456-7",
+    "Fecha de emision: 2025-07-24",
+    "Servicio de consultoria 1 100.000 100.000",
+    "Subtotal 100.000 IVA 19% 19.000 Total a pagar 119.000",
+]
+
+@pytest.fixture
+def sample_pdf(tmp_path):
+    path = tmp_path / "factura.pdf"
+    path.write_bytes(build_pdf([SAMPLE_LINES]))
+    return path
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import LLM_REQUESTS, LLM_TOKENS
+from app.services import ai_extractor as ai_extractor_module
+from app.services.ai_extractor import (
+    AIExtractor, get_ai_extractor, close_ai_extractor, merge_partial_results,
+    build_extraction_schema, CompletionStats
+)
+from app.services.llm_scheduler import LLMScheduler
+
+SAMPLE_JSON = {
+    "document_type": "FACTURA ELECTRONICA",
+    "number": "1001",
+    "supplier": {"name": "Proveedor S.A.S.", "tax_id": "900123456-7"},
+    "items": [{"description": "Servicio", "quantity": 1, "unit_price": 100, "subtotal": 100}],
+    "totals": {"subtotal": 100, "total": 119}
+}
+
+class FakeCompletions:
+    """Imita client.chat.completions registrando la concurrencia máxima"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        message = SimpleNamespace(content=json.dumps(SAMPLE_JSON))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def make_extractor(completions, limit):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return AIExtractor(client=client, scheduler=LLMScheduler(max_concurrency=limit))
+
+@pytest.mark.asyncio
+async def test_extract_invoice_data_respects_concurrency_limit():
+    """Las extracciones corren en paralelo sin superar el límite configurado"""
+    completions = FakeCompletions()
+    extractor = make_extractor(completions, limit=4)
+
+    results = await asyncio.gather(*(extractor.extract_invoice_data("texto") for _ in range(12)))
+
+    assert completions.max_in_flight == 4
+    assert all(r.number == "1001" for r in results)
+
+@pytest.mark.asyncio
+async def test_shared_extractor_reuses_pooled_client(monkeypatch):
+    """Todas las peticiones comparten el mismo cliente (y su pool de conexiones)"""
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(ai_extractor_module, "_shared_extractor", None)
+
+    first = get_ai_extractor()
+    assert get_ai_extractor() is first
+
+    http_client = first.client._client
+    await close_ai_extractor()
+    assert http_client.is_closed
+    assert ai_extractor_module._shared_extractor is None
+
+def item(description, subtotal):
+    return {"description": description, "quantity": 1, "unit_price": subtotal, "subtotal": subtotal}
+
+class ChunkCompletions:
+    """Devuelve un resultado parcial distinto según el fragmento del prompt"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+
+    async def create(self, messages, **kwargs):
+        await asyncio.sleep(self.delay)
+        prompt = messages[-1]["content"]
+        if "PAGINA-1" in prompt:
+            data = dict(SAMPLE_JSON, items=[item("A", 10), item("B", 20)], totals=None)
+        elif "PAGINA-2" in prompt:
+            # Repite la última fila del fragmento anterior, que no está completa en este (fila partida entre páginas)
+            data = {"items": [item("B", 20), item("C", 30)], "taxes": None, "totals": None}
+        else:
+            data = {"items": [item("D", 40)], "taxes": {"iva_amount": 19}, "totals": {"subtotal": 100, "total": 119}}
+        message = SimpleNamespace(content=json.dumps(data))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+@pytest.mark.asyncio
+async def test_extract_invoice_chunks_runs_concurrently_and_merges():
+    """Los fragmentos se extraen en paralelo y se combinan sin ítems duplicados"""
+    extractor = make_extractor(ChunkCompletions(delay=0.2), limit=8)
+
+    start = time.perf_counter()
+    invoice = await extractor.extract_invoice_chunks(["PAGINA-1", "PAGINA-2", "PAGINA-3"], "texto")
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.4
+    assert invoice.number == "1001"
+    assert [i.description for i in invoice.items] == ["A", "B", "C", "D"]
+    assert invoice.totals.total == 119
+    assert invoice.taxes.iva_amount == 19
+
+def test_merge_keeps_repeated_items_inside_a_chunk():
+    """Dos filas iguales dentro del mismo fragmento son ítems distintos"""
+    merged = merge_partial_results([
+        {"number": "1", "items": [item("A", 10), item("A", 10)]},
+        {"items": [item("B", 20)], "totals": {"total": 40}}
+    ])
+
+    assert [i["description"] for i in merged["items"]] == ["A", "A", "B"]
+    assert merged["totals"] == {"total": 40}
+
+def test_merge_keeps_identical_rows_on_both_sides_of_a_boundary():
+    """El mismo producto facturado al final de una página y al principio de la siguiente son dos ítems"""
+    partials = [
+        {"number": "1", "items": [item("Resma papel carta", 20), item("Toner impresora", 90)]},
+        {"items": [item("Toner impresora", 90), item("Grapas", 5)], "totals": {"total": 205}}
+    ]
+    chunks = [
+        "Resma papel carta 1 20 20\nToner impresora 1 90 90",
+        "Toner impresora 1 90 90\nGrapas 1 5 5\nTotal 205"
+    ]
+
+    merged = merge_partial_results(partials, chunks)
+    assert [i["description"] for i in merged["items"]] == [
+        "Resma papel carta", "Toner impresora", "Toner impresora", "Grapas"
+    ]
+
+    # Si la fila del corte está partida, el segundo fragmento solo ve su continuación
+    chunks[1] = "1 90 90\nGrapas 1 5 5\nTotal 205"
+    merged = merge_partial_results(partials, chunks)
+    assert [i["description"] for i in merged["items"]] == ["Resma papel carta", "Toner impresora", "Grapas"]
+
+class StreamingCompletions:
+    """Imita la respuesta en streaming enviando el JSON por fragmentos"""
+
+    async def create(self, stream=False, **kwargs):
+        content = json.dumps(SAMPLE_JSON)
+
+        async def chunks():
+            for i in range(0, len(content), 7):
+                await asyncio.sleep(0)
+                delta = SimpleNamespace(content=content[i:i + 7])
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+        return chunks()
+
+@pytest.mark.asyncio
+async def test_stream_invoice_data_emits_fields_then_result():
+    """Los campos llegan antes que el resultado final, que coincide con el modo normal"""
+    extractor = make_extractor(StreamingCompletions(), limit=1)
+
+    events = [event async for event in extractor.stream_invoice_data("texto")]
+
+    fields = [name for event, name, _ in events if event == "field"]
+    assert fields[:3] == ["document_type", "number", "supplier"]
+    assert events[-1][0] == "result"
+    assert events[-1][2].supplier.tax_id == "900123456-7"
+    assert sum(1 for event, _, _ in events if event == "item") == 1
+
+def test_extraction_schema_is_strict_and_excludes_server_fields():
+    """El schema sale de InvoiceResponse sin los campos que calcula el servidor"""
+    schema = build_extraction_schema()
+
+    assert "invoice_id" not in schema["properties"]
+    assert "confidence_score" not in schema["properties"]
+    assert schema["additionalProperties"] is False
+    assert set(schema["required"]) == set(schema["properties"])
+    supplier = schema["$defs"]["SupplierInfo"]
+    assert supplier["additionalProperties"] is False
+    assert set(supplier["required"]) == set(supplier["properties"])
+    assert "default" not in json.dumps(schema)
+
+class RepairCompletions:
+    """Devuelve respuestas inválidas antes de una válida y guarda cada llamada"""
+
+    def __init__(self, bad_responses=1):
+        self.bad_responses = bad_responses
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if len(self.calls) <= self.bad_responses:
+            content = '{"number": "1001", "items": [}'
+        else:
+            content = json.dumps(SAMPLE_JSON)
+        usage = SimpleNamespace(total_tokens=500)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+@pytest.mark.asyncio
+async def test_invalid_json_is_repaired_once_and_counted(monkeypatch):
+    """Una respuesta no parseable se repara con un único reintento y cuenta como desperdicio"""
+    stats = CompletionStats()
+    monkeypatch.setattr(ai_extractor_module, "completion_stats", stats)
+    monkeypatch.setattr(settings, "OPENAI_RESPONSE_FORMAT", "json_schema")
+    completions = RepairCompletions(bad_responses=1)
+
+    result = await make_extractor(completions, limit=1).extract_invoice_data("texto")
+
+    assert result.number == "1001"
+    assert len(completions.calls) == 2
+    assert completions.calls[0]["response_format"]["json_schema"]["strict"] is True
+    repair_messages = completions.calls[1]["messages"]
+    assert repair_messages[-2]["role"] == "assistant"
+    assert stats.snapshot() == {
+        "completions": 2, "parse_failures": 1, "parse_failure_rate": 0.5,
+        "repair_retries": 1, "repaired": 1, "wasted_tokens": 500
+    }
+
+@pytest.mark.asyncio
+async def test_total_only_usage_is_counted(monkeypatch):
+    """Si el servidor solo informa total_tokens, el total se registra igualmente"""
+    monkeypatch.setattr(ai_extractor_module, "completion_stats", CompletionStats())
+    before = LLM_TOKENS.value(direction="total")
+
+    await make_extractor(RepairCompletions(bad_responses=0), limit=1).extract_invoice_data("texto")
+
+    assert LLM_TOKENS.value(direction="total") == before + 500
+
+@pytest.mark.asyncio
+async def test_repair_retries_are_bounded(monkeypatch):
+    """Si la reparación también falla no se reintenta más"""
+    monkeypatch.setattr(ai_extractor_module, "completion_stats", CompletionStats())
+    monkeypatch.setattr(settings, "OPENAI_REPAIR_RETRIES", 1)
+    completions = RepairCompletions(bad_responses=5)
+
+    with pytest.raises(Exception, match="Error interpretando respuesta de IA"):
+        await make_extractor(completions, limit=1).extract_invoice_data("texto")
+    assert len(completions.calls) == 2
+
+@pytest.mark.asyncio
+async def test_table_items_are_not_requested_from_the_model(monkeypatch):
+    """Con los ítems de la tabla del PDF el modelo solo extrae cabecera, impuestos y totales"""
+    monkeypatch.setattr(ai_extractor_module, "completion_stats", CompletionStats())
+    monkeypatch.setattr(settings, "OPENAI_RESPONSE_FORMAT", "json_schema")
+    completions = RepairCompletions(bad_responses=0)
+    table_items = [
+        {"description": "Resma papel carta", "quantity": 2, "unit_price": 50, "discount_percentage": 0.0, "subtotal": 100}
+    ]
+
+    result = await make_extractor(completions, limit=1).extract_invoice_data("texto", items=table_items)
+
+    schema = completions.calls[0]["response_format"]["json_schema"]
+    assert schema["name"] == "invoice_without_items"
+    assert "items" not in schema["schema"]["properties"]
+    assert '"items"' not in completions.calls[0]["messages"][1]["content"]
+    assert [item.description for item in result.items] == ["Resma papel carta"]
+
+class NullFieldsCompletions:
+    """Respuesta con los objetos anidados en null, como permite el esquema estricto"""
+
+    async def create(self, **kwargs):
+        content = json.dumps({
+            "document_type": "FACTURA ELECTRONICA", "number": "1001", "currency": None,
+            "supplier": None, "items": [None], "taxes": None, "totals": None
+        })
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+@pytest.mark.asyncio
+async def test_null_nested_objects_are_mapped():
+    """supplier, totals o taxes en null no rompen el mapeo ni el score de confianza"""
+    result = await make_extractor(NullFieldsCompletions(), limit=1).extract_invoice_data("texto")
+
+    assert result.number == "1001"
+    assert result.supplier is None and result.totals is None
+    assert result.items == []
+    assert result.currency == "COP"
+    assert result.confidence_score == 0.25
+
+class FailingCompletions:
+    async def create(self, **kwargs):
+        raise RuntimeError("conexión rechazada")
+
+@pytest.mark.asyncio
+async def test_failed_calls_are_counted_as_errors():
+    """Una llamada que falla (sin respuesta que parsear) cuenta como error"""
+    before = LLM_REQUESTS.value(outcome="error")
+
+    with pytest.raises(Exception, match="Error procesando factura con IA"):
+        await make_extractor(FailingCompletions(), limit=1).extract_invoice_data("texto")
+    with pytest.raises(Exception, match="Error procesando factura con IA"):
+        async for _ in make_extractor(FailingCompletions(), limit=1).stream_invoice_data("texto"):
+            pass
+
+    assert LLM_REQUESTS.value(outcome="error") == before + 2
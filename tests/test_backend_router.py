@@ -0,0 +1,98 @@
+import pytest
+
+from app.services.backend_router import BackendRouter, producer_family
+from app.services.extraction_pool import extract_pdf_job
+from app.services.pdf_processor import ParsedDocument
+from conftest import build_pdf, SAMPLE_LINES
+
+def record(router, family, backend, seconds, ok, times):
+    for _ in range(times):
+        router.record(family, [{"backend": backend, "seconds": seconds, "ok": ok}], num_pages=1)
+
+def test_producer_family_drops_versions_and_symbols():
+    """La familia ignora versiones, años y símbolos del Producer"""
+    assert producer_family({"Producer": "iText® 5.5.13 ©2000-2018 iText Group NV (AGPL-version)"}) == "itext group"
+    assert producer_family({"Creator": "Microsoft® Word 2016"}) == "microsoft word"
+    assert producer_family({"num_pages": 1}) == "unknown"
+
+def test_router_prefers_fastest_reliable_backend():
+    """Con muestras suficientes va primero el backend rápido que da texto útil"""
+    router = BackendRouter(min_samples=3, explore_rate=0)
+    assert router.order("itext") == ["pdfplumber", "pypdf2"]
+
+    record(router, "itext", "pdfplumber", 0.5, True, 3)
+    record(router, "itext", "pypdf2", 0.05, True, 3)
+    assert router.order("itext") == ["pypdf2", "pdfplumber"]
+    assert router.routes() == {"itext": ["pypdf2", "pdfplumber"]}
+
+    # Más rápido pero sin texto útil: no se elige
+    record(router, "word", "pdfplumber", 0.5, True, 3)
+    record(router, "word", "pypdf2", 0.05, False, 3)
+    assert router.order("word") == ["pdfplumber", "pypdf2"]
+
+def test_router_explores_undersampled_backend():
+    """Al explorar se prueba primero el backend con pocas muestras"""
+    router = BackendRouter(min_samples=3, explore_rate=1)
+    record(router, "itext", "pdfplumber", 0.5, True, 3)
+    assert router.routes() == {"itext": ["pypdf2", "pdfplumber"]}
+
+@pytest.mark.asyncio
+async def test_router_stats_survive_restart(tmp_path):
+    """Las estadísticas se guardan en JSON y se recargan al reiniciar"""
+    path = str(tmp_path / "stats.json")
+    router = BackendRouter(path, min_samples=3, explore_rate=0)
+    record(router, "itext", "pdfplumber", 0.5, True, 3)
+    record(router, "itext", "pypdf2", 0.05, True, 3)
+    await router.save()
+
+    assert BackendRouter(path, min_samples=3, explore_rate=0).order("itext") == ["pypdf2", "pdfplumber"]
+
+@pytest.mark.asyncio
+async def test_processes_add_their_attempts_to_the_shared_file(tmp_path):
+    """El API y los workers suman sus intentos al mismo archivo en lugar de pisarse"""
+    path = str(tmp_path / "stats.json")
+    api, worker = BackendRouter(path), BackendRouter(path)
+    record(api, "itext", "pdfplumber", 0.5, True, 2)
+    record(worker, "itext", "pdfplumber", 0.5, False, 3)
+    await api.save()
+    await worker.save()
+    await api.save()
+
+    stats = BackendRouter(path).snapshot()["itext"]["pdfplumber"]
+    assert (stats["attempts"], stats["successes"]) == (5, 2)
+    assert worker.snapshot()["itext"]["pdfplumber"]["attempts"] == 5
+
+def test_failed_probe_is_recorded_for_each_backend(monkeypatch):
+    """Si pdfplumber no da texto en el muestreo cuenta como fallo; el tiempo de muestreo se suma a cada backend"""
+    monkeypatch.setattr(ParsedDocument, "page_text", lambda self, page_number: "")
+    document = ParsedDocument(build_pdf([SAMPLE_LINES]))
+
+    document.extract_text(["pdfplumber", "pypdf2"])
+    assert [(a["backend"], a["ok"]) for a in document.backend_attempts] == [("pdfplumber", False), ("pypdf2", True)]
+    assert document.backend_attempts[0]["seconds"] == document.sample_seconds("pdfplumber")
+    assert document.backend_attempts[1]["seconds"] > document.sample_seconds("pypdf2") > 0
+
+def test_document_follows_routed_order_and_reports_attempts():
+    """El documento extrae con el primer backend de la ruta y registra el intento"""
+    document = ParsedDocument(build_pdf([SAMPLE_LINES]))
+
+    text = document.extract_text(["pypdf2", "pdfplumber"])
+    assert "FE-1001" in text and document.text_backend == "pypdf2"
+    assert [(a["backend"], a["ok"]) for a in document.backend_attempts] == [("pypdf2", True)]
+
+def test_pdfplumber_pages_are_not_parsed_when_pypdf2_wins(monkeypatch):
+    """Si la ruta elige PyPDF2, el trabajo no recorre las páginas con pdfplumber"""
+    pages = [SAMPLE_LINES[:3] + [f"Servicio de consultoria pagina {n} 1 100.000 100.000"] for n in range(40)]
+    content = build_pdf(pages)
+    with ParsedDocument(content) as document:
+        family = producer_family(document.metadata)
+
+    def no_pdfplumber(self, page_number):
+        raise AssertionError(f"pdfplumber extrajo la página {page_number}")
+
+    monkeypatch.setattr(ParsedDocument, "page_text", no_pdfplumber)
+    result = extract_pdf_job(content, 0, None, {family: ["pypdf2", "pdfplumber"]})
+
+    assert result["text_backend"] == "pypdf2"
+    assert [attempt["backend"] for attempt in result["backend_attempts"]] == ["pypdf2"]
+    assert "pagina 39" in result["text"]
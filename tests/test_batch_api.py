@@ -0,0 +1,63 @@
+import asyncio
+import io
+import json
+import zipfile
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.schemas.invoice import InvoiceResponse
+from app.services.ai_extractor import AIExtractor
+from conftest import build_pdf, SAMPLE_LINES
+from main import app
+
+def test_batch_streams_results_as_they_finish(monkeypatch):
+    """Cada factura del batch se emite al terminar; una lenta no retiene al resto"""
+    async def extract_invoice_data(self, text, priority=None, items=None):
+        await asyncio.sleep(1.0 if "LENTA" in text else 0)
+        return InvoiceResponse(invoice_id="inv", number=text.split("Ref ")[1].split()[0])
+
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(AIExtractor, "extract_invoice_data", extract_invoice_data)
+    monkeypatch.setattr(settings, "RULES_FAST_PATH", False)
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("dentro.pdf", build_pdf([SAMPLE_LINES + ["Ref Z1"]]))
+        zf.writestr("notas.txt", "ignorado")
+
+    files = [
+        ("files", ("lenta.pdf", build_pdf([SAMPLE_LINES + ["Ref B1 LENTA"]]), "application/pdf")),
+        ("files", ("rapida.pdf", build_pdf([SAMPLE_LINES + ["Ref B2"]]), "application/pdf")),
+        ("files", ("lote.zip", archive.getvalue(), "application/zip")),
+        ("files", ("foto.png", b"png", "image/png")),
+    ]
+    with TestClient(app) as client:
+        response = client.post("/api/v1/invoices/batch", files=files)
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_name = {line["filename"]: line for line in lines}
+    assert len(lines) == 4
+    assert lines[-1]["filename"] == "lenta.pdf"
+    assert by_name["lote.zip/dentro.pdf"]["result"]["number"] == "Z1"
+    assert by_name["foto.png"]["status"] == "failed"
+
+def test_batch_rejects_oversized_zips_before_processing(monkeypatch):
+    """Los límites de archivos y de tamaño descomprimido se aplican antes de procesar nada"""
+    pdf = build_pdf([SAMPLE_LINES])
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        for index in range(3):
+            zf.writestr(f"f{index}.pdf", pdf)
+    files = [("files", ("lote.zip", archive.getvalue(), "application/zip"))]
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(settings, "BATCH_MAX_FILES", 2)
+        too_many = client.post("/api/v1/invoices/batch", files=files)
+        monkeypatch.setattr(settings, "BATCH_MAX_FILES", 500)
+        monkeypatch.setattr(settings, "BATCH_MAX_TOTAL_SIZE", 2 * len(pdf))
+        too_big = client.post("/api/v1/invoices/batch", files=files)
+
+    assert too_many.status_code == 400 and "demasiados archivos" in too_many.json()["detail"]
+    assert too_big.status_code == 400 and "demasiado grande" in too_big.json()["detail"]
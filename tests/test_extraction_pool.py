@@ -0,0 +1,121 @@
+import asyncio
+import signal
+import os
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import extraction_pool as extraction_pool_module
+from app.services.extraction_pool import ExtractionPool, ExtractionTimeoutError, extract_pdf_job, page_ranges
+from app.services.pdf_processor import ParsedDocument
+from conftest import build_pdf
+
+@pytest.mark.asyncio
+async def test_extract_runs_in_pool(sample_pdf):
+    """El pool valida y extrae el texto del PDF en un proceso aparte"""
+    pool = ExtractionPool(max_workers=1, max_tasks_per_child=10, job_timeout=30)
+    try:
+        result = await pool.extract(str(sample_pdf))
+    finally:
+        pool.shutdown()
+
+    assert result["valid"] is True
+    assert "FE-1001" in result["text"]
+
+@pytest.mark.asyncio
+async def test_job_timeout_does_not_hang_worker(tmp_path):
+    """Un trabajo que excede el timeout falla y el pool sigue disponible"""
+    pool = ExtractionPool(max_workers=1, max_tasks_per_child=10, job_timeout=0.5)
+    try:
+        with pytest.raises(ExtractionTimeoutError):
+            await pool.run(time.sleep, 5)
+        assert await pool.run(sum, [1, 2, 3]) == 6
+    finally:
+        pool.shutdown()
+
+def ignore_alarm_and_sleep(seconds):
+    # Simula un worker bloqueado en código C que no atiende la alarma
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    time.sleep(seconds)
+
+def slow_sum(values, seconds):
+    time.sleep(seconds)
+    return sum(values)
+
+@pytest.mark.asyncio
+async def test_recycling_a_stuck_job_does_not_fail_other_jobs(monkeypatch):
+    """Reciclar el pool por un trabajo colgado solo hace fallar a ese trabajo"""
+    monkeypatch.setattr(extraction_pool_module, "TIMEOUT_MARGIN", 0.5)
+    pool = ExtractionPool(max_workers=2, max_tasks_per_child=10, job_timeout=30)
+    try:
+        # Arranca los dos procesos antes de repartir los trabajos
+        await asyncio.gather(pool.run(slow_sum, [0], 0.2), pool.run(slow_sum, [0], 0.2))
+        stuck, healthy = await asyncio.gather(
+            pool.run(ignore_alarm_and_sleep, 30, timeout=0.5),
+            pool.run(slow_sum, [1, 2, 3], 2),
+            return_exceptions=True
+        )
+    finally:
+        pool.shutdown()
+
+    assert isinstance(stuck, ExtractionTimeoutError)
+    assert healthy == 6
+
+def test_page_ranges_cover_all_pages_in_order():
+    """Los rangos son contiguos, cubren todas las páginas y difieren en una como mucho"""
+    assert page_ranges(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert page_ranges(2, 8) == [(0, 1), (1, 2)]
+
+@pytest.mark.asyncio
+async def test_large_pdf_is_extracted_by_page_ranges(tmp_path, monkeypatch):
+    """Un PDF grande se extrae por rangos en paralelo con el mismo texto y orden"""
+    pages = [[f"Pagina {number} de la factura FE-1001", "Servicio de consultoria 1 100.000"] for number in range(6)]
+    path = tmp_path / "grande.pdf"
+    path.write_bytes(build_pdf(pages))
+    monkeypatch.setattr(settings, "PDF_PARALLEL_MIN_PAGES", 4)
+    pool = ExtractionPool(max_workers=2, max_tasks_per_child=10, job_timeout=30)
+    try:
+        result = await pool.extract(str(path))
+    finally:
+        pool.shutdown()
+
+    with ParsedDocument.from_path(str(path)) as document:
+        assert result["text"] == document.extract_text()
+    assert result["num_pages"] == 6 and "split" not in result
+    assert result["text"].index("Pagina 0") < result["text"].index("Pagina 5")
+
+@pytest.mark.asyncio
+async def test_page_ranges_read_a_spilled_file_and_join_in_pool(monkeypatch):
+    """Los rangos reciben la ruta de un archivo temporal, omiten las páginas muestreadas y se unen en el pool"""
+    pages = [[f"Pagina {number} de la factura FE-1001", "Servicio de consultoria 1 100.000"] for number in range(6)]
+    pdf = build_pdf(pages)
+    monkeypatch.setattr(settings, "PDF_PARALLEL_MIN_PAGES", 4)
+    pool = ExtractionPool(max_workers=2, max_tasks_per_child=10, job_timeout=30)
+    calls = []
+    ranges = []
+    run = pool.run
+
+    async def recording_run(func, *args, **kwargs):
+        calls.append((func.__name__, args[0]))
+        if func.__name__ == "extract_pages_job":
+            ranges.append(args[1:])
+        return await run(func, *args, **kwargs)
+
+    monkeypatch.setattr(pool, "run", recording_run)
+    try:
+        result = await pool.extract(pdf)
+    finally:
+        pool.shutdown()
+
+    assert [name for name, _ in calls] == ["extract_pdf_job", "extract_pages_job", "extract_pages_job", "finish_extraction"]
+    assert sorted(ranges) == [(settings.PDF_PROBE_PAGES, 5), (5, 6)]
+    spilled = {source for name, source in calls[1:3]}
+    assert len(spilled) == 1 and isinstance(next(iter(spilled)), str)
+    assert not os.path.exists(next(iter(spilled)))
+
+    single = extract_pdf_job(pdf)
+    for key in ("text", "prompt_text", "prompt_chunks", "text_backend", "num_pages", "pdf_kind"):
+        assert result.get(key) == single.get(key)
+    assert result["rules_result"]["number"] == single["rules_result"]["number"]
+    assert result["backend_attempts"][0]["backend"] == "pdfplumber"
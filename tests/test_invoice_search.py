@@ -0,0 +1,51 @@
+import pytest
+from httpx import AsyncClient
+
+from app.database.repository import InvoiceRepository
+from app.database.session import init_db
+from app.schemas.invoice import InvoiceResponse, SupplierInfo, InvoiceTotals
+from main import app
+
+@pytest.mark.asyncio
+async def test_list_invoices_filters_and_pages_with_cursor():
+    """Los filtros se combinan y el cursor recorre todas las páginas sin repetir"""
+    await init_db()
+    invoices = [
+        InvoiceResponse(
+            invoice_id=f"search-{i:03d}",
+            number=str(i),
+            series="SRCH",
+            issue_date=f"2024-01-{(i % 28) + 1:02d}" if i % 10 else None,
+            currency="COP" if i % 2 else "USD",
+            supplier=SupplierInfo(name="Buscado S.A.S.", tax_id="800999111-1"),
+            totals=InvoiceTotals(subtotal=i * 100, total=i * 119)
+        )
+        for i in range(1, 41)
+    ]
+    await InvoiceRepository().save_many(invoices)
+
+    seen = []
+    cursor = None
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        while True:
+            params = {"supplier_tax_id": "800999111-1", "series": "SRCH", "limit": 7}
+            if cursor:
+                params["cursor"] = cursor
+            page = (await ac.get("/api/v1/invoices", params=params)).json()
+            seen += [item["invoice_id"] for item in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        filtered = (await ac.get("/api/v1/invoices", params={
+            "series": "SRCH", "currency": "COP", "issue_date_from": "2024-01-10", "total_min": 1000
+        })).json()
+        bad_cursor = await ac.get("/api/v1/invoices", params={"cursor": "no-es-un-cursor"})
+
+    assert sorted(seen) == sorted(invoice.invoice_id for invoice in invoices)
+    dated = [i for i in seen if int(i[-3:]) % 10]
+    assert seen[:len(dated)] == dated
+    assert filtered["items"]
+    assert all(item["currency"] == "COP" and item["issue_date"] >= "2024-01-10" and item["total"] >= 1000
+               for item in filtered["items"])
+    assert bad_cursor.status_code == 400
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.schemas.invoice import InvoiceResponse
+from app.services.ai_extractor import AIExtractor
+from app.services.llm_scheduler import LLMRateLimitError
+from conftest import build_pdf, SAMPLE_LINES
+from main import app
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    """Sustituye la llamada a OpenAI registrando el texto recibido"""
+    calls = []
+
+    async def extract_invoice_data(self, text, priority=None, items=None):
+        calls.append(text)
+        return InvoiceResponse(invoice_id=f"inv-{len(calls)}", number="1001")
+
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(AIExtractor, "extract_invoice_data", extract_invoice_data)
+    # Estas pruebas cubren el camino con IA aunque las reglas bastarían
+    monkeypatch.setattr(settings, "RULES_FAST_PATH", False)
+    return calls
+
+@pytest.mark.parametrize("spill_threshold", [10 * 1024 * 1024, 0])
+def test_process_invoice_end_to_end(monkeypatch, tmp_path, fake_ai, spill_threshold):
+    """El PDF se procesa desde memoria o volcado a disco, sin dejar archivos"""
+    monkeypatch.setattr(settings, "UPLOAD_SPILL_THRESHOLD", spill_threshold)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    content = build_pdf([SAMPLE_LINES + [f"Referencia {spill_threshold}"]])
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/invoices/process",
+            files={"file": ("factura.pdf", content, "application/pdf")}
+        )
+
+    assert response.status_code == 200, response.text
+    assert response.json()["number"] == "1001"
+    assert "FE-1001" in fake_ai[0]
+    assert list(tmp_path.iterdir()) == []
+
+def test_process_invoice_rejects_invalid_pdf(fake_ai):
+    """Un archivo que no es PDF se rechaza con 400"""
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/invoices/process",
+            files={"file": ("factura.pdf", b"no es un pdf", "application/pdf")}
+        )
+
+    assert response.status_code == 400
+    assert fake_ai == []
+
+def test_process_invoice_rate_limited_returns_503(monkeypatch, fake_ai):
+    """Si OpenAI sigue limitando tras los reintentos se responde 503 con Retry-After"""
+    async def rate_limited(self, text, priority=None, items=None):
+        raise LLMRateLimitError("OpenAI sigue limitando", retry_after=2.5)
+
+    monkeypatch.setattr(AIExtractor, "extract_invoice_data", rate_limited)
+    content = build_pdf([SAMPLE_LINES + ["Referencia 429"]])
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/invoices/process",
+            files={"file": ("factura.pdf", content, "application/pdf")}
+        )
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+
+def test_process_invoice_rules_fast_path_skips_ai(monkeypatch, fake_ai):
+    """Una factura regular se resuelve con reglas sin llamar al modelo"""
+    monkeypatch.setattr(settings, "RULES_FAST_PATH", True)
+    content = build_pdf([SAMPLE_LINES + ["Referencia reglas"]])
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/invoices/process",
+            files={"file": ("factura.pdf", content, "application/pdf")}
+        )
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["series"] == "FE" and body["number"] == "1001"
+    assert body["totals"]["total"] == 119000
+    assert "Extraído por reglas (sin IA)" in body["processing_notes"]
+    assert fake_ai == []
+
+def test_metrics_endpoint_reports_stages_and_counters(monkeypatch, fake_ai):
+    """Tras procesar una factura /metrics expone las etapas y los contadores"""
+    monkeypatch.setattr(settings, "RULES_FAST_PATH", True)
+    content = build_pdf([SAMPLE_LINES + ["Referencia métricas"]])
+
+    with TestClient(app) as client:
+        for _ in range(2):
+            client.post(
+                "/api/v1/invoices/process",
+                files={"file": ("factura.pdf", content, "application/pdf")}
+            )
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for stage in ("upload", "validate", "pdfplumber", "rules", "extraction_pool", "request"):
+        assert f'invoice_stage_duration_seconds_count{{stage="{stage}"}}' in response.text
+    assert 'invoice_cache_requests_total{result="hit"}' in response.text
+    assert 'pdf_text_extractions_total{backend="pdfplumber"}' in response.text
+    assert 'invoice_extractions_total{method="rules"}' in response.text
+
+def test_process_stream_emits_fields_result_and_metrics(monkeypatch, fake_ai):
+    """El endpoint SSE emite campos, el resultado completo y el tiempo al primer campo"""
+    monkeypatch.setattr(settings, "RULES_FAST_PATH", True)
+    content = build_pdf([SAMPLE_LINES + ["Referencia streaming"]])
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/invoices/process-stream",
+            files={"file": ("factura.pdf", content, "application/pdf")}
+        )
+
+    assert response.status_code == 200
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    names = [event for event, _ in events]
+    assert names[-2:] == ["result", "metrics"]
+    assert {"field": "number", "value": "1001"} in [data for event, data in events if event == "field"]
+    assert events[-2][1]["processing_notes"][0] == "Archivo original: factura.pdf"
+    assert events[-1][1]["time_to_first_field_ms"] <= events[-1][1]["total_ms"]
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.schemas.invoice import InvoiceResponse
+from app.services.job_queue import JobState, SQLiteJobQueue
+from app import worker
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF", 0)
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"))
+
+@pytest.mark.asyncio
+async def test_job_lifecycle(queue):
+    """Un trabajo se encola, se reclama una sola vez y guarda su resultado"""
+    job_id = await queue.enqueue(b"%PDF", "factura.pdf", "key")
+    job = await queue.dequeue()
+
+    assert job.id == job_id and job.payload == b"%PDF" and job.attempts == 1
+    assert await queue.dequeue() is None
+
+    await queue.complete(job_id, '{"invoice_id": "x"}')
+    state = await queue.get(job_id)
+    assert state["state"] == JobState.COMPLETED
+    assert state["result"] == '{"invoice_id": "x"}'
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_until_max_attempts(queue):
+    """Los fallos se reintentan con backoff hasta agotar los intentos"""
+    job_id = await queue.enqueue(b"%PDF", "factura.pdf", "key")
+
+    await queue.fail((await queue.dequeue()).id, "error temporal")
+    assert (await queue.get(job_id))["state"] == JobState.QUEUED
+
+    job = await queue.dequeue()
+    assert job.attempts == 2
+    await queue.fail(job.id, "error temporal")
+    assert (await queue.get(job_id))["state"] == JobState.FAILED
+
+@pytest.mark.asyncio
+async def test_visibility_timeout_releases_abandoned_job(queue, monkeypatch):
+    """Un trabajo de un worker caído vuelve a la cola al vencer el visibility timeout"""
+    monkeypatch.setattr(settings, "JOB_VISIBILITY_TIMEOUT", -1)
+    job_id = await queue.enqueue(b"%PDF", "factura.pdf", "key")
+    await queue.dequeue()
+
+    job = await queue.dequeue()
+    assert job.id == job_id and job.attempts == 2
+
+@pytest.mark.asyncio
+async def test_worker_completes_job(queue, monkeypatch):
+    """El worker ejecuta el pipeline y guarda el InvoiceResponse en la cola"""
+    async def fake_process_document(source, cache_key, priority):
+        return InvoiceResponse(invoice_id="inv-1", number="1001")
+
+    monkeypatch.setattr(worker, "process_document", fake_process_document)
+    job_id = await queue.enqueue(b"%PDF", "factura.pdf", "key")
+
+    await worker.handle_job(queue, await queue.dequeue())
+
+    state = await queue.get(job_id)
+    assert state["state"] == JobState.COMPLETED
+    assert InvoiceResponse.model_validate_json(state["result"]).number == "1001"
+
+@pytest.mark.asyncio
+async def test_enqueue_unique_reuses_pending_job(queue):
+    """Una factura idéntica ya en cola devuelve el mismo trabajo hasta que termina"""
+    job_id, created = await queue.enqueue_unique(b"%PDF", "factura.pdf", "key")
+    assert created
+    assert await queue.enqueue_unique(b"%PDF", "copia.pdf", "key") == (job_id, False)
+
+    await queue.complete((await queue.dequeue()).id, "{}")
+    new_id, created = await queue.enqueue_unique(b"%PDF", "factura.pdf", "key")
+    assert created and new_id != job_id
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_purged_after_result_ttl(queue, monkeypatch):
+    """Los trabajos terminados se borran al vencer JOB_RESULT_TTL, como con el expire de Redis"""
+    old_id = await queue.enqueue(b"%PDF", "vieja.pdf", "old")
+    await queue.complete((await queue.dequeue()).id, "{}")
+    queue._execute("UPDATE jobs SET updated_at = updated_at - ? WHERE id = ?", (settings.JOB_RESULT_TTL + 1, old_id))
+
+    new_id = await queue.enqueue(b"%PDF", "nueva.pdf", "new")
+    await queue.complete((await queue.dequeue()).id, "{}")
+
+    assert await queue.get(old_id) is None
+    assert (await queue.get(new_id))["state"] == JobState.COMPLETED
+
+@pytest.mark.asyncio
+async def test_heartbeat_survives_extend_errors(queue, monkeypatch):
+    """Un error al renovar el visibility timeout se registra y se reintenta"""
+    monkeypatch.setattr(settings, "JOB_VISIBILITY_TIMEOUT", 0)
+    calls = []
+
+    async def flaky_extend(job_id):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    async def no_wait(delay):
+        if len(calls) >= 2:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(queue, "extend", flaky_extend)
+    monkeypatch.setattr(worker.asyncio, "sleep", no_wait)
+    with pytest.raises(asyncio.CancelledError):
+        await worker._heartbeat(queue, "job-1")
+    assert calls == ["job-1", "job-1"]
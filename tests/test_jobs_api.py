@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+
+from app.api.v1.endpoints import invoices
+from app.core.config import settings
+from app.services.job_queue import JobState, JobWatcher, SQLiteJobQueue
+from main import app
+
+@pytest_asyncio.fixture
+async def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_WATCH_INTERVAL", 0.05)
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"))
+    watcher = JobWatcher(queue)
+    monkeypatch.setattr(invoices, "job_queue", queue)
+    monkeypatch.setattr(invoices, "job_watcher", watcher)
+    yield queue
+    await watcher.close()
+
+async def _finish_later(queue, job_id, delay=0.2):
+    await asyncio.sleep(delay)
+    await queue.dequeue()
+    await queue.complete(job_id, '{"invoice_id": "inv-1", "number": "1001"}')
+
+@pytest.mark.asyncio
+async def test_get_job_unknown_returns_404(queue):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/api/v1/invoices/jobs/no-existe")
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_get_job_long_poll_returns_on_change(queue):
+    """Con wait= la petición se libera en cuanto cambia el estado del trabajo"""
+    job_id = await queue.enqueue(b"%PDF", "factura.pdf", "key")
+    finisher = asyncio.create_task(_finish_later(queue, job_id))
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get(f"/api/v1/invoices/jobs/{job_id}", params={"wait": 10})
+        while response.json()["state"] not in JobState.TERMINAL:
+            response = await ac.get(f"/api/v1/invoices/jobs/{job_id}", params={"wait": 10})
+
+    await finisher
+    assert response.json()["state"] == JobState.COMPLETED
+    assert response.json()["result"]["number"] == "1001"
+
+@pytest.mark.asyncio
+async def test_job_events_stream_transitions(queue):
+    """El stream SSE emite cada transición y se cierra al terminar"""
+    job_id = await queue.enqueue(b"%PDF", "factura.pdf", "key")
+    finisher = asyncio.create_task(_finish_later(queue, job_id))
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get(f"/api/v1/invoices/jobs/{job_id}/events")
+
+    await finisher
+    states = [line for line in response.text.splitlines() if line.startswith("data:")]
+    assert '"state":"queued"' in states[0]
+    assert '"state":"completed"' in states[-1]
@@ -0,0 +1,41 @@
+import json
+
+from app.services.json_stream import IncrementalJSONParser
+
+def feed_all(parser, text, size=1):
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return events
+
+def test_parser_emits_fields_as_they_close():
+    """Cada campo se emite al cerrarse, incluso con llaves y comillas dentro de cadenas"""
+    data = {
+        "number": "FE-1\"0}1",
+        "supplier": {"name": "Proveedor {S.A.S.}", "tax_id": "900123456-7"},
+        "items": [{"description": "a, b]", "quantity": 1}, {"description": "c", "quantity": 2}],
+        "totals": {"total": 119.5},
+        "currency": "COP"
+    }
+    text = "```json\n" + json.dumps(data, indent=2) + "\n```"
+    parser = IncrementalJSONParser()
+
+    events = feed_all(parser, text)
+
+    assert [(event, name) for event, name, _ in events] == [
+        ("field", "number"), ("field", "supplier"), ("item", None), ("item", None),
+        ("field", "items"), ("field", "totals"), ("field", "currency")
+    ]
+    assert events[1][2] == data["supplier"]
+    assert events[2][2] == data["items"][0]
+    assert parser.done
+
+def test_parser_emits_supplier_before_items_finish():
+    """El proveedor está disponible aunque el arreglo de ítems siga abierto"""
+    parser = IncrementalJSONParser()
+
+    events = parser.feed('{"supplier": {"name": "A"}, "items": [{"description": "x"}, {"descr')
+
+    assert ("field", "supplier", {"name": "A"}) in events
+    assert ("item", None, {"description": "x"}) in events
+    assert not parser.done
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.services.llm_scheduler import LLMScheduler, LLMRateLimitError, Priority, RedisRateBuckets
+
+def rate_limit_error(retry_after_ms: str = "100") -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after-ms": retry_after_ms}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+@pytest.mark.asyncio
+async def test_priority_lanes_serve_sync_before_batch_and_async():
+    """Con el cupo ocupado, las llamadas síncronas pasan antes que batch y async"""
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=1)
+    await scheduler.acquire(10)
+    served = []
+
+    async def call(name, priority):
+        await scheduler.acquire(10, priority)
+        served.append(name)
+        scheduler.release()
+
+    tasks = [asyncio.create_task(call(name, priority)) for name, priority in (
+        ("async", Priority.ASYNC), ("batch", Priority.BATCH), ("sync-1", Priority.SYNC), ("sync-2", Priority.SYNC)
+    )]
+    await asyncio.sleep(0.01)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+
+    assert served == ["sync-1", "sync-2", "batch", "async"]
+
+@pytest.mark.asyncio
+async def test_request_bucket_never_exceeds_rate():
+    """Agotada la ráfaga, las llamadas salen al ritmo del límite por minuto"""
+    scheduler = LLMScheduler(rpm=600, tpm=0, max_concurrency=10, burst_seconds=0.2)
+    start = time.monotonic()
+    times = []
+    for _ in range(4):
+        await scheduler.acquire(1)
+        times.append(time.monotonic() - start)
+        scheduler.release()
+
+    # Ráfaga de 2 y luego una cada 0,1 s (600 por minuto)
+    assert times[1] < 0.05
+    assert times[2] >= 0.09 and times[3] >= 0.19
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_and_retries():
+    """Un 429 respeta el Retry-After y la llamada se reintenta"""
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=4, max_retries=2)
+    calls = []
+
+    async def create():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise rate_limit_error("100")
+        return "ok"
+
+    assert await scheduler.run(create, tokens=100) == "ok"
+    assert calls[1] - calls[0] >= 0.1
+    assert scheduler.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_rate_limit_after_retries_raises_with_retry_after():
+    """Si el proveedor sigue limitando se lanza LLMRateLimitError (503 en el API)"""
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=4, max_retries=1)
+
+    async def create():
+        raise rate_limit_error("10")
+
+    with pytest.raises(LLMRateLimitError) as error:
+        await scheduler.run(create, tokens=100)
+    assert error.value.retry_after >= 0.01
+    assert scheduler.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_processes_share_the_redis_buckets():
+    """El API y un worker comparten la cuota en Redis; lo que sobra de la estimación se devuelve"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    schedulers = []
+    for _ in range(2):
+        buckets = RedisRateBuckets("redis://fake", rpm=0, tpm=600, burst_seconds=10)
+        buckets.client = fakeredis.aioredis.FakeRedis(server=server)
+        schedulers.append(LLMScheduler(max_concurrency=4, buckets=buckets))
+    api, worker = schedulers
+
+    # La ráfaga es de 100 tokens: la reserva del API deja al worker sin saldo
+    await api.acquire(100)
+    assert await worker.buckets.take(50) > 0
+
+    # El API solo gastó 40: los 60 devueltos bastan para la llamada del worker
+    await api.settle(100, 40)
+    assert await worker.buckets.take(50) == 0
+    api.release()
@@ -0,0 +1,24 @@
+from app.core.metrics import Registry, Counter, Histogram
+
+def test_registry_renders_prometheus_text_format():
+    """Contadores e histogramas se exportan con buckets acumulados, suma y conteo"""
+    registry = Registry()
+    hits = Counter("cache_requests_total", "Consultas a la caché", ("result",), registry=registry)
+    latency = Histogram("stage_seconds", "Duración por etapa", ("stage",), buckets=(0.1, 1.0), registry=registry)
+
+    hits.inc(result="hit")
+    hits.inc(2, result="miss")
+    latency.observe(0.05, stage="llm")
+    latency.observe(0.5, stage="llm")
+    latency.observe(3, stage="llm")
+
+    text = registry.render()
+    assert "# TYPE cache_requests_total counter" in text
+    assert 'cache_requests_total{result="hit"} 1' in text
+    assert 'cache_requests_total{result="miss"} 2' in text
+    assert "# TYPE stage_seconds histogram" in text
+    assert 'stage_seconds_bucket{stage="llm",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="llm",le="1"} 2' in text
+    assert 'stage_seconds_bucket{stage="llm",le="+Inf"} 3' in text
+    assert 'stage_seconds_sum{stage="llm"} 3.55' in text
+    assert 'stage_seconds_count{stage="llm"} 3' in text
@@ -0,0 +1,87 @@
+import io
+import os
+
+import pdfplumber
+import pytest
+
+from app.services import ocr
+from app.services.ocr import OCRService, page_dpi
+from app.services.result_cache import MemoryCacheBackend
+from conftest import build_pdf, SAMPLE_LINES
+
+class InlinePool:
+    """Ejecuta los trabajos en el mismo proceso"""
+
+    async def run(self, func, *args):
+        return func(*args)
+
+def test_page_dpi_adapts_to_scan_resolution():
+    """La resolución sigue a la imagen escaneada, dentro de los límites configurados"""
+    with pdfplumber.open(io.BytesIO(build_pdf([[]], scanned=True))) as pdf:
+        # Imagen de 2 px a lo ancho de la página: se usa el mínimo
+        assert page_dpi(pdf.pages[0]) == 150
+    with pdfplumber.open(io.BytesIO(build_pdf([SAMPLE_LINES]))) as pdf:
+        # Sin imagen: 3300 px en el lado mayor de una página carta
+        assert page_dpi(pdf.pages[0]) == 300
+
+@pytest.mark.asyncio
+async def test_ocr_pages_are_cached_by_image_hash(monkeypatch):
+    """Las páginas con la misma imagen se reconocen (y rasterizan) una sola vez"""
+    calls = []
+    rasterized = []
+    rasterize = ocr._rasterize
+
+    def fake_recognize(image, dpi):
+        calls.append(dpi)
+        return "FACTURA ELECTRONICA DE VENTA No. FE-1001 Total a pagar 119.000"
+
+    def counting_rasterize(source, page_number, dpi=None):
+        rasterized.append(page_number)
+        return rasterize(source, page_number, dpi)
+
+    monkeypatch.setattr(ocr, "_recognize", fake_recognize)
+    monkeypatch.setattr(ocr, "_rasterize", counting_rasterize)
+    service = OCRService(pool=InlinePool(), cache=MemoryCacheBackend())
+    pdf = build_pdf([[], []], scanned=True)
+
+    texts = await service.page_texts(pdf, 2)
+    assert all("FE-1001" in text for text in texts)
+    assert len(calls) == 1  # las dos páginas tienen la misma imagen
+    assert rasterized == [0]
+
+    assert await service.page_texts(pdf, 2) == texts
+    assert len(calls) == 1
+    assert rasterized == [0]
+
+def test_low_yield_page_is_retried_at_max_dpi(monkeypatch):
+    """Si el OCR devuelve poco texto, se repite a la resolución máxima"""
+    monkeypatch.setattr(ocr, "_recognize", lambda image, dpi: "Total 119.000 " * 10 if dpi == 400 else "")
+
+    text = ocr.ocr_page_job(build_pdf([[]], scanned=True), 0, 150)
+    assert text.startswith("Total 119.000")
+
+@pytest.mark.asyncio
+async def test_ocr_jobs_get_a_path_and_truncation_is_marked(monkeypatch):
+    """Los trabajos reciben la ruta del PDF volcado una vez; las páginas fuera de OCR_MAX_PAGES se indican"""
+    sources = []
+
+    class RecordingPool(InlinePool):
+        async def run(self, func, *args):
+            sources.append(args[0])
+            return func(*args)
+
+    monkeypatch.setattr(ocr.settings, "OCR_MAX_PAGES", 1)
+    monkeypatch.setattr(ocr, "_recognize", lambda image, dpi: "FACTURA ELECTRONICA DE VENTA No. FE-1001 Total a pagar 119.000")
+    service = OCRService(pool=RecordingPool(), cache=MemoryCacheBackend())
+
+    texts = await service.page_texts(build_pdf([[], []], scanned=True), 2)
+    assert len(texts) == 1
+    assert len(sources) == 2 and len(set(sources)) == 1
+    assert isinstance(sources[0], str) and not os.path.exists(sources[0])
+
+    async def fake_run(func, source, start, page_texts):
+        return {"text": page_texts[0], "num_pages": 2, "timings": {}}
+
+    monkeypatch.setattr(ocr.extraction_pool, "run", fake_run)
+    result = await service.extract(build_pdf([[], []], scanned=True), {"num_pages": 2, "timings": {}})
+    assert result["ocr_skipped_pages"] == 1
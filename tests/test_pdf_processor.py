@@ -0,0 +1,65 @@
+import pdfplumber
+import pytest
+
+from app.core.config import settings
+from app.services import pdf_processor
+from app.services.pdf_processor import ParsedDocument
+from conftest import build_pdf, SAMPLE_LINES
+
+def test_parsed_document_parses_once(monkeypatch):
+    """Validez, páginas, metadatos y texto salen de un único parseo"""
+    opens = []
+    original_open = pdfplumber.open
+    monkeypatch.setattr(pdf_processor.pdfplumber, "open", lambda *a, **k: opens.append(1) or original_open(*a, **k))
+
+    with ParsedDocument(build_pdf([SAMPLE_LINES, ["Pagina dos"]])) as document:
+        assert document.is_valid
+        assert document.num_pages == 2
+        assert document.metadata["num_pages"] == 2
+        assert "FE-1001" in document.extract_text()
+        assert document.page_text(1) == "Pagina dos"
+
+    assert len(opens) == 1
+
+def test_parsed_document_page_text_is_lazy():
+    """Solo se extrae el texto de las páginas solicitadas"""
+    document = ParsedDocument(build_pdf([["uno"], ["dos"], ["tres"]]))
+    assert document.page_text(2) == "tres"
+    assert list(document._page_texts) == [2]
+
+def test_parsed_document_rejects_garbage():
+    """Un archivo que no es PDF se marca como inválido sin lanzar excepciones"""
+    document = ParsedDocument(b"esto no es un pdf")
+    assert document.is_valid is False
+    assert document.error
+
+def test_garbage_is_rejected_by_header_without_parsing(monkeypatch):
+    """Sin la cabecera %PDF- no se llega a abrir el documento"""
+    opens = []
+    monkeypatch.setattr(pdf_processor.pdfplumber, "open", lambda *a, **k: opens.append(1))
+
+    document = ParsedDocument(b"PK\x03\x04" + b"\x00" * 10000)
+    assert document.is_valid is False
+    assert "%PDF-" in document.error
+    assert opens == []
+
+def test_probe_gives_up_early_on_scanned_pdf(monkeypatch):
+    """Un PDF de imágenes se clasifica con las primeras páginas y no se recorre el resto"""
+    monkeypatch.setattr(settings, "PDF_PROBE_PAGES", 2)
+    document = ParsedDocument(build_pdf([[] for _ in range(10)], scanned=True))
+
+    probe = document.probe()
+    assert (probe.kind, probe.backend) == ("scanned", None)
+    with pytest.raises(Exception):
+        document.extract_text()
+    assert sorted(document._page_texts) == [0, 1]
+
+def test_probe_reuses_sampled_pages_for_text_pdf(monkeypatch):
+    """En un PDF de texto las páginas muestreadas no se extraen dos veces"""
+    monkeypatch.setattr(settings, "PDF_PROBE_PAGES", 1)
+    document = ParsedDocument(build_pdf([SAMPLE_LINES, ["Pagina dos"]]))
+
+    assert document.probe().backend == "pdfplumber"
+    assert list(document._page_texts) == [0]
+    assert "Pagina dos" in document.extract_text()
+    assert document.text_backend == "pdfplumber"
@@ -0,0 +1,100 @@
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import LLM_PROMPT_TRUNCATED
+from app.schemas.invoice import InvoiceResponse
+from app.services import invoice_pipeline
+from app.services.extraction_pool import extract_pdf_job
+from app.services.prompt_compactor import compact_pages, chunk_pages
+from conftest import build_pdf
+
+HEADER = "Proveedor Andino S.A.S.\nNIT: 900123456-7\nFACTURA ELECTRÓNICA DE VENTA No. FE-1001"
+LEGAL = "Esta factura se asimila en todos sus efectos a una letra de cambio."
+
+def make_pages(items_per_page=3, pages=3):
+    result = []
+    for page in range(pages):
+        items = "\n".join(
+            f"Producto {page}-{i}      2    10.000,00    20.000,00" for i in range(items_per_page)
+        )
+        footer = f"{LEGAL}\nPágina {page + 1} de {pages}"
+        totals = "\nSubtotal: 180.000,00\nTotal a pagar: 214.200,00" if page == pages - 1 else ""
+        result.append(f"{HEADER}\n{items}{totals}\n{footer}")
+    return result
+
+def test_compaction_keeps_fields_and_drops_repetition():
+    """Cabeceras repetidas quedan una vez; el texto legal y la paginación desaparecen"""
+    result = compact_pages(make_pages())
+
+    assert result.text.count("NIT: 900123456-7") == 1
+    assert "letra de cambio" not in result.text
+    assert "Página" not in result.text
+    assert "Producto 2-2 2 10.000,00 20.000,00" in result.text
+    assert "Total a pagar: 214.200,00" in result.text
+    assert result.tokens < result.original_tokens
+
+def test_compaction_budget_keeps_key_lines_and_marks_gaps():
+    """Con presupuesto insuficiente se recortan ítems del medio, no la cabecera ni los totales"""
+    result = compact_pages(make_pages(items_per_page=40), max_tokens=300)
+
+    assert "NIT: 900123456-7" in result.text
+    assert "Total a pagar: 214.200,00" in result.text
+    assert "Producto 0-0" in result.text
+    assert "[...]" in result.text
+    assert result.tokens <= 300
+
+def test_chunk_pages_is_page_aligned():
+    """Los fragmentos agrupan páginas completas y la cabecera solo va en el primero"""
+    pages = make_pages(items_per_page=20, pages=4)
+    chunks = chunk_pages(pages, max_tokens=400)
+
+    assert len(chunks) > 1
+    assert "NIT: 900123456-7" in chunks[0]
+    assert all("NIT" not in chunk for chunk in chunks[1:])
+    for page in range(4):
+        holders = [chunk for chunk in chunks if f"Producto {page}-0 " in chunk]
+        assert len(holders) == 1 and f"Producto {page}-19 " in holders[0]
+
+@pytest.mark.asyncio
+async def test_over_budget_document_is_chunked_or_flagged(monkeypatch):
+    """Un texto sobre el presupuesto se reparte en fragmentos; si es una sola página se avisa del recorte"""
+    monkeypatch.setattr(settings, "PROMPT_MAX_INPUT_TOKENS", 300)
+    monkeypatch.setattr(settings, "EXTRACTION_CHUNK_TOKENS", 400)
+    monkeypatch.setattr(settings, "RULES_FAST_PATH", False)
+    monkeypatch.setattr(settings, "PERSIST_INVOICES", False)
+    pages = [page.split("\n") for page in make_pages(items_per_page=40)]
+
+    split = extract_pdf_job(build_pdf(pages))
+    assert len(split["prompt_chunks"]) > 1
+    assert "prompt_truncated_lines" not in split
+
+    single = extract_pdf_job(build_pdf(pages[-1:]))
+    assert "prompt_chunks" not in single
+    assert single["prompt_truncated_lines"] > 0
+
+    class FakeExtractor:
+        async def extract_invoice_data(self, text, priority=None, items=None):
+            return InvoiceResponse(invoice_id="inv-1", number="FE-1001")
+
+    async def fake_extract_document(source):
+        return single
+
+    monkeypatch.setattr(invoice_pipeline, "_extract_document", fake_extract_document)
+    monkeypatch.setattr(invoice_pipeline, "get_ai_extractor", FakeExtractor)
+    before = LLM_PROMPT_TRUNCATED.value()
+    result = await invoice_pipeline.process_document(b"%PDF", "over-budget-key")
+
+    assert any("líneas omitidas" in note for note in result.processing_notes)
+    assert LLM_PROMPT_TRUNCATED.value() == before + 1
+
+def test_compaction_keeps_per_page_value_lines():
+    """Subtotales por página repetidos en el pie son datos: no se deduplican como cabecera"""
+    pages = [
+        page.replace(f"\n{LEGAL}", f"\nSuma y sigue: 60.000,00\nSubtotal página: 60.000,00\n{LEGAL}")
+        for page in make_pages()
+    ]
+    result = compact_pages(pages)
+
+    assert result.text.count("NIT: 900123456-7") == 1
+    assert result.text.count("Suma y sigue: 60.000,00") == 3
+    assert result.text.count("Subtotal página: 60.000,00") == 3
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import event
+
+from app.database.repository import InvoiceRepository
+from app.database.session import engine, init_db
+from app.schemas.invoice import InvoiceResponse, SupplierInfo, InvoiceItem, TaxInfo, InvoiceTotals
+
+def make_invoice(invoice_id, tax_id="900123456-7", items=3):
+    return InvoiceResponse(
+        invoice_id=invoice_id,
+        document_type="FACTURA ELECTRONICA",
+        series="FE",
+        number=invoice_id[-4:],
+        issue_date="2025-07-24",
+        supplier=SupplierInfo(name="Proveedor S.A.S.", tax_id=tax_id),
+        items=[InvoiceItem(description=f"Item {i}", quantity=1, unit_price=100, subtotal=100) for i in range(items)],
+        taxes=TaxInfo(iva_percentage=19.0, iva_amount=57.0),
+        totals=InvoiceTotals(subtotal=300, tax_total=57, total=357)
+    )
+
+@pytest.mark.asyncio
+async def test_save_many_uses_multi_row_inserts():
+    """Facturas e items se guardan con un INSERT multi-fila por tabla"""
+    await init_db()
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        repository = InvoiceRepository()
+        invoices = [make_invoice(f"bulk-{i:04d}", tax_id=f"90000{i % 2}") for i in range(20)]
+        assert await repository.save_many(invoices) == 20
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+    item_inserts = [s for s in statements if s.startswith("INSERT INTO invoice_items")]
+    invoice_inserts = [s for s in statements if s.startswith("INSERT INTO invoices")]
+    assert len(item_inserts) == 1 and len(invoice_inserts) == 1
+
+@pytest.mark.asyncio
+async def test_saved_invoice_round_trips():
+    """Una factura guardada se recupera igual y no se duplica al guardarla otra vez"""
+    await init_db()
+    repository = InvoiceRepository()
+    invoice = make_invoice("roundtrip-0001")
+    await repository.save(invoice)
+
+    assert await repository.save(invoice) == 0
+    stored = await repository.get("roundtrip-0001")
+    assert stored.supplier.tax_id == "900123456-7"
+    assert [item.description for item in stored.items] == ["Item 0", "Item 1", "Item 2"]
+    assert stored.totals.total == 357
+    assert stored.issue_date == "2025-07-24"
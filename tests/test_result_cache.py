@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.schemas.invoice import InvoiceResponse
+from app.services.result_cache import MemoryCacheBackend, ResultCache, result_cache
+from main import app
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_least_recently_used():
+    """El backend en memoria respeta el límite de entradas en orden LRU"""
+    backend = MemoryCacheBackend(max_entries=2)
+    await backend.set("a", "1", ttl=60)
+    await backend.set("b", "2", ttl=60)
+    await backend.get("a")
+    await backend.set("c", "3", ttl=60)
+
+    assert await backend.get("a") == "1"
+    assert await backend.get("b") is None
+    assert await backend.get("c") == "3"
+
+@pytest.mark.asyncio
+async def test_memory_backend_expires_entries():
+    """Las entradas vencidas no se devuelven"""
+    backend = MemoryCacheBackend()
+    await backend.set("a", "1", ttl=-1)
+    assert await backend.get("a") is None
+
+@pytest.mark.asyncio
+async def test_result_cache_roundtrip_drops_request_notes():
+    """La caché guarda el InvoiceResponse sin las notas de la petición"""
+    cache = ResultCache(MemoryCacheBackend())
+    key = cache.make_key(b"%PDF-1.4 contenido")
+    invoice = InvoiceResponse(invoice_id="abc", number="1001", processing_notes=["nota"])
+    await cache.set(key, invoice)
+
+    cached = await cache.get(key)
+    assert cached.number == "1001"
+    assert cached.processing_notes is None
+    assert cache.make_key(b"otro contenido") != key
+
+def test_process_returns_cached_result():
+    """Un PDF ya procesado se responde desde caché con la nota cache_hit"""
+    content = b"%PDF-1.4 factura repetida"
+    key = result_cache.make_key(content)
+    asyncio.run(result_cache.set(key, InvoiceResponse(invoice_id="cached-1", number="1001")))
+
+    response = TestClient(app).post(
+        "/api/v1/invoices/process",
+        files={"file": ("factura.pdf", content, "application/pdf")}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["invoice_id"] == "cached-1"
+    assert "cache_hit" in response.json()["processing_notes"]
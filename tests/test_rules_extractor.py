@@ -0,0 +1,53 @@
+import pytest
+
+from app.services.rules_extractor import parse_amount, parse_date, rules_extractor
+
+DIAN_TEXT = """Comercializadora Andina S.A.S.
+NIT: 900.123.456-7
+FACTURA ELECTRÓNICA DE VENTA No. SETP-990000123
+Fecha de emisión: 24/07/2025
+Fecha de vencimiento: 23 de agosto de 2025
+CUFE: {cufe}
+Licencia de software anual 2 1.500.000,00 3.000.000,00
+Soporte técnico mensual 1 500.000,00 500.000,00
+Subtotal: 3.500.000,00
+IVA 19%: 665.000,00
+ReteFuente 2,5%: 87.500,00
+ReteICA 9,66 x mil: 33.810,00
+Total a pagar: 4.043.690,00
+""".format(cufe="a" * 96)
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.234.567,89", 1234567.89),
+    ("1,234,567.89", 1234567.89),
+    ("$ 119.000", 119000.0),
+    ("19,5", 19.5),
+])
+def test_parse_amount_handles_colombian_and_english_formats(value, expected):
+    assert parse_amount(value) == expected
+
+def test_parse_date_formats():
+    assert parse_date("24/07/2025") == "2025-07-24"
+    assert parse_date("23 de agosto de 2025") == "2025-08-23"
+
+def test_rules_extract_regular_dian_invoice():
+    """Una factura DIAN regular se extrae completa y con confianza máxima"""
+    invoice = rules_extractor.extract(DIAN_TEXT)
+
+    assert invoice.series == "SETP" and invoice.number == "990000123"
+    assert invoice.issue_date == "2025-07-24" and invoice.due_date == "2025-08-23"
+    assert invoice.supplier.tax_id == "900123456-7"
+    assert invoice.supplier.name == "Comercializadora Andina S.A.S."
+    assert invoice.taxes.fuente_percentage == 2.5 and invoice.taxes.ica_amount == 33810.0
+    assert invoice.totals.retention_total == pytest.approx(121310.0)
+    assert [item.subtotal for item in invoice.items] == [3000000.0, 500000.0]
+    assert invoice.confidence_score == 1.0
+    assert invoice.processing_notes == [f"CUFE: {'a' * 96}"]
+
+def test_rules_discard_totals_that_do_not_add_up():
+    """Si los totales no cuadran la confianza baja y la factura pasa al modelo"""
+    invoice = rules_extractor.extract(DIAN_TEXT.replace("4.043.690,00", "9.999.999,00"))
+
+    assert invoice.totals is None
+    assert invoice.items == []
+    assert invoice.confidence_score < 0.9
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.schemas.invoice import InvoiceResponse
+from app.services import invoice_pipeline
+from app.services.single_flight import RedisFlightLock
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_documents_share_one_extraction(monkeypatch):
+    """Las subidas idénticas en curso esperan la misma extracción"""
+    calls = []
+
+    async def fake_run_pipeline(source, cache_key, priority):
+        calls.append(cache_key)
+        await asyncio.sleep(0.05)
+        return InvoiceResponse(invoice_id="inv-1", number="1001", processing_notes=["Texto extraído: 100 caracteres"])
+
+    monkeypatch.setattr(invoice_pipeline, "_run_pipeline", fake_run_pipeline)
+    results = await asyncio.gather(*(
+        invoice_pipeline.process_document(b"%PDF", "coalesce-key") for _ in range(5)
+    ))
+
+    assert calls == ["coalesce-key"]
+    assert {result.number for result in results} == {"1001"}
+    # Cada llamador recibe su propia copia
+    assert len({id(result) for result in results}) == 5
+    assert sum("coalesced" in result.processing_notes for result in results) == 4
+
+class FakeStreamingExtractor:
+    async def extract_invoice_data(self, text, priority=None, items=None):
+        return InvoiceResponse(invoice_id="inv-2", number="1001")
+
+    async def stream_invoice_data(self, text, priority=None, items=None):
+        await asyncio.sleep(0.05)
+        yield "field", "number", "1001"
+        yield "result", None, InvoiceResponse(invoice_id="inv-1", number="1001")
+
+@pytest.mark.asyncio
+async def test_concurrent_streams_share_one_extraction(monkeypatch):
+    """Un stream en curso registra su extracción: el segundo stream y process_document la esperan"""
+    calls = []
+
+    async def fake_extract_document(source):
+        calls.append(source)
+        await asyncio.sleep(0.05)
+        return {"text": "x" * 100, "prompt_text": "x" * 100}
+
+    monkeypatch.setattr(settings, "PERSIST_INVOICES", False)
+    monkeypatch.setattr(invoice_pipeline, "_extract_document", fake_extract_document)
+    monkeypatch.setattr(invoice_pipeline, "get_ai_extractor", FakeStreamingExtractor)
+
+    async def consume():
+        return [event async for event in invoice_pipeline.stream_document(b"%PDF", "stream-key")]
+
+    first, second, document = await asyncio.gather(
+        consume(), consume(), invoice_pipeline.process_document(b"%PDF", "stream-key")
+    )
+
+    assert len(calls) == 1
+    assert first[0] == ("field", "number", "1001")
+    assert first[-1][2].number == second[-1][2].number == document.number == "1001"
+    assert "coalesced" in second[-1][2].processing_notes
+    assert "coalesced" in document.processing_notes
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_does_not_fail_waiting_requests(monkeypatch):
+    """Si el cliente del stream se desconecta, quien esperaba repite la extracción"""
+    calls = []
+
+    async def fake_extract_document(source):
+        calls.append(source)
+        await asyncio.sleep(0.05)
+        return {"text": "x" * 100, "prompt_text": "x" * 100}
+
+    monkeypatch.setattr(settings, "PERSIST_INVOICES", False)
+    monkeypatch.setattr(invoice_pipeline, "_extract_document", fake_extract_document)
+    monkeypatch.setattr(invoice_pipeline, "get_ai_extractor", FakeStreamingExtractor)
+
+    stream = invoice_pipeline.stream_document(b"%PDF", "abandoned-key")
+    waiting = asyncio.ensure_future(invoice_pipeline.process_document(b"%PDF", "abandoned-key"))
+    assert await stream.__anext__() == ("field", "number", "1001")
+    await stream.aclose()
+
+    assert (await waiting).number == "1001"
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_redis_lock_makes_other_workers_wait():
+    """Con el candado de Redis, el segundo worker espera al primero"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    first, second = RedisFlightLock("redis://fake"), RedisFlightLock("redis://fake")
+    first.client = fakeredis.aioredis.FakeRedis(server=server)
+    second.client = fakeredis.aioredis.FakeRedis(server=server)
+    order = []
+
+    async def worker(lock, name):
+        async with lock.hold("key") as waited:
+            order.append((name, waited))
+            await asyncio.sleep(0.1)
+
+    task = asyncio.create_task(worker(first, "a"))
+    await asyncio.sleep(0.02)
+    await worker(second, "b")
+    await task
+
+    assert order == [("a", False), ("b", True)]
@@ -0,0 +1,70 @@
+from conftest import build_pdf
+
+from app.services.extraction_pool import extract_pdf_job
+from app.services.table_extractor import find_item_table
+
+HEADER = ("Descripcion", "Cant.", "Vr. Unitario", "Vr. Total")
+
+def invoice_pages(rows):
+    return [
+        [
+            "FACTURA ELECTRONICA DE VENTA No. FE-1001",
+            "Proveedor de Prueba S.A.S. NIT 900123456-7",
+            "Fecha de emision: 2025-07-24",
+            HEADER,
+        ] + rows[:-1],
+        ["Proveedor de Prueba S.A.S. NIT 900123456-7"] + rows[-1:] + [
+            "Subtotal 280.000 IVA 19% 53.200 Total a pagar 333.200",
+        ],
+    ]
+
+def test_item_table_replaces_rows_in_prompt():
+    """Las filas salen de las columnas del PDF (también en la página siguiente) y el modelo recibe un resumen"""
+    rows = [
+        ("Servicio de consultoria", "2", "100.000", "200.000"),
+        ("Licencia de software", "1", "50.000,00", "50.000,00"),
+        ("anual renovable",),
+        ("Soporte tecnico", "3", "10.000", "30.000"),
+    ]
+    result = extract_pdf_job(build_pdf(invoice_pages(rows)))
+
+    items = result["table_items"]
+    assert [item["description"] for item in items] == [
+        "Servicio de consultoria", "Licencia de software anual renovable", "Soporte tecnico"
+    ]
+    assert items[0]["quantity"] == 2 and items[0]["unit_price"] == 100000 and items[0]["subtotal"] == 200000
+    assert "Soporte tecnico" not in result["prompt_text"]
+    assert "[Tabla de ítems: 3 filas" in result["prompt_text"]
+    assert "Subtotal 280.000" in result["prompt_text"]
+    # El texto completo no cambia y las reglas usan las filas de la tabla
+    assert "Soporte tecnico 3 10.000 30.000" in result["text"]
+    assert len(result["rules_result"]["items"]) == 3
+
+def test_item_table_is_discarded_when_a_row_does_not_add_up():
+    """Una fila que no cuadra indica columnas mal leídas: el texto va completo al modelo"""
+    rows = [
+        ("Servicio de consultoria", "2", "100.000", "200.000"),
+        ("Licencia de software", "1", "50.000", "90.000"),
+        ("Soporte tecnico", "3", "10.000", "30.000"),
+    ]
+    result = extract_pdf_job(build_pdf(invoice_pages(rows)))
+
+    assert "table_items" not in result
+    assert "Soporte tecnico 3 10.000 30.000" in result["prompt_text"]
+
+def test_discount_column_in_value_or_percentage():
+    """El descuento se entrega siempre como porcentaje; las columnas sin reconocer se ignoran"""
+    def line(top, *cells):
+        return (top, top + 8, [(x, x + 8 * len(text) * 0.5, text) for x, text in cells])
+
+    layout = [
+        line(10, (40, "Codigo"), (90, "Descripcion"), (300, "Cant."), (340, "Vr. Unitario"), (420, "Desc."), (470, "Vr. Total")),
+        line(22, (40, "A-1"), (90, "Resma papel carta"), (300, "10"), (340, "20.000"), (420, "20.000"), (470, "180.000")),
+        line(34, (40, "A-2"), (90, "Toner impresora"), (300, "2"), (340, "100.000"), (420, "10"), (470, "180.000")),
+        line(46, (40, "Subtotal: 360.000"),),
+    ]
+    table = find_item_table([layout])
+
+    assert [item["discount_percentage"] for item in table.items] == [10.0, 10.0]
+    assert table.items[0]["description"] == "Resma papel carta"
+    assert table.total == 360000